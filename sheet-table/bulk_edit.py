@@ -0,0 +1,54 @@
+REPLACE_SEPARATOR = '=>'
+
+
+class BulkEdit:
+    """Правило массового изменения значения столбца
+
+    Либо новое значение целиком (replace_from is None), либо замена подстроки
+    replace_from на value во всех вхождениях.
+    """
+
+    def __init__(self, value, replace_from=None):
+        self.value = value
+        self.replace_from = replace_from
+
+    @property
+    def is_replace(self):
+        return self.replace_from is not None
+
+    def apply(self, old_value):
+        """Новое значение ячейки или None, если ячейка не меняется"""
+        if self.is_replace:
+            if self.replace_from not in old_value:
+                return None
+            new_value = old_value.replace(self.replace_from, self.value)
+        else:
+            new_value = self.value
+        return new_value if new_value != old_value else None
+
+    def describe(self):
+        if self.is_replace:
+            return f"замена «{self.replace_from}» на «{self.value}»"
+        return f"новое значение «{self.value}»"
+
+
+def parse_bulk_edit(text):
+    """Разобрать ввод пользователя: `значение` или `найти => заменить`"""
+    if REPLACE_SEPARATOR in text:
+        replace_from, value = text.split(REPLACE_SEPARATOR, 1)
+        replace_from = replace_from.strip()
+        if not replace_from:
+            raise ValueError("Укажите, что заменить: `найти => заменить`")
+        return BulkEdit(value.strip(), replace_from)
+    return BulkEdit(text.strip())
+
+
+def plan_bulk_edit(snapshot, indexes, column_number, edit):
+    """Изменения для строк снимка indexes: список (номер строки, старое, новое)"""
+    changes = []
+    for index in indexes:
+        old_value = snapshot.cell(index, column_number - 1)
+        new_value = edit.apply(old_value)
+        if new_value is not None:
+            changes.append((snapshot.row_number(index), old_value, new_value))
+    return changes
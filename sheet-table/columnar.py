@@ -0,0 +1,287 @@
+import re
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import date
+
+# Доля разобранных значений, при которой столбец считается числовым / датой
+TYPE_THRESHOLD = 0.9
+
+KIND_NUMBER = 'number'
+KIND_DATE = 'date'
+KIND_TEXT = 'text'
+
+_NUMBER_JUNK = str.maketrans('', '', '   ₽$€%')
+_NUMBER_RE = re.compile(r'^[+-]?(\d+([.,]\d*)?|[.,]\d+)([eE][+-]?\d+)?$')
+
+_ISO_DATE_RE = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?$')
+_DMY_DATE_RE = re.compile(r'^(\d{1,2})[./](\d{1,2})[./](\d{4}|\d{2})(?: (\d{1,2}):(\d{2})(?::(\d{2}))?)?$')
+
+
+def parse_number(value):
+    """Разобрать число: пробелы-разделители тысяч, запятая или точка как десятичный знак"""
+    if not value:
+        return None
+    text = str(value).strip().translate(_NUMBER_JUNK)
+
+    if ',' in text and '.' in text:
+        # Десятичный знак - последний из разделителей: "1,234.5" или "1.234,5"
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    elif text.count(',') > 1:
+        text = text.replace(',', '')
+    else:
+        text = text.replace(',', '.')
+
+    if not _NUMBER_RE.match(text):
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_date(value):
+    """Разобрать дату (ГГГГ-ММ-ДД, ДД.ММ.ГГГГ, ДД/ММ/ГГГГ, ДД.ММ.ГГ, с временем) в число дней"""
+    if not value:
+        return None
+    text = str(value).strip()
+
+    match = _ISO_DATE_RE.match(text)
+    if match:
+        year, month, day = match.group(1, 2, 3)
+    else:
+        match = _DMY_DATE_RE.match(text)
+        if not match:
+            return None
+        day, month, year = match.group(1, 2, 3)
+        if len(year) == 2:
+            year = '20' + year
+
+    hour, minute, second = (int(part or 0) for part in match.group(4, 5, 6))
+    try:
+        ordinal = date(int(year), int(month), int(day)).toordinal()
+    except ValueError:
+        return None
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+    return ordinal + (hour * 3600 + minute * 60 + second) / 86400
+
+
+_PARSERS = {KIND_NUMBER: parse_number, KIND_DATE: parse_date}
+
+
+def parse_as(kind, value):
+    """Разобрать значение как тип столбца (None, если не получилось)"""
+    parser = _PARSERS.get(kind)
+    return parser(value) if parser else None
+
+
+class TypedColumn:
+    """Типизированный столбец: разобранные значения и отсортированный индекс
+
+    values[i] - разобранное значение i-й записи (None, если пусто или не разобралось).
+    sorted_keys / sorted_rows - пары (значение, запись), упорядоченные по значению,
+    по ним диапазонные условия решаются бинарным поиском.
+    """
+
+    __slots__ = ('kind', 'values', 'sorted_keys', 'sorted_rows', 'counts')
+
+    def __init__(self, kind, values):
+        self.kind = kind
+        self.values = values
+        self.counts = None  # См. _type_counts; считаются при первом обновлении
+        if kind == KIND_TEXT:
+            self.sorted_keys = []
+            self.sorted_rows = []
+            return
+        pairs = sorted((value, row) for row, value in enumerate(values) if value is not None)
+        self.sorted_keys = [value for value, _ in pairs]
+        self.sorted_rows = [row for _, row in pairs]
+
+    @property
+    def is_typed(self):
+        return self.kind != KIND_TEXT
+
+    def _bounds(self, low, high, include_low, include_high):
+        keys = self.sorted_keys
+        if low is None:
+            start = 0
+        else:
+            start = bisect_left(keys, low) if include_low else bisect_right(keys, low)
+        if high is None:
+            end = len(keys)
+        else:
+            end = bisect_right(keys, high) if include_high else bisect_left(keys, high)
+        return start, max(start, end)
+
+    def count_range(self, low=None, high=None, include_low=True, include_high=True):
+        """Количество записей в диапазоне - за O(log n)"""
+        start, end = self._bounds(low, high, include_low, include_high)
+        return end - start
+
+    def rows_in_range(self, low=None, high=None, include_low=True, include_high=True):
+        """Записи, значения которых попадают в диапазон"""
+        start, end = self._bounds(low, high, include_low, include_high)
+        return self.sorted_rows[start:end]
+
+    def updated(self, counts, changed, length):
+        """Столбец с новыми значениями {запись: (старое значение, новое значение)} и длиной length
+
+        counts - счетчики _type_counts для прежних значений. Разбираются только
+        новые значения, отсортированный индекс правится удалением и вставкой.
+        None, если по новым счетчикам тип столбца изменился - тогда столбец
+        нужно построить заново.
+        """
+        counts = list(counts)
+        for old, new in changed.values():
+            _count_value(counts, old, -1)
+            _count_value(counts, new, 1)
+        if _kind_for_counts(counts) != self.kind:
+            return None
+
+        column = TypedColumn.__new__(TypedColumn)
+        column.kind = self.kind
+        column.counts = counts
+        column.values = self.values + [None] * (length - len(self.values))
+        column.sorted_keys = self.sorted_keys
+        column.sorted_rows = self.sorted_rows
+        if not self.is_typed:
+            return column
+
+        keys, rows = list(self.sorted_keys), list(self.sorted_rows)
+        for row, (_, new) in sorted(changed.items()):
+            old_value = column.values[row]
+            if old_value is not None:
+                start, end = bisect_left(keys, old_value), bisect_right(keys, old_value)
+                position = bisect_left(rows, row, start, end)
+                del keys[position], rows[position]
+            new_value = parse_as(self.kind, new)
+            column.values[row] = new_value
+            if new_value is not None:
+                start, end = bisect_left(keys, new_value), bisect_right(keys, new_value)
+                position = bisect_left(rows, row, start, end)
+                keys.insert(position, new_value)
+                rows.insert(position, row)
+        column.sorted_keys, column.sorted_rows = keys, rows
+        return column
+
+
+def _count_value(counts, value, delta):
+    if value and str(value).strip():
+        counts[0] += delta
+        for i, kind in enumerate((KIND_NUMBER, KIND_DATE), start=1):
+            if parse_as(kind, value) is None:
+                counts[i] += delta
+
+
+def _type_counts(column):
+    """[непустых значений, не разобранных как число, не разобранных как дата] в EncodedColumn
+
+    По этим счетчикам тип столбца определяется так же, как в infer_kind,
+    поэтому при записи тип можно перепроверить без разбора всего столбца.
+    """
+    counts = [0, 0, 0]
+    frequencies = Counter(column.codes)
+    for code, value in enumerate(column.distinct()):
+        if frequencies[code]:
+            _count_value(counts, value, frequencies[code])
+    return counts
+
+
+def _kind_for_counts(counts):
+    non_empty, number_failures, date_failures = counts
+    if not non_empty:
+        return KIND_TEXT
+    allowed_failures = non_empty * (1 - TYPE_THRESHOLD)
+    if number_failures <= allowed_failures:
+        return KIND_NUMBER
+    if date_failures <= allowed_failures:
+        return KIND_DATE
+    return KIND_TEXT
+
+
+def infer_kind(raw_values):
+    """Определить тип столбца по доле значений, разбираемых как число или дата"""
+    non_empty = [value for value in raw_values if value and str(value).strip()]
+    if not non_empty:
+        return KIND_TEXT, [None] * len(raw_values)
+
+    allowed_failures = len(non_empty) * (1 - TYPE_THRESHOLD)
+    for kind in (KIND_NUMBER, KIND_DATE):
+        parser = _PARSERS[kind]
+        parsed = []
+        failures = 0
+        cache = {}  # Повторяющиеся значения разбираются один раз
+        for value in raw_values:
+            if value in cache:
+                number = cache[value]
+            else:
+                number = cache[value] = parser(value)
+            if number is None and value and str(value).strip():
+                failures += 1
+                if failures > allowed_failures:
+                    break
+            parsed.append(number)
+        else:
+            return kind, parsed
+
+    return KIND_TEXT, [None] * len(raw_values)
+
+
+class ColumnarStore:
+    """Типизированное поколоночное представление снимка
+
+    Каждое значение разбирается один раз при построении (на версию снимка).
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.columns = [self._build(snapshot, col) for col in range(snapshot.width)]
+
+    @staticmethod
+    def _build(snapshot, col):
+        kind, parsed = infer_kind(snapshot.rows.column(col).values())
+        return TypedColumn(kind, parsed)
+
+    @classmethod
+    def for_snapshot(cls, snapshot):
+        """Хранилище для снимка (кэшируется в самом снимке)"""
+        return snapshot.derived('columnar', cls)
+
+    def updated(self, snapshot, changes):
+        """Хранилище для новой версии снимка с замененными строками {индекс: значения}
+
+        Столбцы, которых запись не коснулась, разделяются с прежней версией; в
+        остальных разбираются только записанные значения. Столбец строится
+        заново, только если от записи изменился его тип.
+        """
+        store = ColumnarStore.__new__(ColumnarStore)
+        store.snapshot = snapshot
+        store.columns = []
+        old_rows, old_length = self.snapshot.rows, len(self.snapshot)
+        for col in range(snapshot.width):
+            column = snapshot.rows.column(col)
+            if col >= len(self.columns):
+                store.columns.append(self._build(snapshot, col))
+                continue
+            typed = self.columns[col]
+            if column is old_rows.column(col):
+                store.columns.append(typed)
+                continue
+
+            changed = {}
+            for row in changes:
+                old = old_rows.cell(row, col) if row < old_length else ''
+                if column[row] != old:
+                    changed[row] = (old, column[row])
+            counts = typed.counts if typed.counts is not None else _type_counts(old_rows.column(col))
+            patched = typed.updated(counts, changed, len(snapshot))
+            store.columns.append(patched if patched is not None else self._build(snapshot, col))
+        return store
+
+    def column(self, col):
+        if 0 <= col < len(self.columns):
+            return self.columns[col]
+        return TypedColumn(KIND_TEXT, [])
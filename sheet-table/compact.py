@@ -0,0 +1,360 @@
+import itertools
+import sys
+from array import array
+from collections.abc import Sequence
+
+
+def _index_array(max_value):
+    """Массив беззнаковых целых наименьшей ширины, вмещающий max_value"""
+    for typecode in ('B', 'H', 'I', 'L', 'Q'):
+        if max_value < 1 << (8 * array(typecode).itemsize):
+            return array(typecode)
+    raise OverflowError(max_value)
+
+
+class StringHeap:
+    """Набор строк, склеенных в одну, с массивом смещений
+
+    Вместо отдельного объекта str на каждое значение (~50 байт накладных
+    расходов) хранится одна длинная строка; значение вырезается срезом при
+    обращении. Набор только дополняется: новые строки копятся в хвосте
+    (append) и вклеиваются в общую строку при уплотнении (compacted), так что
+    коды уже добавленных строк не меняются.
+    """
+
+    __slots__ = ('_text', '_offsets', '_tail', '_codes')
+
+    # Хвост уплотняется, когда в нем больше строк, чем доля от склеенных
+    COMPACT_RATIO = 8
+    MIN_TAIL = 256
+
+    def __init__(self, strings):
+        self._text = ''.join(strings)
+        self._offsets = _index_array(len(self._text))
+        position = 0
+        self._offsets.append(0)
+        for value in strings:
+            position += len(value)
+            self._offsets.append(position)
+        self._tail = []
+        self._codes = None  # Строка -> номер; строится при первом поиске
+
+    def __len__(self):
+        return len(self._offsets) - 1 + len(self._tail)
+
+    def __getitem__(self, i):
+        base = len(self._offsets) - 1
+        if i >= base:
+            return self._tail[i - base]
+        return self._text[self._offsets[i]:self._offsets[i + 1]]
+
+    def __iter__(self):
+        text, offsets = self._text, self._offsets
+        for i in range(len(offsets) - 1):
+            yield text[offsets[i]:offsets[i + 1]]
+        yield from self._tail
+
+    def code_of(self, value):
+        """Номер строки value или None"""
+        if self._codes is None:
+            self._codes = {}
+            for code, string in enumerate(self):
+                self._codes.setdefault(string, code)
+        return self._codes.get(value)
+
+    def append(self, value):
+        """Добавить строку в конец, вернуть ее номер"""
+        code = len(self)
+        self._tail.append(value)
+        if self._codes is not None:
+            self._codes[value] = code
+        return code
+
+    def needs_compaction(self):
+        return len(self._tail) > max(self.MIN_TAIL, (len(self._offsets) - 1) // self.COMPACT_RATIO)
+
+    def compacted(self):
+        """Тот же набор с хвостом, вклеенным в общую строку (номера строк сохраняются)"""
+        heap = StringHeap(list(self))
+        if self._codes is not None:
+            heap._codes = dict(self._codes)
+        return heap
+
+    def nbytes(self):
+        tail = sum(sys.getsizeof(value) for value in self._tail) + sys.getsizeof(self._tail)
+        return sys.getsizeof(self._text) + self._offsets.itemsize * len(self._offsets) + tail
+
+
+class EncodedColumn:
+    """Столбец со словарным кодированием: код каждой строки + различные значения
+
+    Повторяющиеся значения (статусы, города, даты) хранятся один раз, на строку
+    приходится 1-4 байта кода. Код 0 всегда означает пустую строку.
+
+    Словарь может быть общим для нескольких версий столбца: новая версия
+    дописывает значения в его конец, а каждая версия видит только первые
+    dictionary_size значений.
+    """
+
+    __slots__ = ('codes', 'dictionary', 'dictionary_size')
+
+    def __init__(self, values):
+        codes_of = {'': 0}
+        distinct = ['']
+        codes = []
+        for value in values:
+            code = codes_of.get(value)
+            if code is None:
+                code = codes_of[value] = len(distinct)
+                distinct.append(value)
+            codes.append(code)
+
+        self.codes = _index_array(len(distinct))
+        self.codes.extend(codes)
+        self.dictionary = StringHeap(distinct)
+        self.dictionary_size = len(distinct)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.dictionary[self.codes[index]]
+
+    def distinct(self):
+        """Различные значения столбца; индекс в списке - код значения"""
+        return list(itertools.islice(self.dictionary, self.dictionary_size))
+
+    def values(self):
+        """Все значения столбца по порядку (одинаковые значения - один объект str)"""
+        distinct = self.distinct()
+        return [distinct[code] for code in self.codes]
+
+    def _interned(self, values):
+        """Словарь, дополненный новыми значениями из values, его размер и коды values в нем
+
+        Новые значения дописываются в общий словарь за O(1) на значение, если
+        этот столбец - последняя версия (словарь не дополняла другая версия);
+        иначе сначала снимается копия видимой части. Старые значения остаются
+        в словаре, даже если на них больше нет ссылок.
+        """
+        dictionary, size = self.dictionary, self.dictionary_size
+        new_codes = []
+        for value in values:
+            code = dictionary.code_of(value) if value else 0
+            if code is None or code >= size:
+                if len(dictionary) != size:
+                    # Словарь уже дополнила другая версия столбца - дальше своя копия
+                    dictionary = StringHeap(list(itertools.islice(dictionary, size)))
+                code = dictionary.append(value)
+                size += 1
+            new_codes.append(code)
+        if dictionary.needs_compaction():
+            dictionary = dictionary.compacted()
+        return dictionary, size, new_codes
+
+    def _widened(self, size):
+        """Коды столбца в массиве, вмещающем size кодов словаря (без копии, если ширина та же)"""
+        codes = self.codes
+        if size > self.dictionary_size:
+            # Новые значения могли не поместиться в прежнюю ширину кода
+            wider = _index_array(size)
+            if wider.typecode != codes.typecode:
+                wider.extend(codes.tolist())
+                codes = wider
+        return codes
+
+    def spliced(self, index, delete_count, values):
+        """Новый столбец: delete_count значений с позиции index заменены на values
+
+        Коды остальных записей копируются массивом, словарь дополняется только
+        новыми значениями.
+        """
+        column = EncodedColumn.__new__(EncodedColumn)
+        column.dictionary, column.dictionary_size, new_codes = self._interned(values)
+        codes = self._widened(column.dictionary_size)
+        column.codes = codes[:index]
+        column.codes.extend(new_codes)
+        column.codes.extend(codes[index + delete_count:])
+        return column
+
+    def patched(self, changes, length):
+        """Новый столбец длины length с замененными значениями {индекс: значение}
+
+        Коды копируются массивом и исправляются только в измененных позициях,
+        словарь дополняется только новыми значениями; записи за прежним
+        концом столбца без значения в changes получают код пустой строки.
+        """
+        indexes = list(changes)
+        column = EncodedColumn.__new__(EncodedColumn)
+        column.dictionary, column.dictionary_size, new_codes = self._interned(
+            [changes[index] for index in indexes]
+        )
+        codes = self._widened(column.dictionary_size)
+        codes = codes[:] if codes is self.codes else codes
+        if length > len(codes):
+            codes.frombytes(bytes(codes.itemsize * (length - len(codes))))
+        for index, code in zip(indexes, new_codes):
+            codes[index] = code
+        column.codes = codes
+        return column
+
+    def rows_by_code(self):
+        """Номера записей для каждого кода: список списков, индекс - код"""
+        buckets = [[] for _ in range(self.dictionary_size)]
+        for index, code in enumerate(self.codes):
+            buckets[code].append(index)
+        return buckets
+
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes) + self.dictionary.nbytes()
+
+
+class RowView(Sequence):
+    """Строка компактной таблицы, ведущая себя как список значений (только чтение)"""
+
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __len__(self):
+        return self._table.width
+
+    def __getitem__(self, col):
+        if isinstance(col, slice):
+            return [self._table.columns[c][self._index] for c in range(*col.indices(self._table.width))]
+        if col < 0:
+            col += self._table.width
+        if not 0 <= col < self._table.width:
+            raise IndexError(col)
+        return self._table.columns[col][self._index]
+
+    def __iter__(self):
+        index = self._index
+        for column in self._table.columns:
+            yield column[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (RowView, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class CompactTable(Sequence):
+    """Строки листа в компактном поколоночном виде
+
+    Снаружи - последовательность строк (RowView), внутри - по EncodedColumn
+    на столбец. Таблица не изменяется после создания, как и снимок.
+    """
+
+    __slots__ = ('columns', 'width', '_length')
+
+    def __init__(self, rows, width=0):
+        self._length = len(rows)
+        self.width = max([width] + [len(row) for row in rows])
+        self.columns = [
+            EncodedColumn([row[col] if col < len(row) else '' for row in rows])
+            for col in range(self.width)
+        ]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [RowView(self, i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return RowView(self, index)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield RowView(self, index)
+
+    def with_rows(self, changes):
+        """Новая таблица с замененными строками {индекс: значения} (копирование при записи)
+
+        Столбцы, которых изменения не коснулись, разделяются с исходной
+        таблицей (при добавлении строк - словарь, коды дополняются пустыми);
+        в остальных копируется массив кодов и исправляются измененные позиции.
+        Индекс за концом таблицы добавляет строки (промежуток - пустые).
+        """
+        table = CompactTable.__new__(CompactTable)
+        table._length = max([self._length] + [index + 1 for index in changes])
+        table.width = max([self.width] + [len(values) for values in changes.values()])
+        table.columns = []
+
+        for col in range(table.width):
+            column = self.columns[col] if col < self.width else EncodedColumn([''] * self._length)
+            touched = {}
+            for index, values in changes.items():
+                value = values[col] if col < len(values) else ''
+                if value != (column[index] if index < self._length else ''):
+                    touched[index] = value
+
+            if not touched and table._length == self._length:
+                table.columns.append(column)
+            else:
+                table.columns.append(column.patched(touched, table._length))
+
+        return table
+
+    def spliced(self, index, delete_count, rows):
+        """Новая таблица: delete_count строк с индекса index заменены строками rows
+
+        Вставка (delete_count=0) и удаление (rows пуст) строк; каждый столбец
+        копируется массивом кодов, без повторного кодирования значений.
+        """
+        table = CompactTable.__new__(CompactTable)
+        table._length = self._length - delete_count + len(rows)
+        table.width = max([self.width] + [len(row) for row in rows])
+        table.columns = []
+        for col in range(table.width):
+            column = self.columns[col] if col < self.width else EncodedColumn([''] * self._length)
+            values = [row[col] if col < len(row) else '' for row in rows]
+            table.columns.append(column.spliced(index, delete_count, values))
+        return table
+
+    def cell(self, index, col):
+        """Значение ячейки (col - с нуля), пустая строка за пределами таблицы"""
+        return self.columns[col][index] if col < self.width else ''
+
+    def column(self, col):
+        return self.columns[col]
+
+    def nbytes(self):
+        return sum(column.nbytes() for column in self.columns)
+
+
+def list_rows_nbytes(rows, sample_size=1000):
+    """Оценка памяти под строки в виде списков str (как их возвращает get_all_values)
+
+    Считается по равномерной выборке строк, чтобы не обходить весь лист.
+    """
+    if not rows:
+        return 0
+    step = max(1, len(rows) // sample_size)
+    sample = rows[::step]
+    sample_bytes = sys.getsizeof(rows) / len(rows) * len(sample)
+    for row in sample:
+        sample_bytes += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return int(sample_bytes * len(rows) / len(sample))
+
+
+def memory_report(rows, table):
+    """Байт на строку до (списки str) и после (CompactTable) упаковки"""
+    count = max(1, len(rows))
+    before = list_rows_nbytes(rows)
+    after = table.nbytes()
+    return {
+        'rows': len(rows),
+        'before_bytes_per_row': before / count,
+        'after_bytes_per_row': after / count,
+        'ratio': before / after if after else 0.0,
+    }
@@ -18,6 +18,50 @@ class Config:
         if user_id.strip().isdigit()
     ]
     
+    # Кэш снимка листа (секунды)
+    CACHE_TTL = float(os.getenv('CACHE_TTL', '60'))
+    
+    # Сколько хранить версию снимка для брошенной сессии листания (секунды)
+    PAGINATION_PIN_TTL = float(os.getenv('PAGINATION_PIN_TTL', '1800'))
+    
+    # Как часто перепроверять заголовки листа между загрузками снимка (секунды)
+    SCHEMA_CHECK_INTERVAL = float(os.getenv('SCHEMA_CHECK_INTERVAL', '30'))
+    
+    # Inline-режим
+    INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '30'))  # cache_time для Telegram, секунды
+    INLINE_DEBOUNCE = float(os.getenv('INLINE_DEBOUNCE', '0.3'))  # пауза в наборе перед ответом, секунды
+    
+    # Предзагрузка: запросов к API в минуту на пользователя и сколько строк страницы загружать заранее
+    PREFETCH_REQUESTS_PER_MINUTE = int(os.getenv('PREFETCH_REQUESTS_PER_MINUTE', '6'))
+    PREFETCH_ROWS = int(os.getenv('PREFETCH_ROWS', '3'))
+    
+    # Экспорт: сколько строк читать из таблицы за один запрос
+    EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '2000'))
+    
+    # Импорт: сколько строк отправлять в таблицу одним запросом
+    IMPORT_CHUNK_ROWS = int(os.getenv('IMPORT_CHUNK_ROWS', '500'))
+    
+    # Квота Google Sheets API на запись (запросов в минуту)
+    SHEETS_WRITES_PER_MINUTE = int(os.getenv('SHEETS_WRITES_PER_MINUTE', '60'))
+    
+    # Столбцы, по которым новая строка считается дубликатом (через запятую; пусто - все столбцы)
+    DUPLICATE_KEY_COLUMNS = [
+        name.strip()
+        for name in os.getenv('DUPLICATE_KEY_COLUMNS', '').split(',')
+        if name.strip()
+    ]
+    
+    # Сколько существующих значений предлагать кнопками при заполнении новой строки
+    AUTOCOMPLETE_SUGGESTIONS = int(os.getenv('AUTOCOMPLETE_SUGGESTIONS', '5'))
+    
+    # История отмены (/undo): операций на пользователя и всего
+    UNDO_HISTORY_PER_USER = int(os.getenv('UNDO_HISTORY_PER_USER', '20'))
+    UNDO_HISTORY_SIZE = int(os.getenv('UNDO_HISTORY_SIZE', '500'))
+    
+    # Журнал записей на время недоступности таблицы
+    JOURNAL_PATH = os.getenv('JOURNAL_PATH', 'write_journal.db')
+    JOURNAL_REPLAY_INTERVAL = float(os.getenv('JOURNAL_REPLAY_INTERVAL', '15'))  # секунды между попытками отправки
+    
     # Logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
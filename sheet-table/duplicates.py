@@ -0,0 +1,85 @@
+from normalize import NormalizedShadow, normalize_text
+
+
+class DuplicateIndex:
+    """Хэш-индекс содержимого строк для поиска дубликатов
+
+    Ключ записи - нормализованные значения ключевых столбцов (по умолчанию
+    всех столбцов); индекс хранит hash(ключ) -> индексы записей, поэтому
+    проверка новой строки - одно обращение к словарю, без просмотра листа.
+    Совпадение хэшей перепроверяется сравнением самих значений. Записи с
+    пустым ключом не индексируются.
+    """
+
+    def __init__(self, snapshot, key_columns=None):
+        self.snapshot = snapshot
+        self.key_columns = key_columns  # Номера ключевых столбцов (с нуля) или None - все
+        self.buckets = {}
+
+        # Нормализованные формы различных значений уже посчитаны в тени снимка
+        shadow = NormalizedShadow.for_snapshot(snapshot)
+        for index in range(len(snapshot)):
+            key = self._key_of(shadow.row(index))
+            if key:
+                bucket = self.buckets.get(hash(key))
+                if bucket is None:
+                    self.buckets[hash(key)] = [index]
+                else:
+                    bucket.append(index)
+
+    @classmethod
+    def for_snapshot(cls, snapshot, key_columns=None):
+        """Индекс для снимка (кэшируется в самом снимке)"""
+        return snapshot.derived('duplicates', lambda snapshot: cls(snapshot, key_columns))
+
+    def _key_of(self, normalized):
+        """Ключ по нормализованным значениям строки; пустой кортеж - строка без ключа"""
+        if self.key_columns is None:
+            key = list(normalized)
+        else:
+            key = [normalized[col] if col < len(normalized) else '' for col in self.key_columns]
+        # Строки разной длины с одинаковыми значениями совпадают
+        while key and not key[-1]:
+            key.pop()
+        return tuple(key)
+
+    def key(self, values):
+        """Ключ строки values (значения как в таблице)"""
+        return self._key_of([normalize_text(value) for value in values])
+
+    def find(self, values):
+        """Индексы записей снимка с тем же ключом, что у строки values"""
+        key = self.key(values)
+        if not key:
+            return []
+        return [
+            index for index in self.buckets.get(hash(key), ())
+            if self.key(self.snapshot.rows[index]) == key
+        ]
+
+    def updated(self, snapshot, changes):
+        """Индекс для новой версии снимка с замененными строками {индекс: значения}
+
+        Словарь копируется, пересчитываются только ключи измененных строк;
+        списки индексов не изменяются на месте, так что старая версия снимка
+        сохраняет свой индекс.
+        """
+        index_copy = DuplicateIndex.__new__(DuplicateIndex)
+        index_copy.snapshot = snapshot
+        index_copy.key_columns = self.key_columns
+        index_copy.buckets = dict(self.buckets)
+        buckets = index_copy.buckets
+
+        for index, values in changes.items():
+            if index < len(self.snapshot):
+                old_key = self.key(self.snapshot.rows[index])
+                if old_key:
+                    kept = [i for i in buckets.get(hash(old_key), ()) if i != index]
+                    if kept:
+                        buckets[hash(old_key)] = kept
+                    else:
+                        buckets.pop(hash(old_key), None)
+            new_key = self.key(values)
+            if new_key:
+                buckets[hash(new_key)] = buckets.get(hash(new_key), []) + [index]
+        return index_copy
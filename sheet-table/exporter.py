@@ -0,0 +1,56 @@
+import csv
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # XLSX - необязательная возможность
+    Workbook = None
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+
+class ExportError(Exception):
+    """Ошибка подготовки файла экспорта"""
+
+
+class CsvExportWriter:
+    """Потоковая запись CSV: строки сразу уходят в файл, в памяти только текущая порция"""
+
+    def __init__(self, path, header):
+        # utf-8-sig - чтобы Excel правильно открывал кириллицу
+        self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(header)
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class XlsxExportWriter:
+    """Потоковая запись XLSX через write-only режим openpyxl"""
+
+    def __init__(self, path, header):
+        if Workbook is None:
+            raise ExportError("Для экспорта в XLSX установите пакет openpyxl")
+        self._path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet()
+        self._sheet.append(header)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self._sheet.append(row)
+
+    def close(self):
+        self._workbook.save(self._path)
+
+
+def create_export_writer(export_format, path, header):
+    """Создать писатель файла экспорта нужного формата"""
+    if export_format == 'csv':
+        return CsvExportWriter(path, header)
+    if export_format == 'xlsx':
+        return XlsxExportWriter(path, header)
+    raise ExportError(f"Неизвестный формат экспорта: {export_format}")
@@ -0,0 +1,725 @@
+"""Локальный разбор и вычисление формул Google Sheets по снимку листа
+
+Поддерживаются числа, строки в кавычках, TRUE/FALSE, ссылки A1 и диапазоны
+(A1:B10, A:A, A2:A), арифметика (+ - * / ^ %), конкатенация &, сравнения
+(= <> < > <= >=) и распространенные функции (SUM, AVERAGE, IF, VLOOKUP,
+COUNTIF и др.). Аргументы разделяются запятой или точкой с запятой.
+
+Значения ячеек берутся из снимка в том виде, в каком их показывает таблица,
+поэтому результат - предпросмотр: он совпадает с Google Sheets для обычных
+данных, но не учитывает форматы ячеек и ссылки на другие листы.
+"""
+
+import decimal
+import math
+import re
+
+from columnar import parse_number
+
+
+class FormulaError(ValueError):
+    """Синтаксическая ошибка в формуле (формула заведомо неверна)"""
+
+
+class UnsupportedFormula(Exception):
+    """Формула может быть верной, но локально ее вычислить нельзя"""
+
+
+class SheetError(Exception):
+    """Ошибка вычисления в терминах таблицы: #DIV/0!, #N/A, #VALUE!, ..."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<string>"(?:[^"]|"")*")
+  | (?P<sheetref>(?:'(?:[^']|'')+'|[A-Za-z_][\w.]*)![$A-Za-z0-9:]+)
+  | (?P<range>\$?[A-Za-z]{1,3}\$?\d+:\$?[A-Za-z]{1,3}\$?\d*|\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3}\$?\d*)
+  | (?P<cell>\$?[A-Za-z]{1,3}\$?\d+)(?![\w(])
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_][\w.]*)
+  | (?P<op><>|<=|>=|[-+*/^&=<>%(),;])
+""", re.VERBOSE)
+
+_CELL_RE = re.compile(r'\$?([A-Za-z]{1,3})\$?(\d*)')
+
+_COMPARE_OPS = ('=', '<>', '<', '>', '<=', '>=')
+
+
+def column_number(letters):
+    """Номер столбца (с 1) по буквам: A -> 1, Z -> 26, AA -> 27"""
+    number = 0
+    for char in letters.upper():
+        number = number * 26 + (ord(char) - ord('A') + 1)
+    return number
+
+
+def column_letters(number):
+    """Буквы столбца по номеру (с 1): 1 -> A, 26 -> Z, 27 -> AA, 703 -> AAA"""
+    letters = ''
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def cell_name(row, col):
+    """Адрес ячейки в нотации A1"""
+    return f"{column_letters(col)}{row}"
+
+
+def _parse_ref(text):
+    """(строка или None, столбец) из ссылки вида A1, $B$2 или A"""
+    letters, digits = _CELL_RE.fullmatch(text).groups()
+    return (int(digits) if digits else None), column_number(letters)
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN_RE.match(text, position)
+        if not match:
+            raise FormulaError(f"Неожиданный символ «{text[position]}» в позиции {position + 1}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind != 'space':
+            tokens.append((kind, value, position))
+        position = match.end()
+    return tokens
+
+
+# === РАЗБОР ===
+# Узлы дерева - кортежи: ('num', x), ('str', s), ('bool', b), ('ref', row, col),
+# ('range', row1, col1, row2, col2), ('call', NAME, [args]), ('neg', x), ('pct', x),
+# ('op', оператор, a, b), ('unsupported', причина)
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None, None)
+
+    def take(self):
+        token = self.peek()
+        if token[0] is None:
+            raise FormulaError("Неожиданный конец формулы")
+        self.position += 1
+        return token
+
+    def expect(self, value):
+        kind, token_value, position = self.peek()
+        if token_value != value:
+            if kind is None:
+                raise FormulaError(f"Не хватает «{value}» в конце формулы")
+            raise FormulaError(f"Ожидалось «{value}» в позиции {position + 1}, а не «{token_value}»")
+        self.position += 1
+
+    def parse(self):
+        node = self.comparison()
+        kind, value, position = self.peek()
+        if kind is not None:
+            raise FormulaError(f"Лишний символ «{value}» в позиции {position + 1}")
+        return node
+
+    def _binary(self, operators, operand):
+        node = operand()
+        while self.peek()[0] == 'op' and self.peek()[1] in operators:
+            operator = self.take()[1]
+            node = ('op', operator, node, operand())
+        return node
+
+    def comparison(self):
+        return self._binary(_COMPARE_OPS, self.concat)
+
+    def concat(self):
+        return self._binary(('&',), self.additive)
+
+    def additive(self):
+        return self._binary(('+', '-'), self.term)
+
+    def term(self):
+        return self._binary(('*', '/'), self.power)
+
+    def power(self):
+        return self._binary(('^',), self.unary)
+
+    def unary(self):
+        kind, value, _ = self.peek()
+        if kind == 'op' and value in ('-', '+'):
+            self.take()
+            operand = self.unary()
+            return ('neg', operand) if value == '-' else operand
+        node = self.primary()
+        while self.peek()[1] == '%':
+            self.take()
+            node = ('pct', node)
+        return node
+
+    def primary(self):
+        kind, value, position = self.take()
+
+        if kind == 'number':
+            return ('num', float(value))
+        if kind == 'string':
+            return ('str', value[1:-1].replace('""', '"'))
+        if kind == 'cell':
+            return ('ref',) + _parse_ref(value)
+        if kind == 'range':
+            start, end = value.split(':')
+            row1, col1 = _parse_ref(start)
+            row2, col2 = _parse_ref(end)
+            if row1 is None and row2 is not None:
+                raise FormulaError(f"Неверный диапазон «{value}»")
+            return ('range', 1 if row1 is None else row1, min(col1, col2), row2, max(col1, col2))
+        if kind == 'sheetref':
+            return ('unsupported', f"ссылка на другой лист «{value}»")
+        if kind == 'name':
+            if self.peek()[1] == '(':
+                return self.call(value.upper(), position)
+            if value.upper() in ('TRUE', 'FALSE'):
+                return ('bool', value.upper() == 'TRUE')
+            return ('unsupported', f"именованный диапазон «{value}»")
+        if value == '(':
+            node = self.comparison()
+            self.expect(')')
+            return node
+        raise FormulaError(f"Неожиданный символ «{value}» в позиции {position + 1}")
+
+    def call(self, name, position):
+        self.expect('(')
+        args = []
+        if self.peek()[1] != ')':
+            args.append(self.comparison())
+            while self.peek()[1] in (',', ';'):
+                self.take()
+                args.append(self.comparison())
+        self.expect(')')
+
+        spec = _FUNCTIONS.get(name)
+        if spec is not None:
+            min_args, max_args = spec[0], spec[1]
+            if len(args) < min_args or (max_args is not None and len(args) > max_args):
+                if max_args is None:
+                    expected = f"не менее {min_args}"
+                elif min_args == max_args:
+                    expected = str(min_args)
+                else:
+                    expected = f"от {min_args} до {max_args}"
+                raise FormulaError(f"Функция {name} принимает {expected} аргументов, передано {len(args)}")
+        return ('call', name, args)
+
+
+def parse_formula(text):
+    """Разобрать формулу (знак = в начале необязателен); FormulaError при ошибке синтаксиса"""
+    text = text.strip()
+    if text.startswith('='):
+        text = text[1:]
+    if not text.strip():
+        raise FormulaError("Формула не может быть пустой")
+    return _Parser(_tokenize(text)).parse()
+
+
+# === ЗНАЧЕНИЯ ===
+# Значение - float, str, bool, None (пустая ячейка) или _Range (прямоугольник значений)
+
+class _Range:
+    __slots__ = ('rows',)
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def values(self):
+        for row in self.rows:
+            yield from row
+
+
+def _cell_value(text):
+    """Значение ячейки снимка (строка, как ее показывает таблица) в тип формул"""
+    if text == '':
+        return None
+    upper = text.upper()
+    if upper in ('TRUE', 'FALSE', 'ИСТИНА', 'ЛОЖЬ'):
+        return upper in ('TRUE', 'ИСТИНА')
+    number = parse_number(text)
+    if number is not None:
+        return number / 100 if text.rstrip().endswith('%') else number
+    return text
+
+
+def _scalar(value):
+    if isinstance(value, _Range):
+        if len(value.rows) == 1 and len(value.rows[0]) == 1:
+            return value.rows[0][0]
+        raise SheetError('#VALUE!')
+    return value
+
+
+def _to_number(value):
+    value = _scalar(value)
+    if value is None:
+        return 0.0
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, float):
+        return value
+    number = parse_number(value)
+    if number is None:
+        raise SheetError('#VALUE!')
+    return number
+
+
+def _to_bool(value):
+    value = _scalar(value)
+    if value is None:
+        return False
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        return value != 0
+    if value.upper() in ('TRUE', 'FALSE'):
+        return value.upper() == 'TRUE'
+    raise SheetError('#VALUE!')
+
+
+def format_value(value):
+    """Значение так, как его покажет таблица"""
+    if isinstance(value, _Range):
+        value = value.rows[0][0] if value.rows and value.rows[0] else None
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float):
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return f"{value:.10g}"
+    return value
+
+
+_to_text = format_value
+
+
+def _type_rank(value):
+    if isinstance(value, bool):
+        return 2
+    if isinstance(value, str):
+        return 1
+    return 0
+
+
+def _compare(a, b):
+    """Сравнение как в таблице: числа < строки < логические, строки без учета регистра"""
+    a, b = _scalar(a), _scalar(b)
+    if a is None:
+        a = '' if isinstance(b, str) else (False if isinstance(b, bool) else 0.0)
+    if b is None:
+        b = '' if isinstance(a, str) else (False if isinstance(a, bool) else 0.0)
+    rank_a, rank_b = _type_rank(a), _type_rank(b)
+    if rank_a != rank_b:
+        return -1 if rank_a < rank_b else 1
+    if isinstance(a, str):
+        a, b = a.lower(), b.lower()
+    return (a > b) - (a < b)
+
+
+def _finite(value):
+    """Число как есть; переполнение и неопределенность (inf, nan) - ошибка #NUM!, как в таблице"""
+    if not math.isfinite(value):
+        raise SheetError('#NUM!')
+    return value
+
+
+def _round(value, digits, mode):
+    if not math.isfinite(value) or not math.isfinite(digits):
+        raise SheetError('#NUM!')
+    try:
+        quantum = decimal.Decimal(1).scaleb(-int(digits))
+        result = decimal.Decimal(repr(value)).quantize(quantum, rounding=mode)
+    except decimal.InvalidOperation:
+        # Точность больше, чем вмещает контекст decimal (ROUND(1,5; 30))
+        raise SheetError('#NUM!')
+    return float(result)
+
+
+# === ФУНКЦИИ ===
+
+def _numbers(args):
+    """Числа из аргументов: в диапазонах - только числовые ячейки, прямые аргументы приводятся"""
+    for arg in args:
+        if isinstance(arg, _Range):
+            for value in arg.values():
+                if isinstance(value, float):
+                    yield value
+        elif arg is not None:
+            yield _to_number(arg)
+
+
+def _sum(numbers):
+    try:
+        return _finite(math.fsum(numbers))
+    except OverflowError:
+        raise SheetError('#NUM!')
+
+
+def _fn_sum(ev, args):
+    return _sum(_numbers(args))
+
+
+def _fn_average(ev, args):
+    numbers = list(_numbers(args))
+    if not numbers:
+        raise SheetError('#DIV/0!')
+    return _sum(numbers) / len(numbers)
+
+
+def _fn_count(ev, args):
+    count = 0
+    for arg in args:
+        values = arg.values() if isinstance(arg, _Range) else [arg]
+        count += sum(1 for value in values if isinstance(value, float))
+    return float(count)
+
+
+def _fn_counta(ev, args):
+    count = 0
+    for arg in args:
+        values = arg.values() if isinstance(arg, _Range) else [arg]
+        count += sum(1 for value in values if value is not None)
+    return float(count)
+
+
+def _fn_min(ev, args):
+    return min(_numbers(args), default=0.0)
+
+
+def _fn_max(ev, args):
+    return max(_numbers(args), default=0.0)
+
+
+def _make_round(mode):
+    def round_function(ev, args):
+        digits = _to_number(args[1]) if len(args) > 1 else 0.0
+        return _round(_to_number(args[0]), digits, mode)
+    return round_function
+
+
+def _fn_abs(ev, args):
+    return abs(_to_number(args[0]))
+
+
+def _logical_values(args):
+    """Логические значения аргументов; пустые ячейки диапазонов пропускаются"""
+    for arg in args:
+        if isinstance(arg, _Range):
+            yield from (_to_bool(value) for value in arg.values() if value is not None)
+        else:
+            yield _to_bool(arg)
+
+
+def _fn_and(ev, args):
+    return all(list(_logical_values(args)))
+
+
+def _fn_or(ev, args):
+    return any(list(_logical_values(args)))
+
+
+def _fn_not(ev, args):
+    return not _to_bool(args[0])
+
+
+def _fn_concatenate(ev, args):
+    return ''.join(_to_text(value) for arg in args
+                   for value in (arg.values() if isinstance(arg, _Range) else [arg]))
+
+
+def _fn_len(ev, args):
+    return float(len(_to_text(_scalar(args[0]))))
+
+
+def _fn_upper(ev, args):
+    return _to_text(_scalar(args[0])).upper()
+
+
+def _fn_lower(ev, args):
+    return _to_text(_scalar(args[0])).lower()
+
+
+def _fn_trim(ev, args):
+    return ' '.join(_to_text(_scalar(args[0])).split())
+
+
+def _fn_if(ev, nodes):
+    if _to_bool(ev.evaluate(nodes[0])):
+        return ev.evaluate(nodes[1])
+    return ev.evaluate(nodes[2]) if len(nodes) > 2 else False
+
+
+def _fn_iferror(ev, nodes):
+    try:
+        return _scalar(ev.evaluate(nodes[0]))
+    except SheetError:
+        return ev.evaluate(nodes[1]) if len(nodes) > 1 else None
+
+
+def _criterion(criterion):
+    """Предикат условия COUNTIF/SUMIF: ">10", "<>", "ив*", 5 ..."""
+    criterion = _scalar(criterion)
+    if not isinstance(criterion, str):
+        return lambda value: value is not None and _compare(value, criterion) == 0
+
+    match = re.match(r'(<=|>=|<>|<|>|=)?(.*)', criterion, re.DOTALL)
+    operator, operand = match.group(1) or '=', match.group(2)
+    number = parse_number(operand)
+
+    if number is not None:
+        checks = {
+            '=': lambda c: c == 0, '<>': lambda c: c != 0, '<': lambda c: c < 0,
+            '>': lambda c: c > 0, '<=': lambda c: c <= 0, '>=': lambda c: c >= 0,
+        }
+        check = checks[operator]
+
+        def numeric(value):
+            if not isinstance(value, float):
+                return operator == '<>'
+            return check((value > number) - (value < number))
+        return numeric
+
+    if operand == '':
+        if operator == '<>':
+            return lambda value: value is not None
+        return lambda value: value is None or value == ''
+
+    if operator in ('=', '<>'):
+        pattern = re.compile(
+            ''.join('.*' if ch == '*' else '.' if ch == '?' else re.escape(ch) for ch in operand),
+            re.IGNORECASE | re.DOTALL
+        )
+        matches = lambda value: isinstance(value, str) and pattern.fullmatch(value) is not None
+        return matches if operator == '=' else (lambda value: not matches(value))
+
+    def textual(value):
+        if not isinstance(value, str):
+            return False
+        comparison = _compare(value, operand)
+        return {'<': comparison < 0, '>': comparison > 0,
+                '<=': comparison <= 0, '>=': comparison >= 0}[operator]
+    return textual
+
+
+def _as_range(value):
+    if isinstance(value, _Range):
+        return value
+    return _Range([[_scalar(value)]])
+
+
+def _fn_countif(ev, args):
+    predicate = _criterion(args[1])
+    return float(sum(1 for value in _as_range(args[0]).values() if predicate(value)))
+
+
+def _conditional_values(args):
+    """Значения для суммирования SUMIF/AVERAGEIF: sum_range той же формы, что и диапазон условия"""
+    criteria_range = _as_range(args[0])
+    sum_range = _as_range(args[2]) if len(args) > 2 else criteria_range
+    predicate = _criterion(args[1])
+    for criteria_row, sum_row in zip(criteria_range.rows, sum_range.rows):
+        for value, summed in zip(criteria_row, sum_row):
+            if predicate(value) and isinstance(summed, float):
+                yield summed
+
+
+def _fn_sumif(ev, args):
+    return _sum(_conditional_values(args))
+
+
+def _fn_averageif(ev, args):
+    values = list(_conditional_values(args))
+    if not values:
+        raise SheetError('#DIV/0!')
+    return _sum(values) / len(values)
+
+
+def _fn_vlookup(ev, args):
+    key = _scalar(args[0])
+    table = _as_range(args[1])
+    column = int(_to_number(args[2]))
+    is_sorted = _to_bool(args[3]) if len(args) > 3 else True
+
+    if column < 1:
+        raise SheetError('#VALUE!')
+    width = max((len(row) for row in table.rows), default=0)
+    if column > width:
+        raise SheetError('#REF!')
+
+    found = None
+    for row in table.rows:
+        first = row[0]
+        if is_sorted:
+            # Приблизительный поиск: последняя строка, где первый столбец <= ключа
+            if first is None or _type_rank(first) != _type_rank(key):
+                continue
+            if _compare(first, key) > 0:
+                break
+            found = row
+        elif first is not None and _compare(first, key) == 0:
+            found = row
+            break
+
+    if found is None:
+        raise SheetError('#N/A')
+    return found[column - 1]
+
+
+# Имя -> (минимум аргументов, максимум или None, реализация)
+_FUNCTIONS = {
+    'SUM': (1, None, _fn_sum),
+    'AVERAGE': (1, None, _fn_average),
+    'COUNT': (1, None, _fn_count),
+    'COUNTA': (1, None, _fn_counta),
+    'MIN': (1, None, _fn_min),
+    'MAX': (1, None, _fn_max),
+    'ROUND': (1, 2, _make_round(decimal.ROUND_HALF_UP)),
+    'ROUNDUP': (1, 2, _make_round(decimal.ROUND_UP)),
+    'ROUNDDOWN': (1, 2, _make_round(decimal.ROUND_DOWN)),
+    'ABS': (1, 1, _fn_abs),
+    'IF': (2, 3, _fn_if),
+    'IFERROR': (1, 2, _fn_iferror),
+    'AND': (1, None, _fn_and),
+    'OR': (1, None, _fn_or),
+    'NOT': (1, 1, _fn_not),
+    'CONCATENATE': (1, None, _fn_concatenate),
+    'LEN': (1, 1, _fn_len),
+    'UPPER': (1, 1, _fn_upper),
+    'LOWER': (1, 1, _fn_lower),
+    'TRIM': (1, 1, _fn_trim),
+    'COUNTIF': (2, 2, _fn_countif),
+    'SUMIF': (2, 3, _fn_sumif),
+    'AVERAGEIF': (2, 3, _fn_averageif),
+    'VLOOKUP': (3, 4, _fn_vlookup),
+}
+
+# Функции, которым нужны невычисленные аргументы (ветви вычисляются по условию)
+_LAZY_FUNCTIONS = {'IF', 'IFERROR'}
+
+
+# === ВЫЧИСЛЕНИЕ ===
+
+class _Evaluator:
+    def __init__(self, snapshot, target=None):
+        self.snapshot = snapshot
+        self.target = target  # (строка, столбец) ячейки, куда будет записана формула
+        self.last_row = len(snapshot) + 1
+
+    def cell(self, row, col):
+        if (row, col) == self.target:
+            raise FormulaError(f"Циклическая ссылка: формула ссылается на свою ячейку {cell_name(row, col)}")
+        if row < 1 or col < 1:
+            raise SheetError('#REF!')
+        if row == 1:
+            header = self.snapshot.header
+            return _cell_value(header[col - 1]) if col <= len(header) else None
+        index = self.snapshot.index_of(row)
+        if not 0 <= index < len(self.snapshot):
+            return None
+        return _cell_value(self.snapshot.cell(index, col - 1))
+
+    def range(self, row1, col1, row2, col2):
+        row2 = self.last_row if row2 is None else row2
+        row1, row2 = min(row1, row2), max(row1, row2)
+        if row1 < 1:
+            raise SheetError('#REF!')
+        if self.target:
+            target_row, target_col = self.target
+            if row1 <= target_row <= row2 and col1 <= target_col <= col2:
+                raise FormulaError(
+                    f"Циклическая ссылка: диапазон включает ячейку {cell_name(target_row, target_col)}"
+                )
+        return _Range([
+            [self.cell(row, col) for col in range(col1, col2 + 1)]
+            for row in range(row1, min(row2, self.last_row) + 1)
+        ])
+
+    def evaluate(self, node):
+        kind = node[0]
+
+        if kind in ('num', 'str', 'bool'):
+            return node[1]
+        if kind == 'ref':
+            return self.cell(node[1], node[2])
+        if kind == 'range':
+            return self.range(*node[1:])
+        if kind == 'neg':
+            return -_to_number(self.evaluate(node[1]))
+        if kind == 'pct':
+            return _to_number(self.evaluate(node[1])) / 100
+        if kind == 'op':
+            return self.operator(node[1], node[2], node[3])
+        if kind == 'call':
+            name, args = node[1], node[2]
+            spec = _FUNCTIONS.get(name)
+            if spec is None:
+                raise UnsupportedFormula(f"функция {name} не поддерживается предпросмотром")
+            if name in _LAZY_FUNCTIONS:
+                return spec[2](self, args)
+            return spec[2](self, [self.evaluate(arg) for arg in args])
+        raise UnsupportedFormula(node[1])
+
+    def operator(self, operator, left_node, right_node):
+        left = self.evaluate(left_node)
+        right = self.evaluate(right_node)
+
+        if operator == '&':
+            return _to_text(_scalar(left)) + _to_text(_scalar(right))
+        if operator in _COMPARE_OPS:
+            comparison = _compare(left, right)
+            return {
+                '=': comparison == 0, '<>': comparison != 0, '<': comparison < 0,
+                '>': comparison > 0, '<=': comparison <= 0, '>=': comparison >= 0,
+            }[operator]
+
+        a, b = _to_number(left), _to_number(right)
+        if operator == '+':
+            return _finite(a + b)
+        if operator == '-':
+            return _finite(a - b)
+        if operator == '*':
+            return _finite(a * b)
+        if operator == '/':
+            if b == 0:
+                raise SheetError('#DIV/0!')
+            return _finite(a / b)
+        # '^'
+        if a == 0 and b < 0:
+            raise SheetError('#DIV/0!')
+        try:
+            result = a ** b
+        except OverflowError:
+            raise SheetError('#NUM!')
+        if isinstance(result, complex):
+            raise SheetError('#NUM!')
+        return _finite(result)
+
+
+def evaluate_formula(text, snapshot, target=None):
+    """Вычислить формулу по снимку и вернуть значение так, как его покажет таблица
+
+    target - (строка, столбец) ячейки, куда будет записана формула: ссылки на
+    нее считаются ошибкой. Ошибки вычисления (#DIV/0! и т.п.) возвращаются
+    как значение, ошибки синтаксиса - FormulaError, неподдерживаемые
+    конструкции - UnsupportedFormula.
+    """
+    node = parse_formula(text)
+    try:
+        value = _Evaluator(snapshot, target).evaluate(node)
+        if isinstance(value, float):
+            _finite(value)  # Например, литерал 1e400
+        return format_value(value)
+    except SheetError as e:
+        return e.code
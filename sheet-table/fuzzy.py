@@ -0,0 +1,221 @@
+import re
+
+from normalize import NormalizedShadow
+from search_index import SheetIndex, normalize_value
+
+# Значения длиннее этого индексируются только по отдельным словам
+MAX_TERM_LENGTH = 64
+# Максимальное число опечаток, на которое рассчитан индекс
+MAX_EDIT_DISTANCE = 2
+# Длина префикса, по которому строятся варианты удаления
+PREFIX_LENGTH = 7
+# Слова короче этого не попадают в индекс (слишком много случайных совпадений)
+MIN_WORD_LENGTH = 3
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def edit_distance(a, b, limit=None):
+    """Расстояние Левенштейна; при limit возвращает limit + 1, как только оно превышено"""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, char_b in enumerate(b, 1):
+            cost = previous[j - 1] + (char_a != char_b)
+            insert = current[j - 1] + 1
+            delete = previous[j] + 1
+            value = min(cost, insert, delete)
+            current.append(value)
+            if value < row_min:
+                row_min = value
+        if limit is not None and row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _deletes(term, max_distance):
+    """Все варианты строки с удалением до max_distance символов (включая саму строку)"""
+    found = {term}
+    frontier = [term]
+    for _ in range(max_distance):
+        next_frontier = []
+        for word in frontier:
+            if len(word) <= 1:
+                continue
+            for i in range(len(word)):
+                variant = word[:i] + word[i + 1:]
+                if variant not in found:
+                    found.add(variant)
+                    next_frontier.append(variant)
+        frontier = next_frontier
+    return found
+
+
+class DeletionIndex:
+    """Словарь удалений в стиле SymSpell
+
+    Для каждой строки заранее сохраняются варианты ее префикса с удалением до
+    max_distance символов. Две строки на расстоянии <= k имеют общий вариант
+    удаления, поэтому поиск сводится к нескольким десяткам обращений к словарю
+    и проверке расстояния только для найденных кандидатов.
+    """
+
+    def __init__(self, max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.terms = []
+        self._deletes = {}
+
+    def add(self, term):
+        term_id = len(self.terms)
+        self.terms.append(term)
+        for variant in _deletes(term[:self.prefix_length], self.max_distance):
+            bucket = self._deletes.get(variant)
+            if bucket is None:
+                self._deletes[variant] = term_id
+            elif isinstance(bucket, int):
+                self._deletes[variant] = [bucket, term_id]
+            else:
+                bucket.append(term_id)
+
+    def search(self, term, max_distance):
+        """Найти строки на расстоянии не больше max_distance: [(расстояние, строка)]"""
+        max_distance = min(max_distance, self.max_distance)
+        candidates = set()
+        for variant in _deletes(term[:self.prefix_length], max_distance):
+            bucket = self._deletes.get(variant)
+            if bucket is None:
+                continue
+            if isinstance(bucket, int):
+                candidates.add(bucket)
+            else:
+                candidates.update(bucket)
+
+        found = []
+        for term_id in candidates:
+            candidate = self.terms[term_id]
+            distance = edit_distance(term, candidate, max_distance)
+            if distance <= max_distance:
+                found.append((distance, candidate))
+
+        found.sort()
+        return found
+
+
+def _row_terms(normalized):
+    """Термины записи по нормализованным значениям ее ячеек (как при построении FuzzyIndex)"""
+    terms = set()
+    for value in normalized:
+        if not value:
+            continue
+        if len(value) <= MAX_TERM_LENGTH:
+            terms.add(value)
+        for word in _WORD_RE.findall(value):
+            if len(word) >= MIN_WORD_LENGTH and word != value:
+                terms.add(word)
+    return terms
+
+
+def default_max_distance(term):
+    """Допустимое число опечаток в зависимости от длины запроса"""
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 6:
+        return 1
+    return 2
+
+
+class FuzzyIndex:
+    """Нечеткий индекс по различным значениям ячеек снимка
+
+    Индексируются целые значения (до MAX_TERM_LENGTH символов) и отдельные слова,
+    поэтому опечатка в одном слове многословного значения тоже находится.
+
+    Словарь удалений общий для версий снимка и только дополняется: в нем
+    могут быть термины, которых в этой версии уже (или еще) нет, поэтому
+    записи терминов берутся из term_rows этой версии.
+    """
+
+    def __init__(self, snapshot):
+        self.term_rows = {}
+        index = SheetIndex.for_snapshot(snapshot)
+        self.shadow = index.shadow
+
+        for column in index.columns:
+            for value, rows in column.postings.items():
+                if len(value) <= MAX_TERM_LENGTH:
+                    self._add_term(value, rows)
+                for word in _WORD_RE.findall(value):
+                    if len(word) >= MIN_WORD_LENGTH and word != value:
+                        self._add_term(word, rows)
+
+        self.deletions = DeletionIndex()
+        for term in self.term_rows:
+            self.deletions.add(term)
+        self.indexed = set(self.term_rows)  # Термины в словаре удалений (общий, как и он)
+
+    @classmethod
+    def for_snapshot(cls, snapshot):
+        """Индекс для снимка (кэшируется в самом снимке)"""
+        return snapshot.derived('fuzzy_index', cls)
+
+    def updated(self, snapshot, changes):
+        """Индекс для новой версии снимка с замененными строками {индекс: значения}
+
+        Пересчитываются термины только записанных строк; множества записей
+        заменяются копиями, новые термины дописываются в общий словарь удалений.
+        """
+        index = FuzzyIndex.__new__(FuzzyIndex)
+        index.shadow = NormalizedShadow.for_snapshot(snapshot)
+        index.term_rows = dict(self.term_rows)
+        index.deletions = self.deletions
+        index.indexed = self.indexed
+        old_length = len(self.shadow.snapshot)
+
+        for row in changes:
+            old_terms = _row_terms(self.shadow.row(row)) if row < old_length else set()
+            new_terms = _row_terms(index.shadow.row(row))
+            for term in old_terms - new_terms:
+                rows = index.term_rows.get(term, set()) - {row}
+                if rows:
+                    index.term_rows[term] = rows
+                else:
+                    index.term_rows.pop(term, None)
+            for term in new_terms - old_terms:
+                index.term_rows[term] = index.term_rows.get(term, set()) | {row}
+                if term not in index.indexed:
+                    index.indexed.add(term)
+                    index.deletions.add(term)
+        return index
+
+    def _add_term(self, term, rows):
+        bucket = self.term_rows.get(term)
+        if bucket is None:
+            self.term_rows[term] = set(rows)
+        else:
+            bucket.update(rows)
+
+    def search(self, text, max_distance=None):
+        """Записи с близкими значениями: [(номер записи, расстояние)] по возрастанию расстояния"""
+        term = normalize_value(text)
+        if not term:
+            return []
+        if max_distance is None:
+            max_distance = default_max_distance(term)
+
+        best = {}
+        for distance, found_term in self.deletions.search(term, max_distance):
+            for row in self.term_rows.get(found_term, ()):
+                if row not in best or distance < best[row]:
+                    best[row] = distance
+
+        return sorted(best.items(), key=lambda item: (item[1], item[0]))
@@ -1,13 +1,59 @@
 import logging
+import threading
+import time
 import gspread
+from gspread.utils import a1_to_rowcol, absolute_range_name, rowcol_to_a1
 from google.oauth2.service_account import Credentials
+from bulk_edit import plan_bulk_edit
 from config import Config
+from duplicates import DuplicateIndex
+from formula import FormulaError, UnsupportedFormula, evaluate_formula, parse_formula
+from fuzzy import FuzzyIndex
+from normalize import NormalizedShadow, normalize_text
+from prefetch import PrefetchedRows
+from query import execute_query, is_plain_query, parse_query
+from query_cache import QueryResultCache
+from quota import QuotaPacer
+from row_cache import RowVersionCache
+from row_ids import RowIdMap
+from schema import SchemaTracker
+from search_cursor import SearchCursor
+from search_index import SheetIndex
+from snapshot import SheetSnapshot, SnapshotPins
+from sorting import SortedView
+from suggest import ColumnSuggestions
+from undo import EditRecord
+from write_journal import QUEUED, REPLAY_BATCH, WRITTEN, WriteJournal
+
+# Ответы API, после которых запись имеет смысл повторить позже
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
 
 class GoogleSheetsService:
     def __init__(self):
         self.client = None
         self.worksheet = None
         self.columns_cache = []
+        self.schema = SchemaTracker()
+        self._snapshot = None
+        # Стабильные идентификаторы строк: кнопки ссылаются на строку, а не на ее номер
+        self.row_ids = RowIdMap()
+        # Версии снимка, которые листают пользователи (страницы не сдвигаются от чужих изменений)
+        self.pins = SnapshotPins(Config.PAGINATION_PIN_TTL)
+        self.query_cache = QueryResultCache()
+        # Строки, записанные через бота: показываются без повторного чтения из таблицы
+        self.row_cache = RowVersionCache(Config.CACHE_TTL)
+        # Строки, загруженные заранее для вероятного следующего клика
+        self.prefetched_rows = PrefetchedRows(Config.CACHE_TTL)
+        # Общий для всех массовых операций темп записи в пределах квоты API
+        self.write_pacer = QuotaPacer(Config.SHEETS_WRITES_PER_MINUTE)
+        # Записи, не дошедшие до таблицы из-за сбоя или квоты, ждут здесь повторной отправки
+        self.journal = WriteJournal(Config.JOURNAL_PATH)
+        # Записи и структурные изменения (вставка, удаление, копирование строк) идут по одному:
+        # номера строк разрешаются и отправляются в таблицу под одной блокировкой
+        self._write_lock = threading.RLock()
+        # Короткая блокировка идентификаторов строк и снимка: читатели из цикла событий
+        # (resolve_row, row_ref) не ждут запросов к API
+        self._local_lock = threading.RLock()
         self.logger = logging.getLogger(__name__)
         
     async def init_service(self):
@@ -31,7 +77,7 @@ class GoogleSheetsService:
             self.worksheet = spreadsheet.worksheet(Config.WORKSHEET_NAME)
             
             # Кэширование названий столбцов
-            self.columns_cache = self.worksheet.row_values(1)
+            self.refresh_schema(self.worksheet.row_values(1))
             
             self.logger.info(f"Подключение к Google Sheets установлено. Лист: {Config.WORKSHEET_NAME}")
             self.logger.info(f"Найдено столбцов: {len(self.columns_cache)}")
@@ -43,23 +89,259 @@ class GoogleSheetsService:
             return False
     
     def get_columns(self):
-        """Получить названия столбцов"""
+        """Получить названия столбцов
+        
+        Заголовки перепроверяются не чаще раза в SCHEMA_CHECK_INTERVAL секунд;
+        загрузка снимка проверяет их попутно, без отдельного запроса.
+        """
+        if self.schema.age() > Config.SCHEMA_CHECK_INTERVAL:
+            self.refresh_schema()
         return self.columns_cache
     
+    def refresh_schema(self, header=None):
+        """Сверить заголовки листа с известной схемой (header - уже прочитанная строка 1)"""
+        if header is None:
+            try:
+                header = self.worksheet.row_values(1)
+            except Exception as e:
+                self.logger.error(f"Ошибка проверки заголовков: {e}")
+                return
+        
+        if not self.schema.observe(header):
+            return
+        
+        self.columns_cache = self.schema.columns
+        self.query_cache.clear()
+        # Индексы снимка построены по старому расположению столбцов
+        if self._snapshot is not None and self._snapshot.header != self.columns_cache:
+            self.invalidate_snapshot()
+        self.logger.info(f"Схема листа v{self.schema.version}: {len(self.columns_cache)} столбцов")
+    
+    def get_snapshot(self):
+        """Получить снимок листа (из кэша, пока он не старше CACHE_TTL)"""
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.age() > Config.CACHE_TTL:
+            # Другой поток может сбросить снимок в любой момент - возвращаем загруженный
+            snapshot = self.refresh_snapshot()
+        return snapshot
+    
+    def current_version(self):
+        """Версия текущего снимка без его загрузки (None, если снимка нет)"""
+        return self._snapshot.version if self._snapshot is not None else None
+    
+    def refresh_snapshot(self):
+        """Загрузить снимок листа заново, не дожидаясь истечения CACHE_TTL"""
+        with self._write_lock:
+            values = self.worksheet.get_all_values()
+            self.refresh_schema(values[0] if values else [])
+            with self._local_lock:
+                # Строки, добавленные или убранные в конце листа извне, получают или теряют идентификаторы
+                self.row_ids.resize(max(0, len(values) - 1))
+                snapshot = SheetSnapshot(values, self.schema.version, self.row_ids.ids())
+                self._snapshot = snapshot
+                # Записи из журнала еще не в таблице, но пользователь должен их видеть
+                pending = [(e.row_number, e.column_number, e.value) for e in self.journal.pending('cell')]
+                if pending:
+                    self._apply_cell_writes(pending)
+                    if self._snapshot is None:
+                        self._snapshot = snapshot
+                snapshot = self._snapshot
+        changed = self.row_cache.reconcile(snapshot)
+        if changed:
+            self.logger.info(f"Строк, измененных извне после записи: {changed}")
+        memory = snapshot.memory
+        self.logger.info(
+            f"Загружен снимок листа v{snapshot.version}: {len(snapshot)} строк, "
+            f"{memory['after_bytes_per_row']:.0f} байт/строку "
+            f"(списками было бы {memory['before_bytes_per_row']:.0f}, x{memory['ratio']:.1f})"
+        )
+        return snapshot
+    
+    def row_ref(self, row_number, snapshot=None):
+        """Ссылка на строку для callback-данных кнопок (None, если строка вне загруженных данных)
+        
+        snapshot - снимок, по которому показан номер строки (закрепленная версия
+        или результаты поиска); по умолчанию - текущее расположение строк.
+        """
+        with self._local_lock:
+            index = row_number - 2
+            if snapshot is not None:
+                row_id = snapshot.row_id(index)
+            elif 0 <= index < len(self.row_ids):
+                row_id = self.row_ids.id_at(index)
+            else:
+                row_id = None
+            return self.row_ids.encode(row_id) if row_id is not None else None
+    
+    def resolve_row(self, row_number, ref=None):
+        """Текущий номер строки по номеру и ссылке из кнопки; None, если строка удалена
+        
+        Кнопки без ссылки или созданные до перезапуска бота указывают на сам номер.
+        """
+        with self._local_lock:
+            row_id = self.row_ids.decode(ref) if ref else None
+            if row_id is None:
+                return row_number
+            position = self.row_ids.position(row_id)
+            return position + 2 if position is not None else None
+    
+    def _splice_rows(self, index, delete_count, rows):
+        """Отразить вставку или удаление строк без перезагрузки листа
+        
+        Идентификаторы сдвигаются в дереве за O(log n), снимок получает новую
+        версию со сдвинутыми строками. Сдвиг меняет ссылки формул и значения
+        диапазонов, охватывающих вставку, поэтому локально снимок сдвигается,
+        только если кэш формул загружен и формул в листе нет; иначе снимок
+        перезагружается. Возвращает True, если снимок сдвинут локально.
+        """
+        with self._local_lock:
+            new_ids = []
+            if 0 <= index <= len(self.row_ids):
+                if delete_count:
+                    self.row_ids.delete(index, delete_count)
+                if rows:
+                    new_ids = self.row_ids.insert(index, len(rows))
+            self.row_cache.clear()
+            self.prefetched_rows.clear()
+            
+            snapshot = self._snapshot
+            grid = snapshot.peek_derived('formulas') if snapshot is not None else None
+            if (grid is None or grid or not 0 <= index <= len(snapshot)
+                    or index + delete_count > len(snapshot)):
+                self.invalidate_snapshot()
+                return False
+            spliced = snapshot.spliced(index, delete_count, rows, new_ids)
+            # Формул по-прежнему нет: пустой кэш формул переходит в новую версию
+            spliced.derived('formulas', lambda _: {})
+            self._snapshot = spliced
+            return True
+    
+    def invalidate_snapshot(self):
+        """Сбросить кэшированный снимок (после записи в таблицу)"""
+        self._snapshot = None
+    
+    def _current_row(self, row_number):
+        """Последние известные значения строки: из кэша записей или снимка (None, если неизвестны)"""
+        cached = self.row_cache.get(row_number)
+        if cached is not None:
+            return list(cached.values)
+        if self._snapshot is None or row_number < 2:
+            return None
+        index = self._snapshot.index_of(row_number)
+        return list(self._snapshot.rows[index]) if index < len(self._snapshot) else []
+    
+    def _drop_local_rows(self, row_numbers):
+        """Записанное нельзя отразить локально: сбросить снимок и строки, как до write-through"""
+        self.invalidate_snapshot()
+        for row_number in row_numbers:
+            self.row_cache.discard(row_number)
+            self.prefetched_rows.discard(row_number)
+    
+    def _apply_cell_writes(self, updates):
+        """Write-through: отразить успешно записанные ячейки в кэше строк и снимке
+        
+        updates - (номер строки, номер столбца, значение). Формулы вычисляются
+        локально; если значение ячейки вычислить нельзя, снимок сбрасывается.
+        """
+        with self._local_lock:
+            rows = {}
+            formulas = {}
+            for row_number, column_number, value in updates:
+                values = rows.get(row_number)
+                if values is None:
+                    values = self._current_row(row_number)
+                    if values is None:
+                        self._drop_local_rows({row for row, _, _ in updates})
+                        return
+                    rows[row_number] = values
+                if len(values) < column_number:
+                    values.extend([''] * (column_number - len(values)))
+                
+                text = str(value)
+                if text.startswith('='):
+                    if self._snapshot is None:
+                        self._drop_local_rows({row for row, _, _ in updates})
+                        return
+                    try:
+                        display = evaluate_formula(text, self._snapshot, (row_number, column_number))
+                    except Exception:
+                        # Запись уже в таблице: при любой ошибке вычисления строки перечитываются
+                        self._drop_local_rows({row for row, _, _ in updates})
+                        return
+                    formulas[(row_number, column_number)] = text
+                else:
+                    display = text
+                    formulas[(row_number, column_number)] = None
+                values[column_number - 1] = display
+            
+            self._apply_row_writes(rows, formulas)
+    
+    def _apply_row_writes(self, rows, formulas=None):
+        """Write-through: новые значения строк {номер строки: значения} -> кэш строк и новая версия снимка"""
+        with self._local_lock:
+            for row_number, values in rows.items():
+                self.prefetched_rows.discard(row_number)
+                stamp = self.row_cache.put(row_number, values)
+                self.logger.debug(f"Строка {row_number}: локальная версия {stamp}")
+            
+            snapshot = self._snapshot
+            if snapshot is None:
+                return
+            
+            changes = {snapshot.index_of(row): values for row, values in rows.items()}
+            row_ids = None
+            grown = max(changes) + 1 - len(snapshot) if changes else 0
+            if grown > 0 and snapshot.row_ids is not None:
+                # Добавленные строки получают новые идентификаторы
+                row_ids = snapshot.row_ids[:]
+                row_ids.extend(self.row_ids.extend(grown))
+            patched = snapshot.with_rows(changes, row_ids)
+            
+            # Кэш формул переносится в новую версию с поправкой на записанные ячейки
+            grid = snapshot.peek_derived('formulas')
+            if grid is not None:
+                grid = dict(grid)
+                for cell, formula in (formulas or {}).items():
+                    if formula is None:
+                        grid.pop(cell, None)
+                    else:
+                        grid[cell] = formula
+                patched.derived('formulas', lambda _: grid)
+            
+            # Поисковые индексы переносятся, пересчитываются только записанные строки
+            # (тень снимка переносится в самом снимке)
+            for key in ('search_index', 'columnar', 'fuzzy_index'):
+                index = snapshot.peek_derived(key)
+                if index is not None:
+                    patched.derived(key, lambda _: index.updated(patched, changes))
+            
+            # Индекс дубликатов тоже переносится, пересчитываются только записанные строки
+            duplicates = snapshot.peek_derived('duplicates')
+            if duplicates is not None:
+                patched.derived('duplicates', lambda _: duplicates.updated(patched, changes))
+            
+            # Порядки сортировки "Все строки" - сдвигаются только записанные строки
+            for col in range(snapshot.width):
+                view = snapshot.peek_derived(('sorted', col))
+                if view is not None:
+                    patched.derived(('sorted', col), lambda _: view.updated(patched, changes))
+            
+            self._snapshot = patched
+    
+    def iter_search(self, search_value):
+        """Лениво перебирать строки, содержащие значение (сравнение по нормализованной тени)"""
+        snapshot = self.get_snapshot()
+        needle = normalize_text(search_value)
+        if not needle:
+            return
+        
+        for index in NormalizedShadow.for_snapshot(snapshot).iter_containing(needle):
+            yield snapshot.row_info(index)
+    
     def search_in_sheet(self, search_value):
         """Поиск строк по значению"""
         try:
-            all_values = self.worksheet.get_all_values()
-            found_rows = []
-            
-            for i, row in enumerate(all_values[1:], start=2):  # Начинаем с 2-й строки (пропускаем заголовки)
-                for cell_value in row:
-                    if search_value.lower() in cell_value.lower():
-                        found_rows.append({
-                            'row_number': i,
-                            'data': row
-                        })
-                        break
+            found_rows = list(self.iter_search(search_value))
             
             self.logger.info(f"Поиск '{search_value}': найдено {len(found_rows)} строк")
             return found_rows
@@ -68,13 +350,127 @@ class GoogleSheetsService:
             self.logger.error(f"Ошибка поиска в таблице: {e}")
             return []
     
+    def query_indexes(self, query_text):
+        """Снимок и отсортированные номера его записей, подходящих под запрос
+        
+        Ошибки синтаксиса запроса пробрасываются как QueryError.
+        """
+        snapshot = self.get_snapshot()
+        node = parse_query(query_text, snapshot.header)
+        return snapshot, execute_query(node, SheetIndex.for_snapshot(snapshot))
+    
+    def cached_query_indexes(self, query_text):
+        """То же, что query_indexes, но с кэшем результатов по запросу и его префиксам
+        
+        Используется inline-режимом, где запрос приходит на каждое нажатие клавиши.
+        """
+        snapshot = self.get_snapshot()
+        cached = self.query_cache.get(snapshot.version, query_text)
+        if cached is not None:
+            return snapshot, cached
+        
+        node = parse_query(query_text, snapshot.header)
+        index = SheetIndex.for_snapshot(snapshot)
+        plain = is_plain_query(node)
+        
+        base = self.query_cache.longest_prefix(snapshot.version, query_text) if plain else None
+        if base is not None:
+            indexes = [i for i in base if node.matches(index, i)]
+        else:
+            indexes = execute_query(node, index)
+        
+        self.query_cache.put(snapshot.version, query_text, indexes, plain)
+        return snapshot, indexes
+    
+    def query_sheet(self, query_text):
+        """Поиск по запросу (см. query.py) через поколоночные индексы снимка
+        
+        Ошибки синтаксиса запроса пробрасываются как QueryError.
+        """
+        snapshot, indexes = self.query_indexes(query_text)
+        
+        found_rows = [snapshot.row_info(i) for i in indexes]
+        self.logger.info(f"Запрос '{query_text}': найдено {len(found_rows)} строк")
+        return found_rows
+    
+    def query_cursor(self, query_text, per_page=10):
+        """Курсор по результатам запроса: строки формируются по мере листания
+        
+        Простой поиск подстроки идет по тени снимка лениво: для первой
+        страницы достаточно первых совпадений, общее число неизвестно, пока
+        пользователь не долистает до конца. Запросы со столбцами и
+        операторами вычисляются по индексам целиком (число результатов
+        известно сразу), лениво формируются только строки.
+        """
+        snapshot = self.get_snapshot()
+        node = parse_query(query_text, snapshot.header)
+        if is_plain_query(node):
+            shadow = NormalizedShadow.for_snapshot(snapshot)
+            indexes = shadow.iter_containing(node.text) if node.text else iter(())
+            rows = (snapshot.row_info(i) for i in indexes)
+            return SearchCursor(query_text, rows, per_page, snapshot=snapshot)
+        
+        indexes = execute_query(node, SheetIndex.for_snapshot(snapshot))
+        self.logger.info(f"Запрос '{query_text}': найдено {len(indexes)} строк")
+        rows = (snapshot.row_info(i) for i in indexes)
+        return SearchCursor(query_text, rows, per_page, total=len(indexes), snapshot=snapshot)
+    
+    @staticmethod
+    def _fuzzy_rows(snapshot, matches):
+        for index, distance in matches:
+            row_info = snapshot.row_info(index)
+            row_info['distance'] = distance
+            yield row_info
+    
+    def fuzzy_search(self, search_value, max_distance=None):
+        """Нечеткий поиск: строки со значениями в пределах расстояния редактирования
+        
+        Результаты отсортированы по расстоянию, у каждой строки есть ключ 'distance'.
+        """
+        try:
+            snapshot = self.get_snapshot()
+            matches = FuzzyIndex.for_snapshot(snapshot).search(search_value, max_distance)
+            found_rows = list(self._fuzzy_rows(snapshot, matches))
+            
+            self.logger.info(f"Нечеткий поиск '{search_value}': найдено {len(found_rows)} строк")
+            return found_rows
+            
+        except Exception as e:
+            self.logger.error(f"Ошибка нечеткого поиска: {e}")
+            return []
+    
+    def fuzzy_cursor(self, search_value, per_page=10):
+        """Курсор по результатам нечеткого поиска (сортировка по расстоянию требует всех совпадений)"""
+        snapshot = self.get_snapshot()
+        matches = FuzzyIndex.for_snapshot(snapshot).search(search_value)
+        
+        self.logger.info(f"Нечеткий поиск '{search_value}': найдено {len(matches)} строк")
+        return SearchCursor(
+            f"~{search_value}", self._fuzzy_rows(snapshot, matches), per_page,
+            total=len(matches), snapshot=snapshot
+        )
+    
     def get_row_by_number(self, row_number):
         """Получить строку по номеру"""
         try:
             if row_number < 2:  # Первая строка - заголовки
                 return None
-                
-            row_values = self.worksheet.row_values(row_number)
+            
+            # Только что записанная строка показывается из кэша, без запроса к API
+            cached = self.row_cache.get(row_number)
+            if cached is not None:
+                self.logger.info(f"Строка {row_number} из кэша записей (версия {cached.stamp})")
+                return {
+                    'row_number': row_number,
+                    'data': list(cached.values),
+                    'version': cached.stamp
+                }
+            
+            row_values = self.prefetched_rows.get(row_number)
+            if row_values is not None:
+                self.logger.info(f"Строка {row_number} из предзагрузки")
+            else:
+                row_values = self.worksheet.row_values(row_number)
             
             if not row_values:
                 return None
@@ -89,12 +485,33 @@ class GoogleSheetsService:
             self.logger.error(f"Ошибка получения строки {row_number}: {e}")
             return None
     
+    def prefetch_rows(self, row_numbers):
+        """Загрузить строки заранее одним запросом values_batch_get; вернуть число загруженных
+        
+        Строки, уже известные из кэша записей или предзагрузки, не запрашиваются.
+        """
+        wanted = [
+            row_number for row_number in row_numbers
+            if row_number >= 2 and self.row_cache.get(row_number) is None and row_number not in self.prefetched_rows
+        ]
+        if not wanted:
+            return 0
+        
+        ranges = [absolute_range_name(self.worksheet.title, f"{row_number}:{row_number}") for row_number in wanted]
+        response = self.worksheet.spreadsheet.values_batch_get(ranges)
+        for row_number, value_range in zip(wanted, response.get('valueRanges', [])):
+            values = value_range.get('values') or [[]]
+            self.prefetched_rows.put(row_number, values[0])
+        
+        self.logger.debug(f"Предзагружены строки: {wanted}")
+        return len(wanted)
+    
     def update_cell(self, row, col, value):
-        """Обновить ячейку"""
+        """Обновить ячейку (WRITTEN, QUEUED - отложено в журнал, False - ошибка)"""
         try:
-            self.worksheet.update_cell(row, col, value)
+            result = self._write_cells([(row, col, value)])
             self.logger.info(f"Обновлена ячейка [{row}, {col}] = '{value}'")
-            return True
+            return result
         except Exception as e:
             self.logger.error(f"Ошибка обновления ячейки [{row}, {col}]: {e}")
             return False
@@ -102,41 +519,182 @@ class GoogleSheetsService:
     def update_row(self, row_number, values):
         """Обновить всю строку"""
         try:
-            # Обновляем только непустые значения
-            for i, value in enumerate(values, start=1):
-                if value:  # Только если значение непустое
-                    self.worksheet.update_cell(row_number, i, value)
+            # Обновляем только непустые значения, одним запросом
+            updates = [(row_number, i, value) for i, value in enumerate(values, start=1) if value]
+            result = self.batch_update_cells(updates) if updates else WRITTEN
             
             self.logger.info(f"Обновлена строка {row_number}")
-            return True
+            return result
         except Exception as e:
             self.logger.error(f"Ошибка обновления строки {row_number}: {e}")
             return False
 
-    def get_all_rows_paginated(self, page=1, per_page=5):
-        """Получить все строки с пагинацией"""
+    def batch_update_cells(self, updates):
+        """Записать набор ячеек одним запросом values_batch_update
+        
+        updates - список (номер строки, номер столбца, значение), номера с 1.
+        Возвращает WRITTEN или QUEUED (таблица недоступна, записи в журнале).
+        """
+        result = self._write_cells(updates)
+        self.logger.info(f"Пакетно обновлено ячеек: {len(updates)}")
+        return result
+    
+    def edit_records(self, updates):
+        """Записи для истории отмены: (номер строки, номер столбца, новое значение) -> EditRecord
+        
+        Старые значения берутся из локальных данных (кэш строк, снимок, кэш
+        формул, если он уже загружен), без запросов к таблице: запись не ждет
+        загрузки всех формул листа. Без кэша формул прежним значением ячейки с
+        формулой считается ее результат. None, если строка неизвестна
+        локально - такое изменение отменить будет нельзя.
+        """
+        with self._local_lock:
+            grid = self._snapshot.peek_derived('formulas') if self._snapshot is not None else None
+            rows = {}
+            records = []
+            for row_number, column_number, value in updates:
+                if not 0 <= row_number - 2 < len(self.row_ids):
+                    return None
+                values = rows.get(row_number)
+                if values is None:
+                    values = rows[row_number] = self._current_row(row_number)
+                    if values is None:
+                        return None
+                old = grid.get((row_number, column_number)) if grid else None
+                if old is None:
+                    old = values[column_number - 1] if column_number <= len(values) else ''
+                records.append(EditRecord(self.row_ids.id_at(row_number - 2), column_number, old, str(value)))
+            return records
+    
+    def revert_cells(self, restore):
+        """Вернуть ячейкам прежние значения {(идентификатор строки, номер столбца): значение}
+        
+        Все ячейки пишутся одним пакетным запросом. Возвращает (результат
+        batch_update_cells, число ячеек); строки, удаленные с тех пор, пропускаются.
+        """
+        with self._write_lock:
+            updates = []
+            for (row_id, column_number), value in restore.items():
+                position = self.row_ids.position(row_id)
+                if position is not None:
+                    updates.append((position + 2, column_number, value))
+            if not updates:
+                return None, 0
+            return self.batch_update_cells(updates), len(updates)
+    
+    @staticmethod
+    def _is_transient(error):
+        """Сбой, который пройдет сам: квота, ошибка сервера, сеть"""
+        if isinstance(error, gspread.exceptions.APIError):
+            return error.response.status_code in TRANSIENT_STATUSES
+        return isinstance(error, OSError)
+    
+    def _write_cells(self, updates):
+        """Записать ячейки в таблицу или, если она недоступна, в журнал
+        
+        Пока в журнале есть записи, новые тоже идут в журнал: иначе при
+        воспроизведении старое значение ячейки затерло бы более новое.
+        Окончательные ошибки API (неверный диапазон, нет доступа) пробрасываются.
+        """
+        with self._write_lock:
+            if not self.journal.has_pending():
+                try:
+                    self._send_cells(updates)
+                except Exception as e:
+                    if not self._is_transient(e):
+                        raise
+                    self.logger.warning(f"Таблица недоступна ({e}), записи отложены в журнал")
+                else:
+                    self._apply_cell_writes(updates)
+                    return WRITTEN
+            
+            self.journal.add_cells(updates)
+            self._apply_cell_writes(updates)
+            return QUEUED
+    
+    def _send_cells(self, updates):
+        """Отправить ячейки одним запросом values_batch_update (без локальных изменений)"""
+        data = [
+            {
+                'range': absolute_range_name(self.worksheet.title, rowcol_to_a1(row, col)),
+                'values': [[value]]
+            }
+            for row, col, value in updates
+        ]
+        self.worksheet.spreadsheet.values_batch_update({
+            'valueInputOption': 'USER_ENTERED',
+            'data': data
+        })
+    
+    def replay_journal(self):
+        """Отправить очередную порцию журнала; вернуть число записей в ней
+        
+        Ячейки уходят одним запросом (в журнале уже только последнее значение
+        каждой), новые строки - одним append в порядке добавления. Сетевые
+        сбои и квота пробрасываются: записи остаются в журнале до следующей
+        попытки. Если API отклоняет порцию окончательно, записи отправляются
+        по одной, и отклоненные исключаются из журнала.
+        """
+        with self._write_lock:
+            entries = self.journal.pending(limit=REPLAY_BATCH)
+            cells = [entry for entry in entries if entry.kind == 'cell']
+            appends = [entry for entry in entries if entry.kind == 'append']
+            
+            if cells:
+                self._replay(cells, lambda batch: self._send_cells(
+                    [(entry.row_number, entry.column_number, entry.value) for entry in batch]
+                ))
+            if appends:
+                self._replay(appends, lambda batch: self.worksheet.append_rows([entry.value for entry in batch]))
+                # Номера новых строк известны только таблице
+                self.invalidate_snapshot()
+            
+            if entries:
+                self.logger.info(
+                    f"Журнал записей: отправлено {len(cells)} ячеек и {len(appends)} строк, "
+                    f"осталось {self.journal.count()}"
+                )
+            return len(entries)
+    
+    def _replay(self, entries, send):
+        try:
+            send(entries)
+        except Exception as e:
+            if self._is_transient(e):
+                raise
+            if len(entries) == 1:
+                self.logger.error(f"Журнал записей: запись {entries[0].id} отклонена API: {e}")
+                self.journal.mark_failed([entries[0].id], e)
+                return
+            for entry in entries:
+                self._replay([entry], send)
+            return
+        self.journal.remove([entry.id for entry in entries])
+    
+    def plan_bulk_edit(self, query_text, column_number, edit):
+        """Изменения столбца column_number по правилу edit для строк, подходящих под запрос"""
+        snapshot, indexes = self.query_indexes(query_text)
+        return plan_bulk_edit(snapshot, indexes, column_number, edit)
+    
+    def get_all_rows_paginated(self, page=1, per_page=5, snapshot=None, sort=None):
+        """Получить все строки с пагинацией (snapshot - закрепленная версия, по умолчанию текущая)
+        
+        sort - (номер столбца, по убыванию): порядок берется из перестановки,
+        кэшированной в снимке для столбца, поэтому страница стоит столько же,
+        сколько без сортировки. Пустые значения столбца - в конце.
+        """
         try:
             self.logger.info(f"Запрос пагинации: страница {page}, по {per_page} строк")
             
-            # Получаем все строки (начиная со второй, пропуская заголовки)
-            all_rows = self.worksheet.get_all_values()[1:]  # Пропускаем заголовки
-            self.logger.info(f"Получено {len(all_rows)} строк из таблицы")
-            
-            if not all_rows:
+            if snapshot is None:
+                snapshot = self.get_snapshot()
+            if not len(snapshot):
                 self.logger.warning("Таблица пуста")
                 return [], 0, 0
             
-            # Фильтруем пустые строки
-            non_empty_rows = []
-            for i, row in enumerate(all_rows, start=2):  # Начинаем с 2 (после заголовков)
-                if any(cell.strip() for cell in row if cell):  # Если есть хотя бы одна непустая ячейка
-                    non_empty_rows.append({
-                        'row_number': i,
-                        'data': row
-                    })
-            
-            total_rows = len(non_empty_rows)
-            self.logger.info(f"Найдено {total_rows} непустых строк")
+            # Пустые строки пропускаются (список непустых кэшируется в снимке)
+            non_empty = snapshot.non_empty_indexes()
+            total_rows = len(non_empty)
             
             if total_rows == 0:
                 return [], 0, 0
@@ -148,7 +706,12 @@ class GoogleSheetsService:
             end_index = start_index + per_page
             
             # Получаем строки для текущей страницы
-            page_rows = non_empty_rows[start_index:end_index]
+            if sort is not None:
+                column_number, descending = sort
+                indexes = SortedView.for_snapshot(snapshot, column_number - 1).page(start_index, end_index, descending)
+            else:
+                indexes = non_empty[start_index:end_index]
+            page_rows = [snapshot.row_info(index) for index in indexes]
             
             self.logger.info(f"Получено строк для страницы {page}: {len(page_rows)} из {total_rows}, всего страниц: {total_pages}")
             
@@ -158,49 +721,315 @@ class GoogleSheetsService:
             self.logger.error(f"Ошибка получения всех строк: {e}")
             return [], 0, 0
     
+    def get_sheet_row_count(self):
+        """Число строк в сетке листа (включая пустые)
+        
+        Размер сетки перечитывается из метаданных таблицы: worksheet.row_count
+        запоминается при открытии листа и не учитывает строки, добавленные
+        позже не через бота.
+        """
+        metadata = self.worksheet.spreadsheet.fetch_sheet_metadata()
+        for sheet in metadata.get('sheets', []):
+            properties = sheet.get('properties', {})
+            if properties.get('sheetId') == self.worksheet.id:
+                return properties['gridProperties']['rowCount']
+        return self.worksheet.row_count
+    
+    def get_rows_chunk(self, start_row, row_count):
+        """Получить порцию строк одним запросом (start_row - номер строки в таблице)
+        
+        Пустые строки пропускаются.
+        """
+        end_row = start_row + row_count - 1
+        values = self.worksheet.get(f"{start_row}:{end_row}")
+        return [list(row) for row in values if any(cell.strip() for cell in row if cell)]
+    
+    def _duplicate_key_columns(self, snapshot):
+        """Номера ключевых столбцов дубликатов (с нуля) из DUPLICATE_KEY_COLUMNS; None - все столбцы"""
+        if not Config.DUPLICATE_KEY_COLUMNS:
+            return None
+        positions = {normalize_text(name): col for col, name in enumerate(snapshot.header)}
+        key_columns = []
+        for name in Config.DUPLICATE_KEY_COLUMNS:
+            col = positions.get(normalize_text(name))
+            if col is None:
+                self.logger.warning(f"Ключевой столбец дубликатов '{name}' не найден в заголовках")
+            else:
+                key_columns.append(col)
+        return key_columns or None
+    
+    def find_duplicates(self, row_data):
+        """Номера строк, совпадающих с row_data по ключевым столбцам (по умолчанию - по всем)
+        
+        Проверка идет по хэш-индексу снимка, без чтения и просмотра листа;
+        значения сравниваются нормализованными (регистр, ё/е, пробелы).
+        """
+        snapshot = self.get_snapshot()
+        index = DuplicateIndex.for_snapshot(snapshot, self._duplicate_key_columns(snapshot))
+        return [snapshot.row_number(i) for i in index.find(row_data)]
+    
+    def suggest_values(self, column_number, text='', limit=5):
+        """Существующие значения столбца для подсказок при вводе (по снимку, без запросов к API)
+        
+        Без text - самые частые значения, встречающиеся хотя бы дважды; с text -
+        продолжения ввода и значения с опечатками. Пустой список, если text уже
+        в точности совпадает с существующим значением.
+        """
+        suggestions = ColumnSuggestions.for_snapshot(self.get_snapshot(), column_number - 1)
+        if not text.strip():
+            return suggestions.most_common(limit, min_count=2)
+        if suggestions.canonical(text) == text:
+            return []
+        return suggestions.suggest(text, limit)
+    
     def add_new_row(self, row_data):
         """Добавить новую строку в конец таблицы"""
+        with self._write_lock:
+            try:
+                # Проверяем, что количество данных соответствует количеству столбцов
+                width = len(self.get_columns())
+                if len(row_data) > width:
+                    row_data = row_data[:width]
+                elif len(row_data) < width:
+                    # Дополняем пустыми значениями
+                    row_data.extend([''] * (width - len(row_data)))
+                
+                # Пока журнал не пуст, строка встает в очередь за предыдущими записями
+                if self.journal.has_pending():
+                    return self._queue_append(row_data)
+                
+                # Добавляем строку; номер новой строки - из ответа API (updatedRange)
+                try:
+                    response = self.worksheet.append_row(row_data)
+                except Exception as e:
+                    if not self._is_transient(e):
+                        raise
+                    self.logger.warning(f"Таблица недоступна ({e}), новая строка отложена в журнал")
+                    return self._queue_append(row_data)
+                new_row_number = self._appended_row_number(response)
+                
+                if new_row_number is None:
+                    self.invalidate_snapshot()
+                    new_row_number = len(self.worksheet.get_all_values())
+                else:
+                    self._apply_cell_writes([
+                        (new_row_number, col, value) for col, value in enumerate(row_data, start=1)
+                    ])
+                
+                self.logger.info(f"Добавлена новая строка {new_row_number}")
+                return new_row_number
+                
+            except Exception as e:
+                self.logger.error(f"Ошибка добавления строки: {e}")
+                return None
+    
+    def _queue_append(self, row_data):
+        """Отложить новую строку в журнал; номер строки станет известен после отправки"""
+        self.journal.add_append(row_data)
+        self.logger.info("Новая строка отложена в журнал записей")
+        return QUEUED
+    
+    @staticmethod
+    def _appended_row_number(response):
+        """Номер первой добавленной строки из ответа append (None, если его нет)"""
         try:
-            # Проверяем, что количество данных соответствует количеству столбцов
-            if len(row_data) > len(self.columns_cache):
-                row_data = row_data[:len(self.columns_cache)]
-            elif len(row_data) < len(self.columns_cache):
-                # Дополняем пустыми значениями
-                row_data.extend([''] * (len(self.columns_cache) - len(row_data)))
+            updated_range = response['updates']['updatedRange']
+            return a1_to_rowcol(updated_range.split('!')[-1].split(':')[0])[0]
+        except (KeyError, TypeError, IndexError, ValueError, AttributeError):
+            return None
+    
+    def append_rows(self, rows, retries=3):
+        """Добавить порцию строк в конец таблицы одним запросом
+        
+        При превышении квоты (HTTP 429) запрос повторяется с нарастающей паузой;
+        остальные ошибки пробрасываются, чтобы вызывающий код знал причину.
+        Пауза выжидается без блокировки записи: остальные записи не ждут повтора.
+        """
+        for attempt in range(retries + 1):
+            try:
+                with self._write_lock:
+                    self.worksheet.append_rows(rows)
+                    self.invalidate_snapshot()
+                break
+            except gspread.exceptions.APIError as e:
+                if e.response.status_code != 429 or attempt == retries:
+                    raise
+                delay = 2 ** attempt * 5
+                self.logger.warning(f"Квота записи исчерпана, повтор через {delay} с")
+                time.sleep(delay)
+        
+        self.logger.info(f"Добавлено строк: {len(rows)}")
+    
+    def insert_row_at_position(self, row_number, row_data):
+        """Вставить строку на определенную позицию"""
+        with self._write_lock:
+            try:
+                # Проверяем, что количество данных соответствует количеству столбцов
+                width = len(self.get_columns())
+                if len(row_data) > width:
+                    row_data = row_data[:width]
+                elif len(row_data) < width:
+                    # Дополняем пустыми значениями
+                    row_data.extend([''] * (width - len(row_data)))
+                
+                # Вставка сдвигает строки: отложенные записи ячеек попали бы не туда
+                if self.journal.has_pending():
+                    self.logger.warning("Вставка строки отклонена: в журнале есть неотправленные записи")
+                    return False
+                
+                # Вставляем строку
+                self.worksheet.insert_row(row_data, row_number)
+                # Строки ниже сдвинулись: идентификаторы и снимок сдвигаются локально
+                self._splice_rows(row_number - 2, 0, [row_data])
+                
+                self.logger.info(f"Вставлена строка на позицию {row_number}")
+                return True
+                
+            except Exception as e:
+                self.logger.error(f"Ошибка вставки строки: {e}")
+                return False
+    
+    @staticmethod
+    def merge_row_ranges(row_numbers):
+        """Номера строк -> непрерывные диапазоны (первая, последняя), снизу вверх"""
+        ranges = []
+        for row_number in sorted(set(row_numbers)):
+            if ranges and ranges[-1][1] == row_number - 1:
+                ranges[-1][1] = row_number
+            else:
+                ranges.append([row_number, row_number])
+        return [tuple(row_range) for row_range in reversed(ranges)]
+    
+    def delete_rows(self, row_numbers, row_refs=None):
+        """Удалить строки одним запросом batch_update; вернуть число удаленных строк
+        
+        Соседние строки объединяются в диапазоны, запросы deleteDimension идут
+        снизу вверх, чтобы удаление нижних строк не сдвигало верхние. Снимок и
+        идентификаторы строк сдвигаются локально, без перезагрузки листа.
+        row_refs - ссылки на строки из кнопок (по порядку row_numbers): они
+        разрешаются в текущие номера под той же блокировкой, что и запрос,
+        уже удаленные строки пропускаются.
+        """
+        with self._write_lock:
+            if row_refs is not None:
+                row_numbers = [
+                    row for row in map(self.resolve_row, row_numbers, row_refs) if row is not None
+                ]
+            ranges = self.merge_row_ranges(row for row in row_numbers if row >= 2)
+            if not ranges:
+                return 0
             
-            # Добавляем строку
-            self.worksheet.append_row(row_data)
+            # Удаление сдвигает строки: отложенные записи ячеек попали бы не туда
+            if self.journal.has_pending():
+                raise RuntimeError("в журнале есть неотправленные записи")
             
-            # Получаем номер добавленной строки
-            all_values = self.worksheet.get_all_values()
-            new_row_number = len(all_values)
+            self.worksheet.spreadsheet.batch_update({
+                'requests': [
+                    {
+                        'deleteDimension': {
+                            'range': {
+                                'sheetId': self.worksheet.id,
+                                'dimension': 'ROWS',
+                                'startIndex': first - 1,
+                                'endIndex': last
+                            }
+                        }
+                    }
+                    for first, last in ranges
+                ]
+            })
             
-            self.logger.info(f"Добавлена новая строка {new_row_number}")
-            return new_row_number
+            for first, last in ranges:
+                self._splice_rows(first - 2, last - first + 1, [])
             
-        except Exception as e:
-            self.logger.error(f"Ошибка добавления строки: {e}")
-            return None
+            deleted = sum(last - first + 1 for first, last in ranges)
+            self.logger.info(f"Удалено строк: {deleted} ({len(ranges)} диапазонов)")
+            return deleted
     
-    def insert_row_at_position(self, row_number, row_data):
-        """Вставить строку на определенную позицию"""
-        try:
-            # Проверяем, что количество данных соответствует количеству столбцов
-            if len(row_data) > len(self.columns_cache):
-                row_data = row_data[:len(self.columns_cache)]
-            elif len(row_data) < len(self.columns_cache):
-                # Дополняем пустыми значениями
-                row_data.extend([''] * (len(self.columns_cache) - len(row_data)))
+    def delete_row_range(self, first_row, last_row):
+        """Удалить строки с first_row по last_row включительно"""
+        return self.delete_rows(range(first_row, last_row + 1))
+    
+    def duplicate_row(self, row_number, target_row=None, row_ref=None):
+        """Скопировать строку на стороне Google одним batch_update; вернуть номер новой строки
+        
+        insertDimension вставляет пустую строку на место target_row (по
+        умолчанию - сразу под исходной), copyPaste копирует в нее исходную
+        строку целиком: значения, формулы (со сдвигом относительных ссылок),
+        форматирование и проверки данных. Значения не читаются и не
+        передаются через бота; снимок сдвигается локально, если в листе нет
+        формул (см. _splice_rows), иначе перезагружается. row_ref - ссылка
+        на строку из кнопки, разрешается под блокировкой записи; None, если
+        строка уже удалена.
+        """
+        with self._write_lock:
+            row_number = self.resolve_row(row_number, row_ref)
+            if row_number is None:
+                return None
+            if row_number < 2:
+                raise ValueError("строка заголовков не копируется")
+            if target_row is None:
+                target_row = row_number + 1
+            # Копирование сдвигает строки: отложенные записи ячеек попали бы не туда
+            if self.journal.has_pending():
+                raise RuntimeError("в журнале есть неотправленные записи")
             
-            # Вставляем строку
-            self.worksheet.insert_row(row_data, row_number)
+            source_row = row_number + 1 if target_row <= row_number else row_number
+            values = self._current_row(row_number)
+            width = max(len(self.get_columns()), len(values or []), 1)
+            sheet_id = self.worksheet.id
             
-            self.logger.info(f"Вставлена строка на позицию {row_number}")
-            return True
+            self.worksheet.spreadsheet.batch_update({
+                'requests': [
+                    {
+                        'insertDimension': {
+                            'range': {
+                                'sheetId': sheet_id,
+                                'dimension': 'ROWS',
+                                'startIndex': target_row - 1,
+                                'endIndex': target_row
+                            },
+                            'inheritFromBefore': target_row > 2
+                        }
+                    },
+                    {
+                        'copyPaste': {
+                            'source': {
+                                'sheetId': sheet_id,
+                                'startRowIndex': source_row - 1,
+                                'endRowIndex': source_row,
+                                'startColumnIndex': 0,
+                                'endColumnIndex': width
+                            },
+                            'destination': {
+                                'sheetId': sheet_id,
+                                'startRowIndex': target_row - 1,
+                                'endRowIndex': target_row,
+                                'startColumnIndex': 0,
+                                'endColumnIndex': width
+                            },
+                            'pasteType': 'PASTE_NORMAL'
+                        }
+                    }
+                ]
+            })
             
-        except Exception as e:
-            self.logger.error(f"Ошибка вставки строки: {e}")
-            return False
+            # Значения копии совпадают с исходной строкой, только если в листе нет формул
+            if self._splice_rows(target_row - 2, 0, [values or []]) and values is not None:
+                # Копия показывается из кэша строк, без чтения; загрузка снимка сверит ее с таблицей
+                self.row_cache.put(target_row, values)
+            
+            self.logger.info(f"Строка {row_number} скопирована в строку {target_row}")
+            return target_row
+    
+    def create_row_from_template(self, template_row, row_ref=None):
+        """Новая строка в конце данных - копия строки-шаблона (см. duplicate_row)"""
+        with self._write_lock:
+            template_row = self.resolve_row(template_row, row_ref)
+            if template_row is None:
+                return None
+            snapshot = self.get_snapshot()
+            return self.duplicate_row(template_row, target_row=snapshot.row_number(len(snapshot)))
     
     def update_cell_with_formula(self, row_number, column_number, formula):
         """Обновить ячейку формулой"""
@@ -210,35 +1039,63 @@ class GoogleSheetsService:
                 formula = '=' + formula
             
             # Обновляем ячейку формулой
-            self.worksheet.update_cell(row_number, column_number, formula)
+            result = self._write_cells([(row_number, column_number, formula)])
             
             self.logger.info(f"Ячейка [{row_number}, {column_number}] обновлена формулой: {formula}")
-            return True
+            return result
             
         except Exception as e:
             self.logger.error(f"Ошибка обновления ячейки формулой: {e}")
             return False
     
+    def _fetch_formulas(self):
+        """Все формулы листа одним запросом с valueRenderOption=FORMULA
+        
+        Возвращает {(строка, столбец): формула} только для ячеек с формулами (номера с 1).
+        """
+        result = self.worksheet.spreadsheet.values_batch_get(
+            [absolute_range_name(self.worksheet.title)],
+            params={'valueRenderOption': 'FORMULA'}
+        )
+        values = result['valueRanges'][0].get('values', []) if result.get('valueRanges') else []
+        
+        formulas = {}
+        for row_number, row in enumerate(values, start=1):
+            for column_number, value in enumerate(row, start=1):
+                if isinstance(value, str) and value.startswith('='):
+                    formulas[(row_number, column_number)] = value
+        
+        self.logger.info(f"Загружены формулы листа: {len(formulas)}")
+        return formulas
+    
+    def get_formula_grid(self):
+        """Формулы листа, кэшированные вместе со снимком значений
+        
+        Живут столько же, сколько снимок, и сбрасываются вместе с ним после записи.
+        """
+        return self.get_snapshot().derived('formulas', lambda snapshot: self._fetch_formulas())
+    
     def get_cell_formula(self, row_number, column_number):
-        """Получить формулу из ячейки"""
+        """Получить формулу из ячейки (None, если в ячейке нет формулы)"""
         try:
-            # Получаем формулу через batch_get с параметром valueRenderOption
-            range_name = f"{self.worksheet.title}!{chr(64 + column_number)}{row_number}"
-            result = self.client.values_batch_get(
-                self.worksheet.spreadsheet.id,
-                ranges=[range_name],
-                valueRenderOption='FORMULA'
-            )
-            
-            if result.get('valueRanges') and result['valueRanges'][0].get('values'):
-                formula = result['valueRanges'][0]['values'][0][0]
-                return formula
-            
+            return self.get_formula_grid().get((row_number, column_number))
+        except Exception as e:
+            self.logger.error(f"Ошибка получения формулы {rowcol_to_a1(row_number, column_number)}: {e}")
             return None
-            
+    
+    def get_range_formulas(self, start_row, start_col, end_row, end_col):
+        """Формулы прямоугольного диапазона: список (строка, столбец, формула) по строкам"""
+        try:
+            grid = self.get_formula_grid()
         except Exception as e:
-            self.logger.error(f"Ошибка получения формулы: {e}")
+            self.logger.error(f"Ошибка получения формул диапазона: {e}")
             return None
+        
+        return sorted(
+            (row, col, formula)
+            for (row, col), formula in grid.items()
+            if start_row <= row <= end_row and start_col <= col <= end_col
+        )
     
     def validate_formula(self, formula):
         """Проверить корректность формулы"""
@@ -257,13 +1114,25 @@ class GoogleSheetsService:
                 if char in formula_lower:
                     return False, f"Недопустимый элемент в формуле: {char}"
             
-            # Проверка парности скобок
-            open_brackets = formula.count('(')
-            close_brackets = formula.count(')')
-            if open_brackets != close_brackets:
-                return False, "Неправильное количество скобок в формуле"
+            # Разбор формулы: синтаксис, скобки, число аргументов известных функций
+            try:
+                parse_formula(formula)
+            except FormulaError as e:
+                return False, str(e)
             
             return True, "Формула корректна"
             
         except Exception as e:
             return False, f"Ошибка валидации: {str(e)}"
+    
+    def preview_formula(self, formula, row_number=None, column_number=None):
+        """Вычислить формулу локально по снимку листа, ничего не записывая
+        
+        Возвращает (значение, None) или (None, причина, по которой предпросмотр
+        недоступен). Ошибки синтаксиса пробрасываются как FormulaError.
+        """
+        target = (row_number, column_number) if row_number and column_number else None
+        try:
+            return evaluate_formula(formula, self.get_snapshot(), target), None
+        except UnsupportedFormula as e:
+            return None, str(e)
@@ -1,13 +1,32 @@
+import asyncio
+import itertools
 import logging
+import os
+import tempfile
+import time
+from datetime import datetime
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import (
+    Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent, FSInputFile
+)
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
+from bulk_edit import parse_bulk_edit
+from config import Config
+from exporter import EXPORT_FORMATS, ExportError, create_export_writer
+from formula import FormulaError, cell_name
 from google_sheets import GoogleSheetsService
+from importer import ImportFileError, ImportReport, detect_format, iter_file_rows, map_columns, prepare_rows
 from keyboards import Keyboards
+from prefetch import PrefetchBudget, RenderedPages
+from query import QueryError
+from rendering import MessageBuilder, escape_html, split_message
+from search_cursor import SearchSessions
+from undo import UndoHistory
 from utils import format_row_data, format_search_results, format_columns_list, escape_markdown
+from write_journal import QUEUED
 
 # Определение состояний для FSM
 class EditStates(StatesGroup):
@@ -25,12 +44,55 @@ class FormulaStates(StatesGroup):
     waiting_for_cell_position = State()
     waiting_for_formula = State()
     waiting_for_validation = State()
+    waiting_for_apply = State()
+
+class DeleteStates(StatesGroup):
+    waiting_for_confirm = State()
+
+class BulkEditStates(StatesGroup):
+    waiting_for_query = State()
+    waiting_for_column = State()
+    waiting_for_value = State()
+    waiting_for_confirm = State()
+
+class ImportStates(StatesGroup):
+    waiting_for_file = State()
+
+# Ограничение Bot API на скачивание файлов ботом
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
+
+# Строк на странице "Все строки"
+ROWS_PER_PAGE = 5
+
+# Сколько строк можно удалить одной командой /delete
+MAX_DELETE_ROWS = 10000
+
+# Приписка к ответу, когда запись отложена в журнал до восстановления доступа к таблице
+QUEUED_NOTE = "🕓 Таблица сейчас недоступна: изменение сохранено и будет записано автоматически."
 
 class BotHandlers:
     def __init__(self, sheets_service: GoogleSheetsService):
         self.sheets_service = sheets_service
         self.router = Router()
         self.logger = logging.getLogger(__name__)
+        # Последний результат поиска каждого пользователя (для листания без повторного поиска)
+        self.search_sessions = SearchSessions(Config.PAGINATION_PIN_TTL)
+        # Версия снимка, закрепленная за листанием "Все строки" каждого пользователя
+        self.browse_sessions = {}
+        # Сортировка "Все строки" каждого пользователя: (номер столбца, по убыванию)
+        self.browse_sorts = {}
+        # Последний inline-запрос каждого пользователя: (маркер, время) - для подавления дребезга
+        self.inline_requests = {}
+        # Фоновые задачи экспорта: user_id -> asyncio.Task
+        self.export_jobs = {}
+        # Фоновые задачи импорта: user_id -> asyncio.Task
+        self.import_jobs = {}
+        # Предзагрузка соседних страниц и строк: бюджет запросов, готовые страницы, задачи
+        self.prefetch_budget = PrefetchBudget(Config.PREFETCH_REQUESTS_PER_MINUTE)
+        self.rendered_pages = RenderedPages()
+        self.prefetch_jobs = {}
+        # История изменений для /undo
+        self.undo_history = UndoHistory(Config.UNDO_HISTORY_PER_USER, Config.UNDO_HISTORY_SIZE)
         self.setup_handlers()
     
     def setup_handlers(self):
@@ -41,6 +103,11 @@ class BotHandlers:
         self.router.message.register(self.row_command, Command("row"))
         self.router.message.register(self.cols_command, Command("cols"))
         self.router.message.register(self.edit_command, Command("edit"))
+        self.router.message.register(self.export_command, Command("export"))
+        self.router.message.register(self.import_command, Command("import"))
+        self.router.message.register(self.bulk_command, Command("bulk"))
+        self.router.message.register(self.delete_command, Command("delete"))
+        self.router.message.register(self.undo_command, Command("undo"))
         
         # Обработчики кнопок главного меню
         self.router.message.register(self.handle_search_button, F.text == "🔍 Поиск по значению")
@@ -64,13 +131,36 @@ class BotHandlers:
         self.router.callback_query.register(self.handle_back_to_menu, F.data == "back_to_menu")
         self.router.callback_query.register(self.handle_action_callback, F.data.startswith("action:"))
         self.router.callback_query.register(self.handle_pagination, F.data.startswith("page:"))
+        self.router.callback_query.register(self.handle_search_pagination, F.data.startswith("spage:"))
         self.router.callback_query.register(self.handle_fill_field, F.data.startswith("fill_field:"))
-        self.router.callback_query.register(self.handle_save_new_row, F.data == "save_new_row")
+        self.router.callback_query.register(
+            self.handle_save_new_row, (F.data == "save_new_row") | (F.data == "save_new_row:force")
+        )
+        self.router.callback_query.register(self.handle_edit_new_row, F.data == "edit_new_row")
+        self.router.callback_query.register(self.handle_pick_value, F.data.startswith("pick_value:"))
+        self.router.callback_query.register(self.handle_rows_sort_menu, F.data == "rows_sort")
+        self.router.callback_query.register(self.handle_sort_rows, F.data.startswith("sort_rows:"))
         self.router.callback_query.register(self.handle_clear_new_row, F.data == "clear_new_row")
         self.router.callback_query.register(self.handle_cancel_new_row, F.data == "cancel_new_row")
         self.router.callback_query.register(self.handle_formula_callback, F.data.startswith("formula:"))
         self.router.callback_query.register(self.handle_example_callback, F.data.startswith("example:"))
         self.router.callback_query.register(self.handle_back_to_formulas, F.data == "back_to_formulas")
+        self.router.callback_query.register(
+            self.handle_bulk_column, F.data.startswith("bulk_col:"), BulkEditStates.waiting_for_column
+        )
+        self.router.callback_query.register(
+            self.handle_bulk_apply, F.data == "bulk_apply", BulkEditStates.waiting_for_confirm
+        )
+        self.router.callback_query.register(self.handle_delete_row, F.data.startswith("delete_row:"))
+        self.router.callback_query.register(
+            self.handle_duplicate_row, F.data.startswith("dup_row:") | F.data.startswith("tpl_row:")
+        )
+        self.router.callback_query.register(
+            self.handle_delete_apply, F.data == "delete_apply", DeleteStates.waiting_for_confirm
+        )
+        
+        # Inline-режим (@bot запрос)
+        self.router.inline_query.register(self.handle_inline_query)
         
         # Обработчики состояний FSM
         self.router.message.register(self.handle_new_value_input, EditStates.waiting_for_new_value)
@@ -81,6 +171,9 @@ class BotHandlers:
         self.router.message.register(self.handle_cell_position_input, FormulaStates.waiting_for_cell_position)
         self.router.message.register(self.handle_formula_input, FormulaStates.waiting_for_formula)
         self.router.message.register(self.handle_validation_input, FormulaStates.waiting_for_validation)
+        self.router.message.register(self.handle_import_file, ImportStates.waiting_for_file)
+        self.router.message.register(self.handle_bulk_query_input, BulkEditStates.waiting_for_query)
+        self.router.message.register(self.handle_bulk_value_input, BulkEditStates.waiting_for_value)
         
         # Временный отладочный обработчик для всех текстовых сообщений
         self.router.message.register(self.handle_unhandled_text)
@@ -107,6 +200,8 @@ class BotHandlers:
 
 **Пример использования:**
 `/find test@email.com`
+`/find Статус=Новый AND Цена>100`
+`/find ~Иванов` - с учетом опечаток
 `/row 5`
 `/edit 10`
 
@@ -132,17 +227,69 @@ class BotHandlers:
         await message.answer("🔍 Выполняю поиск...")
         
         # Поиск в таблице
-        found_rows = self.sheets_service.search_in_sheet(search_value)
+        cursor, error_text = await asyncio.to_thread(self._run_search, search_value)
         
-        if not found_rows:
-            await message.answer(f"🔍 По запросу '**{escape_markdown(search_value)}**' ничего не найдено.", parse_mode="Markdown")
+        if error_text:
+            await message.answer(error_text)
             return
         
-        # Форматируем результаты
-        results_text = format_search_results(found_rows, search_value)
-        keyboard = Keyboards.create_row_selection_keyboard(found_rows)
+        # Первая страница отправляется сразу, остальные ищутся при листании
+        page_rows, _ = cursor.page(1)
+        
+        if not page_rows:
+            await message.answer(
+                f"🔍 По запросу '**{escape_markdown(search_value)}**' ничего не найдено."
+                f"{self._fuzzy_hint(search_value)}",
+                parse_mode="Markdown"
+            )
+            return
+        
+        self.search_sessions.put(user_id, cursor)
+        await self._send_search_page(message, cursor, page=1, user_id=user_id)
+    
+    def _run_search(self, search_value):
+        """Выполнить поиск, вернуть (курсор по результатам, текст ошибки)
+        
+        Запрос, начинающийся с "~", выполняется как нечеткий поиск с учетом опечаток.
+        """
+        try:
+            if search_value.startswith('~'):
+                fuzzy_value = search_value[1:].strip()
+                if not fuzzy_value:
+                    return None, "❌ Укажите значение после ~"
+                return self.sheets_service.fuzzy_cursor(fuzzy_value), None
+            
+            return self.sheets_service.query_cursor(search_value), None
+        except QueryError as e:
+            return None, f"❌ Ошибка в запросе: {e}"
+        except Exception as e:
+            self.logger.error(f"Ошибка поиска по запросу '{search_value}': {e}")
+            return None, "❌ Ошибка поиска. Попробуйте позже."
+    
+    async def _send_search_page(self, message, cursor, page=1, edit_message=False, user_id=None):
+        """Отправить страницу результатов поиска с клавиатурой пагинации"""
+        page_rows, total_pages = cursor.page(page)
+        
+        results_text = format_search_results(
+            page_rows, cursor.search_value,
+            page=page, per_page=cursor.per_page,
+            total_rows=cursor.found_count, total_known=cursor.total_known
+        )
+        keyboard = Keyboards.create_pagination_keyboard(
+            page, total_pages, page_rows, "spage", total_known=cursor.total_known,
+            row_refs=[self.sheets_service.row_ref(row_info['row_number'], cursor.snapshot) for row_info in page_rows]
+        )
+        await self._send_text(message, results_text, keyboard, "Markdown", edit_message=edit_message)
         
-        await message.answer(results_text, reply_markup=keyboard, parse_mode="Markdown")
+        if user_id is not None:
+            self._schedule_prefetch(user_id, self._prefetch_search(user_id, cursor, page, page_rows))
+    
+    @staticmethod
+    def _fuzzy_hint(search_value):
+        """Подсказка о нечетком поиске, если обычный ничего не нашел"""
+        if search_value.startswith('~'):
+            return ""
+        return f"\n\n💡 Попробуйте поиск с учетом опечаток: `~{search_value}`"
     
     async def row_command(self, message: Message):
         """Обработчик команды /row"""
@@ -175,9 +322,9 @@ class BotHandlers:
         # Форматируем данные
         columns = self.sheets_service.get_columns()
         formatted_text = format_row_data(row_data, columns)
-        keyboard = Keyboards.create_row_actions_keyboard(row_number)
+        keyboard = Keyboards.create_row_actions_keyboard(row_number, self.sheets_service.row_ref(row_number))
         
-        await message.answer(formatted_text, reply_markup=keyboard, parse_mode="Markdown")
+        await self._send_text(message, formatted_text, keyboard, "Markdown")
     
     async def cols_command(self, message: Message):
         """Обработчик команды /cols"""
@@ -219,16 +366,33 @@ class BotHandlers:
         
         # Показываем выбор полей для редактирования
         columns = self.sheets_service.get_columns()
-        keyboard = Keyboards.create_edit_field_keyboard(row_number, columns)
+        keyboard = Keyboards.create_edit_field_keyboard(row_number, columns, self.sheets_service.row_ref(row_number))
         
-        formatted_text = format_row_data(row_data, columns)
-        await message.answer(f"{formatted_text}\n\n📝 **Выберите поле для редактирования:**", 
-                           reply_markup=keyboard, parse_mode="Markdown")
+        chunks = MessageBuilder().extend(format_row_data(row_data, columns))
+        chunks.add("\n📝 **Выберите поле для редактирования:**")
+        await self._send_text(message, chunks.build(), keyboard, "Markdown")
+    
+    def _callback_row(self, callback_data, ref_position=2):
+        """Текущий номер строки из callback-данных кнопки (None, если строка удалена)
+        
+        Номер в кнопке мог устареть после вставок и удалений строк; ссылка на
+        строку в позиции ref_position разрешается в ее текущий номер.
+        """
+        data_parts = callback_data.split(":")
+        row_number = int(data_parts[1])
+        row_ref = data_parts[ref_position] if len(data_parts) > ref_position else None
+        current = self.sheets_service.resolve_row(row_number, row_ref)
+        if current is not None and current != row_number:
+            self.logger.info(f"Строка {row_number} из кнопки сейчас имеет номер {current}")
+        return current
     
     async def handle_row_selection(self, callback: CallbackQuery):
         """Обработчик выбора строки из результатов поиска"""
         user_id = callback.from_user.id
-        row_number = int(callback.data.split(":")[1])
+        row_number = self._callback_row(callback.data)
+        if row_number is None:
+            await callback.answer("❌ Строка удалена", show_alert=True)
+            return
         
         self.logger.info(f"Пользователь {user_id} выбрал строку {row_number}")
         
@@ -242,20 +406,23 @@ class BotHandlers:
         # Форматируем данные
         columns = self.sheets_service.get_columns()
         formatted_text = format_row_data(row_data, columns)
-        keyboard = Keyboards.create_row_actions_keyboard(row_number)
+        keyboard = Keyboards.create_row_actions_keyboard(row_number, self.sheets_service.row_ref(row_number))
         
-        await callback.message.edit_text(formatted_text, reply_markup=keyboard, parse_mode="Markdown")
+        await self._send_text(callback.message, formatted_text, keyboard, "Markdown", edit_message=True)
         await callback.answer()
     
     async def handle_edit_row(self, callback: CallbackQuery):
         """Обработчик начала редактирования строки"""
         user_id = callback.from_user.id
-        row_number = int(callback.data.split(":")[1])
+        row_number = self._callback_row(callback.data)
+        if row_number is None:
+            await callback.answer("❌ Строка удалена", show_alert=True)
+            return
         
         self.logger.info(f"Пользователь {user_id} начинает редактирование строки {row_number}")
         
         columns = self.sheets_service.get_columns()
-        keyboard = Keyboards.create_edit_field_keyboard(row_number, columns)
+        keyboard = Keyboards.create_edit_field_keyboard(row_number, columns, self.sheets_service.row_ref(row_number))
         
         await callback.message.edit_text(
             f"📝 **Редактирование строки {row_number}**\n\nВыберите поле для изменения:",
@@ -268,19 +435,24 @@ class BotHandlers:
         """Обработчик выбора поля для редактирования"""
         user_id = callback.from_user.id
         data_parts = callback.data.split(":")
-        row_number = int(data_parts[1])
+        row_number = self._callback_row(callback.data, ref_position=3)
         column_number = int(data_parts[2])
+        if row_number is None:
+            await callback.answer("❌ Строка удалена", show_alert=True)
+            return
         
         columns = self.sheets_service.get_columns()
         column_name = columns[column_number - 1] if column_number <= len(columns) else f"Столбец {column_number}"
         
         self.logger.info(f"Пользователь {user_id} редактирует поле '{column_name}' в строке {row_number}")
         
-        # Сохраняем данные в состояние
+        # Сохраняем данные в состояние; ссылка на строку переживет сдвиг строк до ввода значения
         await state.update_data({
             'row_number': row_number,
+            'row_ref': self.sheets_service.row_ref(row_number),
             'column_number': column_number,
-            'column_name': column_name
+            'column_name': column_name,
+            'schema_version': self.sheets_service.schema.version
         })
         
         await state.set_state(EditStates.waiting_for_new_value)
@@ -306,15 +478,29 @@ class BotHandlers:
         
         self.logger.info(f"Пользователь {user_id} обновляет '{column_name}' в строке {row_number} на '{new_value}'")
         
-        # Обновляем ячейку
-        success = self.sheets_service.update_cell(row_number, column_number, new_value)
+        if self._schema_changed(data):
+            await state.clear()
+            await message.answer("⚠️ Столбцы таблицы изменились. Выберите поле для редактирования заново.")
+            return
+        
+        row_number = self.sheets_service.resolve_row(row_number, data.get('row_ref'))
+        if row_number is None:
+            await state.clear()
+            await message.answer("❌ Строка удалена, пока вы вводили значение.")
+            return
+        
+        # Обновляем ячейку (старое значение запоминается для /undo до записи)
+        records = self.sheets_service.edit_records([(row_number, column_number, new_value)])
+        success = await asyncio.to_thread(self.sheets_service.update_cell, row_number, column_number, new_value)
         
         if success:
+            self._record_undo(user_id, records)
             await message.answer(
                 f"✅ **Поле обновлено успешно!**\n\n"
                 f"Строка: {row_number}\n"
                 f"Поле: {column_name}\n"
-                f"Новое значение: {new_value}",
+                f"Новое значение: {new_value}"
+                + (f"\n\n{QUEUED_NOTE}" if success == QUEUED else ""),
                 parse_mode="Markdown"
             )
         else:
@@ -326,7 +512,10 @@ class BotHandlers:
     async def handle_refresh_row(self, callback: CallbackQuery):
         """Обработчик обновления отображения строки"""
         user_id = callback.from_user.id
-        row_number = int(callback.data.split(":")[1])
+        row_number = self._callback_row(callback.data)
+        if row_number is None:
+            await callback.answer("❌ Строка удалена", show_alert=True)
+            return
         
         self.logger.info(f"Пользователь {user_id} обновляет отображение строки {row_number}")
         
@@ -340,15 +529,18 @@ class BotHandlers:
         # Форматируем данные
         columns = self.sheets_service.get_columns()
         formatted_text = format_row_data(row_data, columns)
-        keyboard = Keyboards.create_row_actions_keyboard(row_number)
+        keyboard = Keyboards.create_row_actions_keyboard(row_number, self.sheets_service.row_ref(row_number))
         
-        await callback.message.edit_text(formatted_text, reply_markup=keyboard, parse_mode="Markdown")
+        await self._send_text(callback.message, formatted_text, keyboard, "Markdown", edit_message=True)
         await callback.answer("🔄 Данные обновлены")
     
     async def handle_back_to_row(self, callback: CallbackQuery):
         """Обработчик возврата к просмотру строки"""
         user_id = callback.from_user.id
-        row_number = int(callback.data.split(":")[1])
+        row_number = self._callback_row(callback.data)
+        if row_number is None:
+            await callback.answer("❌ Строка удалена", show_alert=True)
+            return
         
         self.logger.info(f"Пользователь {user_id} возвращается к просмотру строки {row_number}")
         
@@ -362,11 +554,32 @@ class BotHandlers:
         # Форматируем данные
         columns = self.sheets_service.get_columns()
         formatted_text = format_row_data(row_data, columns)
-        keyboard = Keyboards.create_row_actions_keyboard(row_number)
+        keyboard = Keyboards.create_row_actions_keyboard(row_number, self.sheets_service.row_ref(row_number))
         
-        await callback.message.edit_text(formatted_text, reply_markup=keyboard, parse_mode="Markdown")
+        await self._send_text(callback.message, formatted_text, keyboard, "Markdown", edit_message=True)
         await callback.answer()
     
+    def _schema_changed(self, data):
+        """Изменились ли столбцы таблицы с момента, когда пользователь выбрал столбец"""
+        self.sheets_service.get_columns()  # Перепроверяет заголовки, если пора
+        saved_version = data.get('schema_version')
+        return saved_version is not None and saved_version != self.sheets_service.schema.version
+    
+    async def _send_text(self, message, text, reply_markup=None, parse_mode=None, edit_message=False):
+        """Отправить текст с разбиением по лимиту Telegram (клавиатура - у последней части)
+        
+        text - строка или уже разбитый список сообщений (MessageBuilder.build()).
+        """
+        chunks = split_message(text) if isinstance(text, str) else text
+        last_index = len(chunks) - 1
+        
+        for i, chunk in enumerate(chunks):
+            markup = reply_markup if i == last_index else None
+            if edit_message and i == 0:
+                await message.edit_text(chunk, reply_markup=markup, parse_mode=parse_mode)
+            else:
+                await message.answer(chunk, reply_markup=markup, parse_mode=parse_mode)
+    
     async def handle_confirm_action(self, callback: CallbackQuery):
         """Обработчик подтверждения действий"""
         await callback.answer("✅ Действие подтверждено")
@@ -420,7 +633,7 @@ class BotHandlers:
         
         for i, column_name in enumerate(columns, 1):
             if column_name:
-                safe_column = str(column_name).replace('<', '&lt;').replace('>', '&gt;').replace('&', '&amp;')
+                safe_column = escape_html(column_name)
                 text_parts.append(f"{i}. <b>{safe_column}</b>")
             else:
                 text_parts.append(f"{i}. <i>(пустой столбец)</i>")
@@ -456,6 +669,22 @@ class BotHandlers:
 /row [номер] - получить строку
 /cols - показать столбцы
 /edit [номер] - редактировать строку
+/export [csv|xlsx] [запрос] - выгрузить таблицу или результаты поиска
+/import - загрузить строки из файла CSV/XLSX
+/bulk [запрос] - изменить столбец во всех найденных строках
+/delete [номера] - удалить строки, например `/delete 5 8-12`
+/undo [N] - отменить свои последние N изменений (по умолчанию одно)
+
+**Запросы поиска:**
+• `Столбец:текст` - текст в указанном столбце
+• `Столбец=значение` - точное совпадение, `!=` - не равно
+• `Цена>100`, `Дата>2026-01-01` - сравнение чисел и дат
+• `Цена:100..500` - диапазон значений
+• `AND`, `OR`, `NOT` (или `-`), скобки для группировки
+• `~значение` - нечеткий поиск с учетом опечаток
+
+**Inline-режим:**
+Наберите `@имя_бота запрос` в любом чате - бот покажет подходящие строки.
 
 **Навигация по страницам:**
 • ⬅️ ➡️ - переход между страницами
@@ -514,20 +743,22 @@ class BotHandlers:
         await message.answer("🔍 Выполняю поиск...")
         
         # Поиск в таблице
-        found_rows = self.sheets_service.search_in_sheet(search_value)
+        cursor, error_text = await asyncio.to_thread(self._run_search, search_value)
+        page_rows = cursor.page(1)[0] if cursor else []
         
-        if not found_rows:
+        if error_text:
+            await message.answer(error_text, reply_markup=Keyboards.create_back_to_menu_keyboard())
+        elif not page_rows:
             keyboard = Keyboards.create_back_to_menu_keyboard()
             await message.answer(
-                f"🔍 По запросу '**{escape_markdown(search_value)}**' ничего не найдено.", 
+                f"🔍 По запросу '**{escape_markdown(search_value)}**' ничего не найдено."
+                f"{self._fuzzy_hint(search_value)}",
                 reply_markup=keyboard,
                 parse_mode="Markdown"
             )
         else:
-            # Форматируем результаты
-            results_text = format_search_results(found_rows, search_value)
-            keyboard = Keyboards.create_row_selection_keyboard(found_rows)
-            await message.answer(results_text, reply_markup=keyboard, parse_mode="Markdown")
+            self.search_sessions.put(user_id, cursor)
+            await self._send_search_page(message, cursor, page=1, user_id=user_id)
         
         await state.clear()
     
@@ -555,9 +786,9 @@ class BotHandlers:
                 # Форматируем данные
                 columns = self.sheets_service.get_columns()
                 formatted_text = format_row_data(row_data, columns)
-                keyboard = Keyboards.create_row_actions_keyboard(row_number)
+                keyboard = Keyboards.create_row_actions_keyboard(row_number, self.sheets_service.row_ref(row_number))
                 
-                await message.answer(formatted_text, reply_markup=keyboard, parse_mode="Markdown")
+                await self._send_text(message, formatted_text, keyboard, "Markdown")
             
         except ValueError:
             await message.answer("❌ Введите корректный номер строки (число)")
@@ -589,9 +820,9 @@ class BotHandlers:
                 # Показываем данные и кнопки редактирования
                 columns = self.sheets_service.get_columns()
                 formatted_text = format_row_data(row_data, columns)
-                keyboard = Keyboards.create_row_actions_keyboard(row_number)
+                keyboard = Keyboards.create_row_actions_keyboard(row_number, self.sheets_service.row_ref(row_number))
                 
-                await message.answer(formatted_text, reply_markup=keyboard, parse_mode="Markdown")
+                await self._send_text(message, formatted_text, keyboard, "Markdown")
             
         except ValueError:
             await message.answer("❌ Введите корректный номер строки (число)")
@@ -642,21 +873,22 @@ class BotHandlers:
         try:
             await message.answer("📄 Загружаю все строки...")
             
-            # Получаем первую страницу
-            await self._send_rows_page(message, page=1)
+            # Получаем первую страницу; новый просмотр закрепляет актуальную версию снимка
+            self._release_browse_session(user_id)
+            self.browse_sorts.pop(user_id, None)
+            await self._send_rows_page(message, page=1, user_id=user_id)
         except Exception as e:
             self.logger.error(f"Ошибка в handle_all_rows_button: {e}")
             await message.answer("❌ Произошла ошибка при загрузке строк. Попробуйте позже.")
     
-    async def _send_rows_page(self, message, page=1, edit_message=False):
+    async def _send_rows_page(self, message, page=1, edit_message=False, user_id=None):
         """Отправить страницу со строками"""
         try:
-            rows_per_page = 5
-            self.logger.info(f"Запрос страницы {page} с {rows_per_page} строками на страницу")
+            self.logger.info(f"Запрос страницы {page} с {ROWS_PER_PAGE} строками на страницу")
             
-            page_rows, total_pages, total_rows = self.sheets_service.get_all_rows_paginated(page, rows_per_page)
-            
-            self.logger.info(f"Получено: {len(page_rows)} строк, страниц: {total_pages}, всего строк: {total_rows}")
+            snapshot = await self._browse_snapshot(user_id)
+            sort = self.browse_sorts.get(user_id)
+            result_text, keyboard, page_rows, total_pages = self._render_rows_page(page, snapshot, sort)
             
             if not page_rows:
                 keyboard = Keyboards.create_back_to_menu_keyboard()
@@ -668,42 +900,19 @@ class BotHandlers:
                     await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
                 return
             
-            # Формируем текст с информацией о строках
-            text_parts = [
-                f"📄 <b>Все строки</b> (Страница {page}/{total_pages})",
-                f"📊 Всего строк: {total_rows}",
-                "",
-                "<b>Строки на текущей странице:</b>"
-            ]
-            
-            # Добавляем информацию о каждой строке
-            columns = self.sheets_service.get_columns()
-            for row_info in page_rows:
-                row_number = row_info['row_number']
-                row_data = row_info['data']
-                
-                # Создаем краткое описание строки
-                preview_parts = []
-                for i, value in enumerate(row_data[:3]):  # Первые 3 значения
-                    if value and i < len(columns):
-                        column_name = columns[i] if i < len(columns) else f"Col{i+1}"
-                        safe_column = str(column_name).replace('<', '&lt;').replace('>', '&gt;').replace('&', '&amp;')
-                        safe_value = str(value)[:20].replace('<', '&lt;').replace('>', '&gt;').replace('&', '&amp;')
-                        preview_parts.append(f"{safe_column}: {safe_value}")
-                
-                preview = " | ".join(preview_parts) if preview_parts else "Пустая строка"
-                text_parts.append(f"<b>[{row_number}]</b> {preview}")
-            
-            text_parts.append("")
-            text_parts.append("👆 Нажмите на строку для просмотра или выберите действие:")
-            
-            result_text = "\n".join(text_parts)
-            keyboard = Keyboards.create_pagination_keyboard(page, total_pages, page_rows, "page")
+            current_version = self.sheets_service.current_version()
+            if current_version is not None and current_version != snapshot.version:
+                result_text += "\n\nℹ️ Таблица изменилась после начала просмотра. Откройте список заново, чтобы увидеть изменения."
             
             if edit_message:
                 await message.edit_text(result_text, reply_markup=keyboard, parse_mode="HTML")
             else:
                 await message.answer(result_text, reply_markup=keyboard, parse_mode="HTML")
+            
+            if user_id is not None:
+                self._schedule_prefetch(
+                    user_id, self._prefetch_rows_pages(user_id, snapshot, page, total_pages, page_rows, sort)
+                )
         
         except Exception as e:
             self.logger.error(f"Ошибка в _send_rows_page: {e}")
@@ -713,6 +922,158 @@ class BotHandlers:
             else:
                 await message.answer(error_text)
     
+    async def _browse_snapshot(self, user_id):
+        """Снимок, по которому листает пользователь
+        
+        Первое обращение закрепляет текущую версию снимка; дальше страницы
+        строятся по ней, пока пользователь не откроет список заново. Если
+        версия освобождена за давностью, закрепляется текущая.
+        """
+        pins = self.sheets_service.pins
+        version = self.browse_sessions.get(user_id)
+        snapshot = pins.get(version) if version is not None else None
+        if snapshot is None:
+            snapshot = await asyncio.to_thread(self.sheets_service.get_snapshot)
+            if user_id is not None:
+                self.browse_sessions[user_id] = pins.pin(snapshot)
+                self.logger.debug(f"Пользователь {user_id} листает снимок v{snapshot.version}, закреплено версий: {len(pins)}")
+        return snapshot
+    
+    def _release_browse_session(self, user_id):
+        """Освободить версию снимка, закрепленную за прежним просмотром пользователя"""
+        version = self.browse_sessions.pop(user_id, None)
+        if version is not None:
+            self.sheets_service.pins.release(version)
+    
+    def _render_rows_page(self, page, snapshot, sort=None):
+        """Текст, клавиатура, строки и число страниц для страницы "Все строки" по снимку snapshot
+        
+        Готовые страницы кэшируются по версии снимка и сортировке: страница,
+        подготовленная предзагрузкой, показывается без повторной сборки.
+        """
+        key = ('rows', snapshot.version, sort, page)
+        rendered = self.rendered_pages.get(key)
+        if rendered is not None:
+            return rendered
+        
+        page_rows, total_pages, total_rows = self.sheets_service.get_all_rows_paginated(
+            page, ROWS_PER_PAGE, snapshot, sort
+        )
+        self.logger.info(f"Получено: {len(page_rows)} строк, страниц: {total_pages}, всего строк: {total_rows}")
+        if not page_rows:
+            return None, None, page_rows, total_pages
+        
+        # Формируем текст с информацией о строках
+        columns = self.sheets_service.get_columns()
+        text_parts = [
+            f"📄 <b>Все строки</b> (Страница {page}/{total_pages})",
+            f"📊 Всего строк: {total_rows}",
+            "",
+            "<b>Строки на текущей странице:</b>"
+        ]
+        if sort is not None:
+            column_number, descending = sort
+            column_name = columns[column_number - 1] if column_number <= len(columns) else f"Col{column_number}"
+            text_parts.insert(2, f"🔃 Сортировка: {escape_html(column_name)} {'⬇️ по убыванию' if descending else '⬆️ по возрастанию'}")
+        
+        # Добавляем информацию о каждой строке
+        for row_info in page_rows:
+            row_number = row_info['row_number']
+            row_data = row_info['data']
+            
+            # Создаем краткое описание строки
+            preview_parts = []
+            for i, value in enumerate(row_data[:3]):  # Первые 3 значения
+                if value and i < len(columns):
+                    column_name = columns[i] if i < len(columns) else f"Col{i+1}"
+                    safe_column = escape_html(column_name)
+                    safe_value = escape_html(str(value)[:20])
+                    preview_parts.append(f"{safe_column}: {safe_value}")
+            
+            preview = " | ".join(preview_parts) if preview_parts else "Пустая строка"
+            text_parts.append(f"<b>[{row_number}]</b> {preview}")
+        
+        text_parts.append("")
+        text_parts.append("👆 Нажмите на строку для просмотра или выберите действие:")
+        
+        rendered = (
+            "\n".join(text_parts),
+            Keyboards.create_pagination_keyboard(
+                page, total_pages, page_rows, "page",
+                row_refs=[self.sheets_service.row_ref(row_info['row_number'], snapshot) for row_info in page_rows],
+                sort_button=True
+            ),
+            page_rows,
+            total_pages
+        )
+        self.rendered_pages.put(key, rendered)
+        return rendered
+    
+    async def handle_rows_sort_menu(self, callback: CallbackQuery):
+        """Выбор сортировки для "Все строки": столбец и направление"""
+        columns = self.sheets_service.get_columns()
+        await callback.message.edit_text(
+            "🔃 <b>Сортировка</b>\n\nВыберите столбец и направление:",
+            reply_markup=Keyboards.create_sort_keyboard(columns, self.browse_sorts.get(callback.from_user.id)),
+            parse_mode="HTML"
+        )
+        await callback.answer()
+    
+    async def handle_sort_rows(self, callback: CallbackQuery):
+        """Применить сортировку к "Все строки" и показать первую страницу той же версии снимка"""
+        user_id = callback.from_user.id
+        _, column_number, direction = callback.data.split(":")
+        column_number = int(column_number)
+        
+        if direction == "off" or column_number < 1:
+            self.browse_sorts.pop(user_id, None)
+        else:
+            self.browse_sorts[user_id] = (column_number, direction == "desc")
+        self.logger.info(f"Пользователь {user_id} сортирует строки: {self.browse_sorts.get(user_id)}")
+        
+        await self._send_rows_page(callback.message, page=1, edit_message=True, user_id=user_id)
+        await callback.answer()
+    
+    # === ПРЕДЗАГРУЗКА ===
+    
+    def _schedule_prefetch(self, user_id, coroutine):
+        """Запустить предзагрузку в фоне, отменив незавершенную предыдущую того же пользователя"""
+        previous = self.prefetch_jobs.get(user_id)
+        if previous is not None and not previous.done():
+            previous.cancel()
+        self.prefetch_jobs[user_id] = asyncio.create_task(coroutine)
+    
+    async def _prefetch_rows_pages(self, user_id, snapshot, page, total_pages, page_rows, sort=None):
+        """После показа страницы N: подготовить страницы N±1 того же снимка и загрузить строки"""
+        try:
+            # Сборка страниц из закрепленного снимка бесплатна; запросы к API - в пределах бюджета
+            for neighbour in (page + 1, page - 1):
+                if 1 <= neighbour <= total_pages:
+                    self._render_rows_page(neighbour, snapshot, sort)
+                    await asyncio.sleep(0)
+            await self._prefetch_candidate_rows(user_id, page_rows)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.warning(f"Предзагрузка страниц для пользователя {user_id} не удалась: {e}")
+    
+    async def _prefetch_search(self, user_id, cursor, page, page_rows):
+        """После показа результатов поиска: дочитать следующую страницу и загрузить первые строки"""
+        try:
+            await self._prefetch_candidate_rows(user_id, page_rows)
+            if not cursor.exhausted:
+                cursor.page(page + 1)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.warning(f"Предзагрузка результатов поиска для пользователя {user_id} не удалась: {e}")
+    
+    async def _prefetch_candidate_rows(self, user_id, page_rows):
+        """Загрузить одним запросом первые PREFETCH_ROWS строк страницы - вероятный следующий клик"""
+        row_numbers = [row_info['row_number'] for row_info in page_rows[:Config.PREFETCH_ROWS]]
+        if row_numbers and self.prefetch_budget.allow(user_id):
+            await asyncio.to_thread(self.sheets_service.prefetch_rows, row_numbers)
+    
     async def handle_pagination(self, callback: CallbackQuery):
         """Обработчик навигации по страницам"""
         user_id = callback.from_user.id
@@ -742,7 +1103,7 @@ class BotHandlers:
             self.logger.info(f"Пользователь {user_id} переходит на страницу {new_page}")
             
             # Отправляем новую страницу
-            await self._send_rows_page(callback.message, new_page, edit_message=True)
+            await self._send_rows_page(callback.message, new_page, edit_message=True, user_id=user_id)
             await callback.answer(f"📄 Страница {new_page}")
         
         except (ValueError, IndexError) as e:
@@ -751,6 +1112,681 @@ class BotHandlers:
         
         # Убираем этот дублированный callback.answer()
 
+    async def handle_search_pagination(self, callback: CallbackQuery):
+        """Обработчик листания результатов поиска"""
+        user_id = callback.from_user.id
+        data_parts = callback.data.split(":")
+        
+        cursor = self.search_sessions.get(user_id)
+        if cursor is None:
+            await callback.answer("⌛ Результаты поиска устарели, выполните поиск заново", show_alert=True)
+            return
+        
+        try:
+            action = data_parts[1]
+            current_page = int(data_parts[2])
+        except (ValueError, IndexError) as e:
+            self.logger.error(f"Ошибка обработки пагинации поиска: {e}")
+            await callback.answer("❌ Ошибка навигации")
+            return
+        
+        new_page = current_page
+        if action == "prev":
+            new_page = max(1, current_page - 1)
+        elif action == "next":
+            new_page = current_page + 1
+        
+        self.logger.info(f"Пользователь {user_id} переходит на страницу {new_page} результатов поиска")
+        
+        await self._send_search_page(callback.message, cursor, new_page, edit_message=True, user_id=user_id)
+        await callback.answer(f"📄 Страница {new_page}")
+
+    # === INLINE-РЕЖИМ ===
+    
+    async def _debounce_inline(self, user_id):
+        """Дождаться паузы в наборе; False, если за это время пришел более новый запрос"""
+        now = time.monotonic()
+        previous = self.inline_requests.get(user_id)
+        marker = object()
+        self.inline_requests[user_id] = (marker, now)
+        
+        # Первый запрос после паузы обрабатывается сразу, частые - после задержки
+        if previous is None or now - previous[1] >= Config.INLINE_DEBOUNCE:
+            return True
+        
+        await asyncio.sleep(Config.INLINE_DEBOUNCE)
+        return self.inline_requests.get(user_id, (None,))[0] is marker
+    
+    @staticmethod
+    def _inline_article(snapshot, index, columns):
+        """Карточка строки для ответа на inline-запрос"""
+        row_info = snapshot.row_info(index)
+        row_number = row_info['row_number']
+        values = [str(value) for value in row_info['data'] if value]
+        
+        title = f"[{row_number}] {' | '.join(values[:2])}"[:100] if values else f"[{row_number}]"
+        description = ' | '.join(values[2:5])[:200]
+        message_text = format_row_data(row_info, columns)[0]
+        
+        return InlineQueryResultArticle(
+            id=f"{snapshot.version}:{row_number}",
+            title=title,
+            description=description or None,
+            input_message_content=InputTextMessageContent(message_text=message_text, parse_mode="Markdown")
+        )
+    
+    async def handle_inline_query(self, inline_query: InlineQuery):
+        """Обработчик inline-запросов: ответ строится из индекса в памяти"""
+        user_id = inline_query.from_user.id
+        query_text = inline_query.query.strip()
+        
+        if not query_text:
+            await inline_query.answer([], cache_time=Config.INLINE_CACHE_TIME, is_personal=True)
+            return
+        
+        if not await self._debounce_inline(user_id):
+            return  # Пользователь продолжает печатать - ответим на более новый запрос
+        
+        try:
+            snapshot, indexes = self.sheets_service.cached_query_indexes(query_text)
+        except QueryError:
+            await inline_query.answer([], cache_time=Config.INLINE_CACHE_TIME, is_personal=True)
+            return
+        except Exception as e:
+            self.logger.error(f"Ошибка inline-поиска '{query_text}': {e}")
+            await inline_query.answer([], cache_time=0, is_personal=True)
+            return
+        
+        results_limit = 50  # Максимум результатов в одном ответе Telegram
+        offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+        page = indexes[offset:offset + results_limit]
+        next_offset = offset + results_limit
+        
+        columns = self.sheets_service.get_columns()
+        results = [self._inline_article(snapshot, index, columns) for index in page]
+        
+        self.logger.info(f"Inline-запрос пользователя {user_id} '{query_text}': {len(indexes)} строк, смещение {offset}")
+        
+        await inline_query.answer(
+            results,
+            cache_time=Config.INLINE_CACHE_TIME,
+            is_personal=True,
+            next_offset=str(next_offset) if next_offset < len(indexes) else ""
+        )
+
+    # === ЭКСПОРТ ===
+    
+    async def export_command(self, message: Message):
+        """Обработчик команды /export [csv|xlsx] [запрос]"""
+        user_id = message.from_user.id
+        args = message.text.split(maxsplit=2)[1:]
+        
+        export_format = 'csv'
+        if args and args[0].lower() in EXPORT_FORMATS:
+            export_format = args.pop(0).lower()
+        query_text = ' '.join(args).strip()
+        
+        job = self.export_jobs.get(user_id)
+        if job and not job.done():
+            await message.answer("⏳ Предыдущий экспорт еще выполняется. Дождитесь файла.")
+            return
+        
+        self.logger.info(f"Пользователь {user_id} запускает экспорт ({export_format}): '{query_text}'")
+        
+        status = await message.answer("📥 Готовлю экспорт...")
+        # Экспорт идет в фоне, бот продолжает отвечать на другие запросы
+        self.export_jobs[user_id] = asyncio.create_task(
+            self._run_export(message, status, export_format, query_text)
+        )
+    
+    async def _export_chunks(self, query_text):
+        """Порции строк для экспорта: результат запроса из снимка или весь лист из таблицы"""
+        chunk_rows = Config.EXPORT_CHUNK_ROWS
+        
+        if query_text:
+            snapshot, indexes = await asyncio.to_thread(self.sheets_service.query_indexes, query_text)
+            for start in range(0, len(indexes), chunk_rows):
+                yield [list(snapshot.rows[i]) for i in indexes[start:start + chunk_rows]]
+                await asyncio.sleep(0)
+            return
+        
+        total_rows = await asyncio.to_thread(self.sheets_service.get_sheet_row_count)
+        for start_row in range(2, total_rows + 1, chunk_rows):  # Первая строка - заголовки
+            yield await asyncio.to_thread(self.sheets_service.get_rows_chunk, start_row, chunk_rows)
+    
+    async def _run_export(self, message, status, export_format, query_text):
+        """Фоновая задача экспорта: запись файла по частям и отправка документом"""
+        user_id = message.from_user.id
+        path = None
+        
+        try:
+            fd, path = tempfile.mkstemp(suffix=f".{export_format}")
+            os.close(fd)
+            
+            writer = create_export_writer(export_format, path, self.sheets_service.get_columns())
+            written = 0
+            last_report = time.monotonic()
+            
+            try:
+                async for rows in self._export_chunks(query_text):
+                    writer.write_rows(rows)
+                    written += len(rows)
+                    
+                    # Прогресс - не чаще раза в 2 секунды, чтобы не упереться в лимиты Telegram
+                    if time.monotonic() - last_report >= 2:
+                        last_report = time.monotonic()
+                        await status.edit_text(f"📥 Экспорт: выгружено {written} строк...")
+            finally:
+                writer.close()
+            
+            filename = f"{Config.WORKSHEET_NAME}_{datetime.now():%Y%m%d_%H%M}.{export_format}"
+            caption = f"📥 Экспорт: {written} строк" + (f" по запросу «{query_text}»" if query_text else "")
+            await message.answer_document(FSInputFile(path, filename=filename), caption=caption[:1024])
+            await status.edit_text(f"✅ Экспорт готов: {written} строк")
+            
+            self.logger.info(f"Экспорт для пользователя {user_id} завершен: {written} строк")
+        
+        except QueryError as e:
+            await status.edit_text(f"❌ Ошибка в запросе: {e}")
+        except ExportError as e:
+            await status.edit_text(f"❌ {e}")
+        except Exception as e:
+            self.logger.error(f"Ошибка экспорта для пользователя {user_id}: {e}")
+            await status.edit_text("❌ Ошибка при экспорте. Попробуйте позже.")
+        finally:
+            if path and os.path.exists(path):
+                os.remove(path)
+            self.export_jobs.pop(user_id, None)
+
+    # === МАССОВОЕ ИЗМЕНЕНИЕ ===
+    
+    async def bulk_command(self, message: Message, state: FSMContext):
+        """Обработчик команды /bulk [запрос]"""
+        command_args = message.text.split(maxsplit=1)
+        
+        if len(command_args) < 2:
+            await state.set_state(BulkEditStates.waiting_for_query)
+            await message.answer(
+                "✏️ **Массовое изменение**\n\n"
+                "Введите запрос для отбора строк (как в поиске), например `Статус=Новый`:",
+                reply_markup=Keyboards.create_back_to_menu_keyboard(),
+                parse_mode="Markdown"
+            )
+            return
+        
+        await self._start_bulk_edit(message, state, command_args[1].strip())
+    
+    async def handle_bulk_query_input(self, message: Message, state: FSMContext):
+        """Обработчик ввода запроса для массового изменения"""
+        await self._start_bulk_edit(message, state, message.text.strip())
+    
+    async def _start_bulk_edit(self, message, state, query_text):
+        """Отобрать строки по запросу и предложить выбрать столбец"""
+        try:
+            _, indexes = await asyncio.to_thread(self.sheets_service.query_indexes, query_text)
+        except QueryError as e:
+            await message.answer(f"❌ Ошибка в запросе: {e}")
+            return
+        
+        if not indexes:
+            await message.answer(f"🔍 По запросу «{query_text}» ничего не найдено. Введите другой запрос:")
+            await state.set_state(BulkEditStates.waiting_for_query)
+            return
+        
+        self.logger.info(
+            f"Пользователь {message.from_user.id} начинает массовое изменение: '{query_text}' ({len(indexes)} строк)"
+        )
+        
+        await state.update_data({'bulk_query': query_text})
+        await state.set_state(BulkEditStates.waiting_for_column)
+        await message.answer(
+            f"✏️ Найдено строк: <b>{len(indexes)}</b> по запросу <code>{escape_html(query_text)}</code>\n\n"
+            "Выберите столбец для изменения:",
+            reply_markup=Keyboards.create_bulk_column_keyboard(self.sheets_service.get_columns()),
+            parse_mode="HTML"
+        )
+    
+    async def handle_bulk_column(self, callback: CallbackQuery, state: FSMContext):
+        """Обработчик выбора столбца для массового изменения"""
+        column_number = int(callback.data.split(":")[1])
+        columns = self.sheets_service.get_columns()
+        column_name = columns[column_number - 1] if column_number <= len(columns) else f"Столбец {column_number}"
+        
+        await state.update_data({
+            'bulk_column': column_number,
+            'bulk_column_name': column_name,
+            'schema_version': self.sheets_service.schema.version
+        })
+        await state.set_state(BulkEditStates.waiting_for_value)
+        
+        await callback.message.edit_text(
+            f"✏️ Столбец <b>{escape_html(column_name)}</b>\n\n"
+            "Введите новое значение для всех найденных строк\n"
+            "или замену подстроки: <code>найти =&gt; заменить</code>",
+            parse_mode="HTML"
+        )
+        await callback.answer()
+    
+    async def handle_bulk_value_input(self, message: Message, state: FSMContext):
+        """Обработчик ввода значения: предпросмотр изменений перед записью"""
+        data = await state.get_data()
+        
+        try:
+            edit = parse_bulk_edit(message.text)
+            changes = await asyncio.to_thread(
+                self.sheets_service.plan_bulk_edit, data['bulk_query'], data['bulk_column'], edit
+            )
+        except (ValueError, QueryError) as e:
+            await message.answer(f"❌ {e}")
+            return
+        
+        if not changes:
+            await message.answer("ℹ️ Ни одна строка не изменится. Введите другое значение:")
+            return
+        
+        await state.update_data({'bulk_expression': message.text})
+        await state.set_state(BulkEditStates.waiting_for_confirm)
+        
+        lines = [
+            f"✏️ <b>Предпросмотр</b>: {escape_html(edit.describe())} "
+            f"в столбце <b>{escape_html(data['bulk_column_name'])}</b>",
+            f"Изменится строк: <b>{len(changes)}</b>",
+            ""
+        ]
+        for row_number, old_value, new_value in changes[:5]:
+            lines.append(
+                f"• Строка {row_number}: <code>{escape_html(old_value[:50])}</code> → "
+                f"<code>{escape_html(new_value[:50])}</code>"
+            )
+        if len(changes) > 5:
+            lines.append(f"• ... и еще {len(changes) - 5}")
+        
+        await message.answer(
+            "\n".join(lines),
+            reply_markup=Keyboards.create_bulk_apply_keyboard(len(changes)),
+            parse_mode="HTML"
+        )
+    
+    async def handle_bulk_apply(self, callback: CallbackQuery, state: FSMContext):
+        """Применить массовое изменение одним пакетным запросом"""
+        user_id = callback.from_user.id
+        data = await state.get_data()
+        await state.clear()
+        await callback.answer()
+        
+        column_number = data['bulk_column']
+        if self._schema_changed(data):
+            await callback.message.edit_text("⚠️ Столбцы таблицы изменились. Начните массовое изменение заново.")
+            return
+        
+        try:
+            # План строится заново по актуальному снимку: таблица могла измениться после предпросмотра
+            changes = await asyncio.to_thread(
+                self.sheets_service.plan_bulk_edit,
+                data['bulk_query'], column_number, parse_bulk_edit(data['bulk_expression'])
+            )
+            if not changes:
+                await callback.message.edit_text("ℹ️ Изменять нечего: данные уже обновлены.")
+                return
+            
+            updates = [(row_number, column_number, new_value) for row_number, _, new_value in changes]
+            records = self.sheets_service.edit_records(updates)
+            await self.sheets_service.write_pacer.acquire()
+            result = await asyncio.to_thread(self.sheets_service.batch_update_cells, updates)
+        except Exception as e:
+            self.logger.error(f"Ошибка массового изменения для пользователя {user_id}: {e}")
+            await callback.message.edit_text("❌ Ошибка при массовом изменении. Попробуйте позже.")
+            return
+        
+        self._record_undo(user_id, records)
+        self.logger.info(f"Пользователь {user_id} массово изменил {len(changes)} строк")
+        await callback.message.edit_text(
+            f"✅ Изменено строк: {len(changes)}" + (f"\n\n{QUEUED_NOTE}" if result == QUEUED else ""),
+            reply_markup=Keyboards.create_back_to_menu_keyboard()
+        )
+
+    # === ОТМЕНА ИЗМЕНЕНИЙ ===
+    
+    def _record_undo(self, user_id, records):
+        """Запомнить успешную запись для /undo (records - из edit_records до записи)"""
+        if records:
+            self.undo_history.record(user_id, records, self.sheets_service.schema.version)
+    
+    async def undo_command(self, message: Message):
+        """Обработчик команды /undo [N]: вернуть значения до N последних изменений пользователя"""
+        user_id = message.from_user.id
+        command_args = message.text.split(maxsplit=1)
+        try:
+            count = int(command_args[1]) if len(command_args) > 1 else 1
+        except ValueError:
+            await message.answer("❌ Укажите число изменений.\nПример: `/undo` или `/undo 3`", parse_mode="Markdown")
+            return
+        count = min(max(1, count), self.undo_history.per_user)
+        
+        operations = self.undo_history.last(user_id, count)
+        if not operations:
+            await message.answer("ℹ️ Нет изменений, которые можно отменить.")
+            return
+        
+        self.sheets_service.get_columns()  # Перепроверяет заголовки, если пора
+        if any(op.schema_version != self.sheets_service.schema.version for op in operations):
+            await message.answer("⚠️ Столбцы таблицы изменились после этих изменений, отменить их нельзя.")
+            return
+        
+        restore, skipped = self.undo_history.plan_undo(operations)
+        try:
+            await self.sheets_service.write_pacer.acquire()
+            result, written = await asyncio.to_thread(self.sheets_service.revert_cells, restore)
+        except Exception as e:
+            self.logger.error(f"Ошибка отмены изменений для пользователя {user_id}: {e}")
+            await message.answer("❌ Ошибка при отмене изменений. Попробуйте позже.")
+            return
+        
+        self.undo_history.remove(operations)
+        self.logger.info(f"Пользователь {user_id} отменил {len(operations)} изменений ({written} ячеек)")
+        
+        text = f"↩️ Отменено изменений: {len(operations)}, восстановлено ячеек: {written}"
+        if skipped:
+            text += f"\nПропущено ячеек: {skipped} - их позже изменили другие пользователи"
+        if written < len(restore):
+            text += f"\nПропущено ячеек в удаленных строках: {len(restore) - written}"
+        if result == QUEUED:
+            text += f"\n\n{QUEUED_NOTE}"
+        await message.answer(text)
+
+    # === УДАЛЕНИЕ СТРОК ===
+    
+    @staticmethod
+    def _parse_row_numbers(text):
+        """Номера строк из текста вида "5 8-12, 20"; None, если текст не разобран"""
+        row_numbers = set()
+        for part in text.replace(',', ' ').split():
+            first, _, last = part.partition('-')
+            try:
+                first = int(first)
+                last = int(last) if last else first
+            except ValueError:
+                return None
+            if first > last:
+                first, last = last, first
+            if last - first >= MAX_DELETE_ROWS:
+                return None
+            row_numbers.update(range(first, last + 1))
+        if len(row_numbers) > MAX_DELETE_ROWS:
+            return None
+        return sorted(row_numbers) or None
+    
+    async def delete_command(self, message: Message, state: FSMContext):
+        """Обработчик команды /delete [номера строк]"""
+        command_args = message.text.split(maxsplit=1)
+        row_numbers = self._parse_row_numbers(command_args[1]) if len(command_args) > 1 else None
+        
+        if not row_numbers:
+            await message.answer(
+                f"❌ Укажите номера строк (не больше {MAX_DELETE_ROWS}).\nПример: `/delete 5` или `/delete 5 8-12`",
+                parse_mode="Markdown"
+            )
+            return
+        
+        await self._start_delete(message, state, row_numbers)
+    
+    async def handle_delete_row(self, callback: CallbackQuery, state: FSMContext):
+        """Обработчик кнопки удаления строки"""
+        row_number = self._callback_row(callback.data)
+        if row_number is None:
+            await callback.answer("❌ Строка уже удалена", show_alert=True)
+            return
+        
+        await callback.answer()
+        await self._start_delete(callback.message, state, [row_number], edit_message=True)
+    
+    async def _start_delete(self, message, state, row_numbers, edit_message=False):
+        """Показать, какие строки будут удалены, и запросить подтверждение"""
+        snapshot = await asyncio.to_thread(self.sheets_service.get_snapshot)
+        last_row = snapshot.row_number(len(snapshot) - 1)
+        
+        if row_numbers[0] < 2 or row_numbers[-1] > last_row:
+            await self._send_text(
+                message, f"❌ Номера строк должны быть от 2 до {last_row} (первая строка - заголовки).",
+                edit_message=edit_message
+            )
+            return
+        
+        # Ссылки на строки: если до подтверждения строки сдвинутся, удалятся те же самые
+        await state.update_data({
+            'delete_rows': [[row, self.sheets_service.row_ref(row)] for row in row_numbers]
+        })
+        await state.set_state(DeleteStates.waiting_for_confirm)
+        
+        columns = self.sheets_service.get_columns()
+        lines = [f"🗑️ <b>Удалить строк: {len(row_numbers)}</b>", ""]
+        for row_number in row_numbers[:5]:
+            values = snapshot.rows[snapshot.index_of(row_number)]
+            preview = " | ".join(
+                f"{escape_html(columns[i] if i < len(columns) else f'Col{i+1}')}: {escape_html(str(value)[:20])}"
+                for i, value in enumerate(values[:3]) if value
+            )
+            lines.append(f"<b>[{row_number}]</b> {preview or 'Пустая строка'}")
+        if len(row_numbers) > 5:
+            lines.append(f"… и еще {len(row_numbers) - 5}")
+        lines.extend(["", "Строки ниже сдвинутся вверх. Удалить?"])
+        
+        await self._send_text(
+            message, "\n".join(lines), Keyboards.create_delete_confirm_keyboard(len(row_numbers)),
+            "HTML", edit_message=edit_message
+        )
+    
+    async def handle_delete_apply(self, callback: CallbackQuery, state: FSMContext):
+        """Удалить подтвержденные строки одним пакетным запросом"""
+        user_id = callback.from_user.id
+        data = await state.get_data()
+        await state.clear()
+        await callback.answer()
+        
+        selected = data.get('delete_rows', [])
+        if not selected:
+            await callback.message.edit_text("ℹ️ Эти строки уже удалены.")
+            return
+        
+        if self.sheets_service.journal.has_pending():
+            await callback.message.edit_text(
+                "⏳ Таблица еще не получила отложенные изменения. Повторите удаление немного позже."
+            )
+            return
+        
+        try:
+            await self.sheets_service.write_pacer.acquire()
+            # Ссылки разрешаются в номера строк в том же вызове, что отправляет удаление
+            deleted = await asyncio.to_thread(
+                self.sheets_service.delete_rows,
+                [row_number for row_number, _ in selected], [row_ref for _, row_ref in selected]
+            )
+        except Exception as e:
+            self.logger.error(f"Ошибка удаления строк для пользователя {user_id}: {e}")
+            await callback.message.edit_text("❌ Ошибка при удалении строк. Попробуйте позже.")
+            return
+        
+        if not deleted:
+            await callback.message.edit_text("ℹ️ Эти строки уже удалены.")
+            return
+        
+        self.logger.info(f"Пользователь {user_id} удалил строк: {deleted}")
+        await callback.message.edit_text(
+            f"✅ Удалено строк: {deleted}",
+            reply_markup=Keyboards.create_back_to_menu_keyboard()
+        )
+
+    # === КОПИРОВАНИЕ СТРОК ===
+    
+    async def handle_duplicate_row(self, callback: CallbackQuery):
+        """Копия строки под ней (dup_row) или в конце таблицы как по шаблону (tpl_row)"""
+        user_id = callback.from_user.id
+        as_template = callback.data.startswith("tpl_row:")
+        # Ссылка разрешается в номер строки уже при копировании, под блокировкой записи
+        data_parts = callback.data.split(":")
+        row_number = int(data_parts[1])
+        row_ref = data_parts[2] if len(data_parts) > 2 else None
+        
+        if self.sheets_service.journal.has_pending():
+            await callback.answer(
+                "⏳ Таблица еще не получила отложенные изменения. Повторите немного позже.", show_alert=True
+            )
+            return
+        
+        await callback.answer()
+        try:
+            await self.sheets_service.write_pacer.acquire()
+            if as_template:
+                new_row_number = await asyncio.to_thread(
+                    self.sheets_service.create_row_from_template, row_number, row_ref
+                )
+            else:
+                new_row_number = await asyncio.to_thread(
+                    self.sheets_service.duplicate_row, row_number, None, row_ref
+                )
+        except Exception as e:
+            self.logger.error(f"Ошибка копирования строки {row_number} для пользователя {user_id}: {e}")
+            await callback.message.edit_text("❌ Ошибка при копировании строки. Попробуйте позже.")
+            return
+        
+        if new_row_number is None:
+            await callback.message.edit_text("❌ Строка удалена, копировать нечего.")
+            return
+        
+        self.logger.info(f"Пользователь {user_id} скопировал строку {row_number} в строку {new_row_number}")
+        
+        # Сразу предлагаем изменить отличающиеся поля новой строки
+        columns = self.sheets_service.get_columns()
+        row_data = self.sheets_service.get_row_by_number(new_row_number)
+        chunks = MessageBuilder().add(f"✅ **Строка скопирована в строку {new_row_number}**\n")
+        chunks.extend(format_row_data(row_data, columns) if row_data else [f"Строка {new_row_number}"])
+        chunks.add("\n📝 **Выберите поле, которое нужно изменить:**")
+        keyboard = Keyboards.create_edit_field_keyboard(
+            new_row_number, columns, self.sheets_service.row_ref(new_row_number)
+        )
+        await self._send_text(callback.message, chunks.build(), keyboard, "Markdown", edit_message=True)
+    
+    # === ИМПОРТ ===
+    
+    async def import_command(self, message: Message, state: FSMContext):
+        """Обработчик команды /import"""
+        job = self.import_jobs.get(message.from_user.id)
+        if job and not job.done():
+            await message.answer("⏳ Предыдущий импорт еще выполняется. Дождитесь отчета.")
+            return
+        
+        columns = self.sheets_service.get_columns()
+        await state.set_state(ImportStates.waiting_for_file)
+        await message.answer(
+            "📤 <b>Импорт строк</b>\n\n"
+            "Отправьте файл CSV или XLSX. Первая строка файла - заголовки, "
+            "они сопоставляются со столбцами таблицы по названию:\n"
+            f"<code>{escape_html(', '.join(columns))}</code>\n\n"
+            "Строки будут добавлены в конец таблицы.",
+            reply_markup=Keyboards.create_back_to_menu_keyboard(),
+            parse_mode="HTML"
+        )
+    
+    async def handle_import_file(self, message: Message, state: FSMContext):
+        """Обработчик файла для импорта"""
+        user_id = message.from_user.id
+        document = message.document
+        
+        if document is None:
+            await message.answer("❌ Отправьте файл CSV или XLSX документом.")
+            return
+        
+        file_format = detect_format(document.file_name)
+        if file_format is None:
+            await message.answer("❌ Поддерживаются только файлы .csv и .xlsx")
+            return
+        
+        if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+            await message.answer("❌ Файл слишком большой: Telegram позволяет боту скачивать файлы до 20 МБ.")
+            return
+        
+        await state.clear()
+        self.logger.info(f"Пользователь {user_id} импортирует файл '{document.file_name}'")
+        
+        status = await message.answer("📤 Загружаю файл...")
+        self.import_jobs[user_id] = asyncio.create_task(
+            self._run_import(message, status, file_format)
+        )
+    
+    async def _run_import(self, message, status, file_format):
+        """Фоновая задача импорта: потоковое чтение файла и запись порциями в пределах квоты"""
+        user_id = message.from_user.id
+        service = self.sheets_service
+        report = ImportReport()
+        path = None
+        
+        try:
+            fd, path = tempfile.mkstemp(suffix=f".{file_format}")
+            os.close(fd)
+            await message.bot.download(message.document, destination=path)
+            
+            rows = iter_file_rows(path, file_format)
+            header = await asyncio.to_thread(next, rows, None)
+            if not header:
+                await status.edit_text("❌ Файл пуст.")
+                return
+            
+            columns = service.get_columns()
+            mapping, unknown = map_columns(header, columns)
+            if not any(position is not None for position in mapping):
+                await status.edit_text(
+                    "❌ Ни один столбец файла не совпал со столбцами таблицы.\n"
+                    f"Столбцы таблицы: {', '.join(columns)}"
+                )
+                return
+            
+            prepared = prepare_rows(rows, mapping, len(columns), report)
+            last_report = time.monotonic()
+            
+            while True:
+                # Чтение и разбор порции - в отдельном потоке, файл целиком в память не загружается
+                chunk = await asyncio.to_thread(
+                    lambda: list(itertools.islice(prepared, Config.IMPORT_CHUNK_ROWS))
+                )
+                if not chunk:
+                    break
+                
+                await service.write_pacer.acquire()
+                try:
+                    await asyncio.to_thread(service.append_rows, [row for _, row in chunk])
+                    report.rows_written += len(chunk)
+                except Exception as e:
+                    self.logger.error(f"Ошибка записи порции строк {chunk[0][0]}-{chunk[-1][0]}: {e}")
+                    report.chunk_errors.append((chunk[0][0], chunk[-1][0], str(e)[:200]))
+                
+                if time.monotonic() - last_report >= 2:
+                    last_report = time.monotonic()
+                    await status.edit_text(
+                        f"📤 Импорт: прочитано {report.rows_read}, записано {report.rows_written} строк..."
+                    )
+            
+            text = "✅ Импорт завершен\n\n" + report.summary()
+            if unknown:
+                text += f"\n\nℹ️ Пропущены столбцы файла: {', '.join(unknown)}"
+            await self._send_text(status, text, edit_message=True)
+            
+            self.logger.info(
+                f"Импорт для пользователя {user_id} завершен: записано {report.rows_written} "
+                f"из {report.rows_read} строк"
+            )
+        
+        except ImportFileError as e:
+            await status.edit_text(f"❌ {e}")
+        except Exception as e:
+            self.logger.error(f"Ошибка импорта для пользователя {user_id}: {e}")
+            await status.edit_text(
+                "❌ Ошибка при импорте. Попробуйте позже.\n\n" + report.summary()
+            )
+        finally:
+            if path and os.path.exists(path):
+                os.remove(path)
+            self.import_jobs.pop(user_id, None)
+
     # === ВРЕМЕННЫЙ ОТЛАДОЧНЫЙ ОБРАБОТЧИК ===
     
     async def handle_unhandled_text(self, message: Message):
@@ -816,9 +1852,9 @@ class BotHandlers:
         # Показываем текущее состояние полей
         for i, (column_name, value) in enumerate(zip(columns, row_data)):
             if column_name:
-                safe_column = str(column_name).replace('<', '&lt;').replace('>', '&gt;').replace('&', '&amp;')
+                safe_column = escape_html(column_name)
                 if value:
-                    safe_value = str(value).replace('<', '&lt;').replace('>', '&gt;').replace('&', '&amp;')
+                    safe_value = escape_html(value)
                     text_parts.append(f"<b>{i+1}. {safe_column}:</b> {safe_value}")
                 else:
                     text_parts.append(f"<b>{i+1}. {safe_column}:</b> <i>(не заполнено)</i>")
@@ -853,25 +1889,43 @@ class BotHandlers:
         current_data = await state.get_data()
         row_data = current_data.get('new_row_data', [''] * len(columns))
         
+        # Частые значения столбца - кнопками, чтобы не вводить их заново
+        suggestions = await self._suggest_values(column_number)
+        
         # Сохраняем состояние
         await state.update_data({
             'new_row_data': row_data,
             'filling_column': column_number,
-            'column_name': column_name
+            'column_name': column_name,
+            'suggestions': suggestions
         })
         
         await state.set_state(NewRowStates.filling_field)
         
         current_value = row_data[column_number - 1] if column_number <= len(row_data) else ""
-        current_text = f" (текущее: {current_value})" if current_value else ""
+        current_text = f" (текущее: {escape_html(current_value)})" if current_value else ""
         
         await callback.message.edit_text(
-            f"✏️ <b>Заполнение поля '{column_name}'</b>\n\n"
-            f"Введите значение{current_text}:",
+            f"✏️ <b>Заполнение поля '{escape_html(column_name)}'</b>\n\n"
+            f"Введите значение{current_text}"
+            + (" или выберите частое значение:" if suggestions else ":"),
+            reply_markup=(
+                Keyboards.create_value_suggestions_keyboard(column_number, suggestions) if suggestions else None
+            ),
             parse_mode="HTML"
         )
         await callback.answer()
     
+    async def _suggest_values(self, column_number, text=''):
+        """Подсказки существующих значений столбца; пустой список, если снимок недоступен"""
+        try:
+            return await asyncio.to_thread(
+                self.sheets_service.suggest_values, column_number, text, Config.AUTOCOMPLETE_SUGGESTIONS
+            )
+        except Exception as e:
+            self.logger.warning(f"Не удалось подобрать подсказки для столбца {column_number}: {e}")
+            return []
+    
     async def handle_new_row_field_input(self, message: Message, state: FSMContext):
         """Обработчик ввода значения для поля новой строки"""
         user_id = message.from_user.id
@@ -889,15 +1943,50 @@ class BotHandlers:
         if column_number <= len(row_data):
             row_data[column_number - 1] = new_value
         
-        # Сохраняем обновленные данные
-        await state.update_data({'new_row_data': row_data})
-        await state.clear()
+        # Похожие существующие значения: продолжения ввода и написания без опечаток
+        suggestions = await self._suggest_values(column_number, new_value)
+        
+        # Сохраняем обновленные данные (state.clear() стер бы и их - выходим только из состояния ввода)
+        await state.update_data({'new_row_data': row_data, 'suggestions': suggestions})
+        await state.set_state(None)
         
         # Показываем обновленный интерфейс
         columns = self.sheets_service.get_columns()
-        await message.answer(f"✅ Поле '{column_name}' заполнено: {new_value}")
+        if suggestions:
+            await message.answer(
+                f"✅ Поле '{column_name}' заполнено: {new_value}\n\n"
+                f"Похожие значения из таблицы - нажмите, чтобы заменить:",
+                reply_markup=Keyboards.create_value_suggestions_keyboard(column_number, suggestions)
+            )
+        else:
+            await message.answer(f"✅ Поле '{column_name}' заполнено: {new_value}")
         await self._show_new_row_interface(message, columns, row_data)
     
+    async def handle_pick_value(self, callback: CallbackQuery, state: FSMContext):
+        """Заполнить поле новой строки значением, выбранным из подсказок"""
+        _, column_number, index = callback.data.split(":")
+        column_number, index = int(column_number), int(index)
+        
+        data = await state.get_data()
+        suggestions = data.get('suggestions') or []
+        row_data = data.get('new_row_data')
+        if not row_data or data.get('filling_column') != column_number or index >= len(suggestions):
+            await callback.answer("❌ Подсказка устарела", show_alert=True)
+            return
+        
+        value = suggestions[index]
+        column_name = data.get('column_name', 'Поле')
+        if column_number <= len(row_data):
+            row_data[column_number - 1] = value
+        
+        await state.update_data({'new_row_data': row_data, 'suggestions': []})
+        await state.set_state(None)
+        
+        columns = self.sheets_service.get_columns()
+        await callback.message.edit_text(f"✅ Поле '{column_name}' заполнено: {value}")
+        await self._show_new_row_interface(callback.message, columns, row_data)
+        await callback.answer()
+    
     async def handle_save_new_row(self, callback: CallbackQuery, state: FSMContext):
         """Обработчик сохранения новой строки"""
         user_id = callback.from_user.id
@@ -910,12 +1999,40 @@ class BotHandlers:
             await callback.answer("❌ Заполните хотя бы одно поле", show_alert=True)
             return
         
+        if callback.data != "save_new_row:force":
+            try:
+                duplicates = await asyncio.to_thread(self.sheets_service.find_duplicates, row_data)
+            except Exception as e:
+                self.logger.warning(f"Не удалось проверить дубликаты новой строки: {e}")
+                duplicates = []
+            if duplicates:
+                shown = ", ".join(str(row_number) for row_number in duplicates[:10])
+                if len(duplicates) > 10:
+                    shown += f" и еще {len(duplicates) - 10}"
+                await callback.message.edit_text(
+                    f"⚠️ <b>Такая строка уже есть</b>\n\n"
+                    f"Совпадающие строки: <b>{shown}</b>\n\n"
+                    f"Сохранить новую строку все равно?",
+                    reply_markup=Keyboards.create_duplicate_warning_keyboard(),
+                    parse_mode="HTML"
+                )
+                await callback.answer()
+                return
+        
         self.logger.info(f"Пользователь {user_id} сохраняет новую строку")
         
         # Сохраняем в Google Sheets
-        new_row_number = self.sheets_service.add_new_row(row_data)
+        new_row_number = await asyncio.to_thread(self.sheets_service.add_new_row, row_data)
         
-        if new_row_number:
+        if new_row_number == QUEUED:
+            await callback.message.edit_text(
+                f"✅ <b>Новая строка сохранена!</b>\n\n"
+                f"Заполненных полей: <b>{sum(1 for x in row_data if x)}</b>\n\n"
+                f"{QUEUED_NOTE} Номер строки станет известен после записи.",
+                parse_mode="HTML"
+            )
+            await state.clear()
+        elif new_row_number:
             await callback.message.edit_text(
                 f"✅ <b>Новая строка успешно создана!</b>\n\n"
                 f"Номер строки: <b>{new_row_number}</b>\n"
@@ -928,6 +2045,15 @@ class BotHandlers:
         
         await callback.answer()
     
+    async def handle_edit_new_row(self, callback: CallbackQuery, state: FSMContext):
+        """Вернуться к заполнению новой строки после предупреждения о дубликате"""
+        columns = self.sheets_service.get_columns()
+        data = await state.get_data()
+        row_data = data.get('new_row_data', [''] * len(columns))
+        
+        await self._show_new_row_interface(callback.message, columns, row_data, edit_message=True)
+        await callback.answer()
+    
     async def handle_clear_new_row(self, callback: CallbackQuery, state: FSMContext):
         """Обработчик очистки полей новой строки"""
         user_id = callback.from_user.id
@@ -982,6 +2108,8 @@ class BotHandlers:
             await self._handle_formula_examples(callback)
         elif action == "validate":
             await self._handle_validate_formula(callback, state)
+        elif action == "apply":
+            await self._handle_apply_formula(callback, state)
         
         await callback.answer()
     
@@ -1005,12 +2133,12 @@ class BotHandlers:
         await state.update_data({'action': 'view'})
         
         await callback.message.edit_text(
-            "👁️ <b>Просмотр формулы в ячейке</b>\n\n"
-            "Укажите позицию ячейки для просмотра формулы:\n"
+            "👁️ <b>Просмотр формул</b>\n\n"
+            "Укажите ячейку или диапазон:\n"
             "• <code>A1</code> - столбец A, строка 1\n"
-            "• <code>B5</code> - столбец B, строка 5\n"
-            "• <code>2,3</code> - строка 2, столбец 3\n\n"
-            "Введите позицию ячейки:",
+            "• <code>2,3</code> - строка 2, столбец 3\n"
+            "• <code>A1:D20</code> - все формулы диапазона\n\n"
+            "Введите позицию ячейки или диапазон:",
             parse_mode="HTML"
         )
     
@@ -1078,6 +2206,14 @@ class BotHandlers:
         user_id = message.from_user.id
         position = message.text.strip().upper()
         
+        # Проверяем действие
+        data = await state.get_data()
+        action = data.get('action', 'add')
+        
+        if action == 'view' and ':' in position:
+            await self._show_range_formulas(message, state, position)
+            return
+        
         # Парсим позицию ячейки
         row_number, column_number = self._parse_cell_position(position)
         
@@ -1088,18 +2224,14 @@ class BotHandlers:
             )
             return
         
-        # Проверяем действие
-        data = await state.get_data()
-        action = data.get('action', 'add')
-        
         if action == 'view':
-            # Просматриваем формулу
-            formula = self.sheets_service.get_cell_formula(row_number, column_number)
+            # Просматриваем формулу (из кэша формул листа)
+            formula = await asyncio.to_thread(self.sheets_service.get_cell_formula, row_number, column_number)
             
             if formula:
                 await message.answer(
                     f"👁️ <b>Формула в ячейке {position}</b>\n\n"
-                    f"<code>{formula}</code>",
+                    f"<code>{escape_html(formula)}</code>",
                     parse_mode="HTML"
                 )
             else:
@@ -1123,10 +2255,53 @@ class BotHandlers:
                 parse_mode="HTML"
             )
     
+    def _formula_preview_text(self, formula, row_number=None, column_number=None):
+        """Строка с результатом локального вычисления формулы по снимку листа"""
+        try:
+            value, reason = self.sheets_service.preview_formula(formula, row_number, column_number)
+        except FormulaError as e:
+            return None, str(e)
+        
+        if reason:
+            return f"ℹ️ Предпросмотр недоступен: {escape_html(reason)}", None
+        return f"🔢 Результат: <code>{escape_html(value) if value else '(пусто)'}</code>", None
+    
+    async def _show_range_formulas(self, message, state, position):
+        """Показать все формулы диапазона вида A1:D20"""
+        start, end = position.split(':', 1)
+        start_row, start_col = self._parse_cell_position(start.strip())
+        end_row, end_col = self._parse_cell_position(end.strip())
+        
+        if not all((start_row, start_col, end_row, end_col)):
+            await message.answer("❌ Неверный формат диапазона.\nИспользуйте формат: A1:D20")
+            return
+        
+        start_row, end_row = sorted((start_row, end_row))
+        start_col, end_col = sorted((start_col, end_col))
+        
+        formulas = await asyncio.to_thread(
+            self.sheets_service.get_range_formulas, start_row, start_col, end_row, end_col
+        )
+        await state.clear()
+        
+        if formulas is None:
+            await message.answer("❌ Ошибка при получении формул. Попробуйте позже.")
+            return
+        if not formulas:
+            await message.answer(f"ℹ️ В диапазоне {position} нет формул")
+            return
+        
+        lines = [f"👁️ <b>Формулы в диапазоне {escape_html(position)}</b> ({len(formulas)})", ""]
+        lines.extend(
+            f"<b>{cell_name(row, col)}</b>: <code>{escape_html(formula)}</code>"
+            for row, col, formula in formulas
+        )
+        await self._send_text(message, "\n".join(lines), parse_mode="HTML")
+    
     async def handle_formula_input(self, message: Message, state: FSMContext):
-        """Обработчик ввода формулы"""
+        """Обработчик ввода формулы: проверка и предпросмотр значения до записи"""
         user_id = message.from_user.id
-        formula = message.text.strip()
+        formula = message.text.strip().lstrip('=')
         
         # Получаем данные из состояния
         data = await state.get_data()
@@ -1140,34 +2315,76 @@ class BotHandlers:
         is_valid, message_text = self.sheets_service.validate_formula(formula)
         
         if not is_valid:
-            await message.answer(f"❌ Ошибка в формуле: {message_text}")
+            await message.answer(f"❌ Ошибка в формуле: {message_text}\n\nИсправьте формулу и отправьте снова:")
+            return
+        
+        # Вычисляем формулу локально, в таблицу пока ничего не пишется
+        preview, error_text = await asyncio.to_thread(
+            self._formula_preview_text, formula, row_number, column_number
+        )
+        if error_text:
+            await message.answer(f"❌ Ошибка в формуле: {error_text}\n\nИсправьте формулу и отправьте снова:")
+            return
+        
+        await state.update_data({'formula': formula})
+        await state.set_state(FormulaStates.waiting_for_apply)
+        
+        await message.answer(
+            f"🧮 <b>Предпросмотр формулы для ячейки {position}</b>\n\n"
+            f"Формула: <code>={escape_html(formula)}</code>\n"
+            f"{preview}\n\n"
+            "Записать формулу в таблицу?",
+            reply_markup=Keyboards.create_formula_apply_keyboard(),
+            parse_mode="HTML"
+        )
+    
+    async def _handle_apply_formula(self, callback: CallbackQuery, state: FSMContext):
+        """Запись формулы в ячейку после предпросмотра"""
+        data = await state.get_data()
+        await state.clear()
+        
+        if 'formula' not in data:
+            await callback.message.edit_text("❌ Формула не найдена. Начните заново.")
             return
         
-        # Добавляем формулу
-        success = self.sheets_service.update_cell_with_formula(row_number, column_number, formula)
+        position = data['position']
+        records = self.sheets_service.edit_records(
+            [(data['row_number'], data['column_number'], f"={data['formula']}")]
+        )
+        success = await asyncio.to_thread(
+            self.sheets_service.update_cell_with_formula,
+            data['row_number'], data['column_number'], data['formula']
+        )
         
         if success:
-            await message.answer(
+            self._record_undo(callback.from_user.id, records)
+            await callback.message.edit_text(
                 f"✅ <b>Формула успешно добавлена!</b>\n\n"
                 f"Ячейка: <b>{position}</b>\n"
-                f"Формула: <code>={formula}</code>",
+                f"Формула: <code>={escape_html(data['formula'])}</code>"
+                + (f"\n\n{QUEUED_NOTE}" if success == QUEUED else ""),
                 parse_mode="HTML"
             )
         else:
-            await message.answer("❌ Ошибка при добавлении формулы. Попробуйте позже.")
-        
-        await state.clear()
+            await callback.message.edit_text("❌ Ошибка при добавлении формулы. Попробуйте позже.")
     
     async def handle_validation_input(self, message: Message, state: FSMContext):
         """Обработчик проверки формулы"""
-        formula = message.text.strip()
+        formula = message.text.strip().lstrip('=')
         
         is_valid, message_text = self.sheets_service.validate_formula(formula)
         
         if is_valid:
-            await message.answer(f"✅ <b>Формула корректна!</b>\n\n<code>={formula}</code>", parse_mode="HTML")
+            preview, error_text = await asyncio.to_thread(self._formula_preview_text, formula)
+            if error_text:
+                await message.answer(f"❌ <b>Ошибка в формуле:</b>\n{escape_html(error_text)}", parse_mode="HTML")
+            else:
+                await message.answer(
+                    f"✅ <b>Формула корректна!</b>\n\n<code>={escape_html(formula)}</code>\n{preview}",
+                    parse_mode="HTML"
+                )
         else:
-            await message.answer(f"❌ <b>Ошибка в формуле:</b>\n{message_text}", parse_mode="HTML")
+            await message.answer(f"❌ <b>Ошибка в формуле:</b>\n{escape_html(message_text)}", parse_mode="HTML")
         
         await state.clear()
     
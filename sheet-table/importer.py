@@ -0,0 +1,151 @@
+import codecs
+import csv
+import os
+
+from search_index import normalize_value
+
+try:
+    from openpyxl import load_workbook
+except ImportError:  # XLSX - необязательная возможность
+    load_workbook = None
+
+IMPORT_FORMATS = ('csv', 'xlsx')
+CSV_DELIMITERS = (',', ';', '\t')
+
+# Ограничение Google Sheets на длину значения ячейки
+MAX_CELL_LENGTH = 50000
+
+
+class ImportFileError(Exception):
+    """Ошибка чтения или сопоставления файла импорта"""
+
+
+def _open_text(path):
+    """Открыть CSV в UTF-8 (с BOM или без), при ошибке - в cp1251 (выгрузки из Excel)"""
+    with open(path, 'rb') as probe:
+        sample = probe.read(65536)
+    try:
+        # Образец может оборваться посреди многобайтового символа: незаконченный хвост не ошибка
+        codecs.getincrementaldecoder('utf-8-sig')().decode(sample, final=False)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'cp1251'
+    return open(path, 'r', encoding=encoding, newline='')
+
+
+def iter_csv_rows(path):
+    """Построчно читать CSV; разделитель (, ; или табуляция) определяется по строке заголовков"""
+    with _open_text(path) as file:
+        header_line = file.readline()
+        file.seek(0)
+        delimiter = max(CSV_DELIMITERS, key=header_line.count)
+        for row in csv.reader(file, delimiter=delimiter):
+            yield row
+
+
+def iter_xlsx_rows(path):
+    """Построчно читать первый лист XLSX в режиме read-only"""
+    if load_workbook is None:
+        raise ImportFileError("Для импорта XLSX установите пакет openpyxl")
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ['' if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def iter_file_rows(path, file_format):
+    """Потоковое чтение строк файла импорта (первая строка - заголовки)"""
+    if file_format == 'csv':
+        return iter_csv_rows(path)
+    if file_format == 'xlsx':
+        return iter_xlsx_rows(path)
+    raise ImportFileError(f"Неподдерживаемый формат файла: {file_format}")
+
+
+def detect_format(filename):
+    """Формат файла по расширению (None, если не поддерживается)"""
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def map_columns(file_header, sheet_columns):
+    """Сопоставить столбцы файла со столбцами таблицы по названию
+
+    Возвращает (mapping, unknown): mapping[i] - номер столбца таблицы (с нуля)
+    для i-го столбца файла или None; unknown - названия несопоставленных столбцов.
+    """
+    positions = {normalize_value(name): i for i, name in enumerate(sheet_columns) if name}
+    mapping = []
+    unknown = []
+    for name in file_header:
+        position = positions.get(normalize_value(name))
+        mapping.append(position)
+        if position is None and str(name).strip():
+            unknown.append(str(name))
+    return mapping, unknown
+
+
+class ImportReport:
+    """Итоги импорта: прочитано, записано, пропущено, ошибки по строкам и порциям"""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_written = 0
+        self.rows_skipped = 0
+        self.invalid_rows = []   # (номер строки файла, причина)
+        self.chunk_errors = []   # (первая строка файла, последняя строка файла, ошибка)
+
+    def summary(self, max_items=10):
+        lines = [
+            f"📥 Прочитано строк: {self.rows_read}",
+            f"✅ Записано: {self.rows_written}",
+        ]
+        if self.rows_skipped:
+            lines.append(f"⏭️ Пропущено пустых: {self.rows_skipped}")
+        if self.invalid_rows:
+            lines.append(f"⚠️ Отклонено строк: {len(self.invalid_rows)}")
+            for line_number, reason in self.invalid_rows[:max_items]:
+                lines.append(f"  • строка {line_number}: {reason}")
+            if len(self.invalid_rows) > max_items:
+                lines.append(f"  • ... и еще {len(self.invalid_rows) - max_items}")
+        if self.chunk_errors:
+            lines.append(f"❌ Не записано порций: {len(self.chunk_errors)}")
+            for first, last, error in self.chunk_errors[:max_items]:
+                lines.append(f"  • строки {first}-{last}: {error}")
+        return "\n".join(lines)
+
+
+def prepare_rows(rows, mapping, width, report):
+    """Привести строки файла к порядку столбцов таблицы с проверкой
+
+    Генератор (номер строки файла, строка таблицы); отклоненные и пустые строки
+    учитываются в report.
+    """
+    for line_number, row in enumerate(rows, start=2):  # Строка 1 файла - заголовки
+        report.rows_read += 1
+
+        if not any(str(cell).strip() for cell in row):
+            report.rows_skipped += 1
+            continue
+
+        if len(row) > len(mapping) and any(str(cell).strip() for cell in row[len(mapping):]):
+            report.invalid_rows.append((line_number, "значения за пределами заголовков"))
+            continue
+
+        too_long = next((cell for cell in row if len(str(cell)) > MAX_CELL_LENGTH), None)
+        if too_long is not None:
+            report.invalid_rows.append((line_number, f"значение длиннее {MAX_CELL_LENGTH} символов"))
+            continue
+
+        sheet_row = [''] * width
+        for value, position in zip(row, mapping):
+            if position is not None:
+                sheet_row[position] = str(value).strip()
+
+        if not any(sheet_row):
+            report.rows_skipped += 1
+            continue
+
+        yield line_number, sheet_row
@@ -53,17 +53,39 @@ class Keyboards:
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
     @staticmethod
-    def create_row_actions_keyboard(row_number):
+    def _row_key(row_number, row_ref=None):
+        """Номер строки для callback-данных, со стабильной ссылкой на строку, если она есть"""
+        return f"{row_number}:{row_ref}" if row_ref else str(row_number)
+    
+    @staticmethod
+    def create_row_actions_keyboard(row_number, row_ref=None):
         """Создать клавиатуру для действий со строкой"""
+        row_key = Keyboards._row_key(row_number, row_ref)
         keyboard = [
             [
                 InlineKeyboardButton(
                     text="✏️ Редактировать",
-                    callback_data=f"edit_row:{row_number}"
+                    callback_data=f"edit_row:{row_key}"
                 ),
                 InlineKeyboardButton(
                     text="🔄 Обновить",
-                    callback_data=f"refresh_row:{row_number}"
+                    callback_data=f"refresh_row:{row_key}"
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    text="📄 Дублировать",
+                    callback_data=f"dup_row:{row_key}"
+                ),
+                InlineKeyboardButton(
+                    text="📋 Как шаблон",
+                    callback_data=f"tpl_row:{row_key}"
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    text="🗑️ Удалить",
+                    callback_data=f"delete_row:{row_key}"
                 )
             ],
             [
@@ -81,21 +103,22 @@ class Keyboards:
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
     @staticmethod
-    def create_edit_field_keyboard(row_number, columns):
+    def create_edit_field_keyboard(row_number, columns, row_ref=None):
         """Создать клавиатуру для выбора поля для редактирования"""
         keyboard = []
+        ref_suffix = f":{row_ref}" if row_ref else ""
         
         for i, column_name in enumerate(columns[:10]):  # Максимум 10 столбцов
             if column_name:  # Только непустые названия столбцов
                 keyboard.append([InlineKeyboardButton(
                     text=f"✏️ {column_name}",
-                    callback_data=f"edit_field:{row_number}:{i+1}"
+                    callback_data=f"edit_field:{row_number}:{i+1}{ref_suffix}"
                 )])
         
         keyboard.append([
             InlineKeyboardButton(
                 text="⬅️ Назад",
-                callback_data=f"back_to_row:{row_number}"
+                callback_data=f"back_to_row:{Keyboards._row_key(row_number, row_ref)}"
             ),
             InlineKeyboardButton(
                 text="🏠 Главное меню",
@@ -105,6 +128,79 @@ class Keyboards:
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
+    @staticmethod
+    def create_bulk_column_keyboard(columns):
+        """Создать клавиатуру выбора столбца для массового изменения"""
+        buttons = [
+            InlineKeyboardButton(text=f"✏️ {column_name}", callback_data=f"bulk_col:{i+1}")
+            for i, column_name in enumerate(columns)
+            if column_name
+        ]
+        keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+        
+        keyboard.append([
+            InlineKeyboardButton(
+                text="❌ Отмена",
+                callback_data="cancel_action"
+            )
+        ])
+        
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    
+    @staticmethod
+    def create_bulk_apply_keyboard(changes_count):
+        """Создать клавиатуру подтверждения массового изменения"""
+        keyboard = [
+            [
+                InlineKeyboardButton(
+                    text=f"✅ Изменить {changes_count} строк",
+                    callback_data="bulk_apply"
+                ),
+                InlineKeyboardButton(
+                    text="❌ Отмена",
+                    callback_data="cancel_action"
+                )
+            ]
+        ]
+        
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    
+    @staticmethod
+    def create_delete_confirm_keyboard(rows_count):
+        """Создать клавиатуру подтверждения удаления строк"""
+        keyboard = [
+            [
+                InlineKeyboardButton(
+                    text=f"🗑️ Удалить {rows_count} строк",
+                    callback_data="delete_apply"
+                ),
+                InlineKeyboardButton(
+                    text="❌ Отмена",
+                    callback_data="cancel_action"
+                )
+            ]
+        ]
+        
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    
+    @staticmethod
+    def create_formula_apply_keyboard():
+        """Создать клавиатуру записи формулы после предпросмотра"""
+        keyboard = [
+            [
+                InlineKeyboardButton(
+                    text="✅ Записать в ячейку",
+                    callback_data="formula:apply"
+                ),
+                InlineKeyboardButton(
+                    text="❌ Отмена",
+                    callback_data="cancel_action"
+                )
+            ]
+        ]
+        
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    
     @staticmethod
     def create_confirm_keyboard(action_data):
         """Создать клавиатуру подтверждения"""
@@ -195,8 +291,14 @@ class Keyboards:
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
     @staticmethod
-    def create_pagination_keyboard(current_page, total_pages, rows_on_page, prefix="page"):
-        """Создать клавиатуру пагинации с навигацией по строкам"""
+    def create_pagination_keyboard(current_page, total_pages, rows_on_page, prefix="page", total_known=True,
+                                   row_refs=None, sort_button=False):
+        """Создать клавиатуру пагинации с навигацией по строкам
+        
+        total_known=False - число страниц пока известно только снизу (ленивый поиск).
+        row_refs - стабильные ссылки на строки страницы (по порядку), если есть.
+        sort_button - добавить кнопку выбора сортировки ("Все строки").
+        """
         keyboard = []
         
         # Кнопки для каждой строки на текущей странице
@@ -204,10 +306,11 @@ class Keyboards:
             row_number = row_info['row_number']
             preview_data = ' - '.join([str(val)[:15] for val in row_info['data'][:2] if val])
             button_text = f"[{row_number}] {preview_data[:30]}..."
+            row_ref = row_refs[i] if row_refs else None
             
             keyboard.append([InlineKeyboardButton(
                 text=button_text,
-                callback_data=f"select_row:{row_number}"
+                callback_data=f"select_row:{Keyboards._row_key(row_number, row_ref)}"
             )])
         
         # Навигационные кнопки
@@ -222,7 +325,7 @@ class Keyboards:
         
         # Показываем текущую страницу
         nav_buttons.append(InlineKeyboardButton(
-            text=f"📄 {current_page}/{total_pages}",
+            text=f"📄 {current_page}/{total_pages}{'' if total_known else '+'}",
             callback_data="page:info"
         ))
         
@@ -246,7 +349,7 @@ class Keyboards:
                     callback_data=f"{prefix}:goto:1"
                 ))
             
-            if current_page < total_pages - 1:
+            if total_known and current_page < total_pages - 1:
                 quick_nav.append(InlineKeyboardButton(
                     text="Конец ⏩",
                     callback_data=f"{prefix}:goto:{total_pages}"
@@ -255,6 +358,12 @@ class Keyboards:
             if quick_nav:
                 keyboard.append(quick_nav)
         
+        if sort_button:
+            keyboard.append([InlineKeyboardButton(
+                text="🔃 Сортировка",
+                callback_data="rows_sort"
+            )])
+        
         # Кнопка возврата в меню
         keyboard.append([InlineKeyboardButton(
             text="🏠 Главное меню",
@@ -263,6 +372,69 @@ class Keyboards:
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+    @staticmethod
+    def create_sort_keyboard(columns, current_sort=None):
+        """Создать клавиатуру выбора столбца и направления сортировки "Все строки"
+        
+        current_sort - текущая сортировка (номер столбца, по убыванию) или None.
+        """
+        keyboard = []
+        for i, column_name in enumerate(columns[:10]):  # Максимум 10 столбцов
+            if not column_name:
+                continue
+            buttons = []
+            for descending, arrow in ((False, "⬆️"), (True, "⬇️")):
+                mark = "• " if current_sort == (i + 1, descending) else ""
+                buttons.append(InlineKeyboardButton(
+                    text=f"{mark}{arrow} {column_name[:20]}",
+                    callback_data=f"sort_rows:{i + 1}:{'desc' if descending else 'asc'}"
+                ))
+            keyboard.append(buttons)
+        
+        keyboard.append([InlineKeyboardButton(
+            text=("• " if current_sort is None else "") + "↩️ Порядок таблицы",
+            callback_data="sort_rows:0:off"
+        )])
+        
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    
+    @staticmethod
+    def create_value_suggestions_keyboard(column_number, values):
+        """Создать клавиатуру с существующими значениями столбца для поля новой строки"""
+        keyboard = [
+            [InlineKeyboardButton(
+                text=value if len(value) <= 60 else value[:57] + "...",
+                callback_data=f"pick_value:{column_number}:{i}"
+            )]
+            for i, value in enumerate(values)
+        ]
+        
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    
+    @staticmethod
+    def create_duplicate_warning_keyboard():
+        """Создать клавиатуру предупреждения о дубликате новой строки"""
+        keyboard = [
+            [
+                InlineKeyboardButton(
+                    text="✅ Все равно сохранить",
+                    callback_data="save_new_row:force"
+                ),
+                InlineKeyboardButton(
+                    text="✏️ Изменить поля",
+                    callback_data="edit_new_row"
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    text="❌ Отменить",
+                    callback_data="cancel_new_row"
+                )
+            ]
+        ]
+        
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
     @staticmethod
     def create_new_row_keyboard(columns):
         """Создать клавиатуру для заполнения новой строки"""
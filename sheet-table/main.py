@@ -7,6 +7,7 @@ from config import Config
 from google_sheets import GoogleSheetsService
 from handlers import BotHandlers
 from middlewares import AccessControlMiddleware, RateLimitMiddleware
+from write_journal import JournalReplayer
 
 # Настройка логирования
 def setup_logging():
@@ -55,12 +56,19 @@ async def main():
         logger.error("Не удалось подключиться к Google Sheets. Проверьте credentials.json и настройки.")
         return
     
+    # Фоновая отправка записей, отложенных в журнал при недоступности таблицы
+    replayer = JournalReplayer(sheets_service, Config.JOURNAL_REPLAY_INTERVAL)
+    pending = sheets_service.journal.count()
+    if pending:
+        logger.info(f"В журнале записей ожидают отправки: {pending}")
+    
     # Инициализация обработчиков
     handlers = BotHandlers(sheets_service)
     
     # Подключение middleware
     dp.message.middleware(AccessControlMiddleware())
     dp.callback_query.middleware(AccessControlMiddleware())
+    dp.inline_query.middleware(AccessControlMiddleware())
     dp.message.middleware(RateLimitMiddleware(rate_limit=1.0))
     dp.callback_query.middleware(RateLimitMiddleware(rate_limit=0.5))
     
@@ -69,10 +77,13 @@ async def main():
     
     try:
         logger.info("Бот успешно запущен!")
+        replayer.start()
         await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
     finally:
+        await replayer.stop()
+        sheets_service.journal.close()
         await bot.session.close()
         logger.info("Бот остановлен")
 
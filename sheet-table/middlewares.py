@@ -1,7 +1,7 @@
 import logging
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineQuery
 from config import Config
 
 class AccessControlMiddleware(BaseMiddleware):
@@ -13,7 +13,7 @@ class AccessControlMiddleware(BaseMiddleware):
     async def __call__(
         self,
         handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
-        event: Message | CallbackQuery,
+        event: Message | CallbackQuery | InlineQuery,
         data: Dict[str, Any]
     ) -> Any:
         user_id = event.from_user.id
@@ -25,6 +25,8 @@ class AccessControlMiddleware(BaseMiddleware):
                 await event.answer(f"⛔ Доступ запрещен. Ваш ID: {user_id}")
             elif isinstance(event, CallbackQuery):
                 await event.answer(f"⛔ Доступ запрещен. Ваш ID: {user_id}", show_alert=True)
+            elif isinstance(event, InlineQuery):
+                await event.answer([], cache_time=0, is_personal=True)
             
             return
         
@@ -0,0 +1,105 @@
+import unicodedata
+
+# Невидимые символы, которые попадают в ячейки при копировании из браузера и мессенджеров
+_INVISIBLE = dict.fromkeys(map(ord, '\u00ad\u200b\u200c\u200d\u2060\ufeff'))
+_FOLD = str.maketrans({'ё': 'е'})
+
+
+def normalize_text(value):
+    """Нормализация текста для поиска и сравнения
+
+    NFKC (совместимые формы: неразрывный пробел, полноширинные символы,
+    лигатуры), casefold, ё -> е, удаление невидимых символов и схлопывание
+    любых пробельных символов в один пробел с обрезкой по краям.
+    """
+    if not value:
+        return ''
+    text = str(value)
+    if text.isascii():
+        return ' '.join(text.lower().split())
+    text = unicodedata.normalize('NFKC', text).translate(_INVISIBLE)
+    return ' '.join(text.casefold().translate(_FOLD).split())
+
+
+class NormalizedShadow:
+    """Нормализованная "тень" снимка для поиска
+
+    Снимок хранит столбцы со словарным кодированием, поэтому нормализуется
+    каждое различное значение столбца один раз; ячейка тени - это
+    нормализованное значение по коду ячейки. Поиск сравнивает с тенью
+    напрямую, без нормализации ячеек на каждом запросе.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.columns = [
+            [normalize_text(value) for value in column.distinct()]
+            for column in snapshot.rows.columns
+        ]
+
+    @classmethod
+    def for_snapshot(cls, snapshot):
+        """Тень снимка (кэшируется в самом снимке)"""
+        return snapshot.derived('normalized', cls)
+
+    def updated(self, snapshot):
+        """Тень новой версии снимка, полученной из этой записью или вставкой строк
+
+        Словарь столбца новой версии продолжает словарь прежней (см.
+        EncodedColumn), поэтому нормализуются только добавленные значения.
+        Список столбца дописывается на месте, если его не дополняла другая
+        версия (прежняя видит только свои коды), иначе копируется.
+        """
+        shadow = NormalizedShadow.__new__(NormalizedShadow)
+        shadow.snapshot = snapshot
+        shadow.columns = []
+        old_columns = self.snapshot.rows.columns
+        for col, column in enumerate(snapshot.rows.columns):
+            if col < len(old_columns):
+                normalized, known = self.columns[col], old_columns[col].dictionary_size
+            else:
+                normalized, known = [''], 1  # Новый столбец: словарь начинается с пустой строки
+            size = column.dictionary_size
+            if size > known:
+                if len(normalized) != known:
+                    normalized = normalized[:known]
+                normalized.extend(normalize_text(column.dictionary[code]) for code in range(known, size))
+            elif size < known:
+                normalized = [normalize_text(value) for value in column.distinct()]
+            shadow.columns.append(normalized)
+        return shadow
+
+    def cell(self, index, col):
+        if col >= len(self.columns):
+            return ''
+        return self.columns[col][self.snapshot.rows.columns[col].codes[index]]
+
+    def row(self, index):
+        return [
+            normalized[column.codes[index]]
+            for normalized, column in zip(self.columns, self.snapshot.rows.columns)
+        ]
+
+    def matching_codes(self, col, predicate):
+        """Коды значений столбца, нормализованная форма которых удовлетворяет predicate"""
+        return {code for code, value in enumerate(self.columns[col]) if value and predicate(value)}
+
+    def iter_containing(self, needle):
+        """Лениво перебирать индексы записей, где какая-либо ячейка содержит needle
+
+        needle уже нормализован. Различные значения проверяются один раз,
+        затем по записям сравниваются только коды.
+        """
+        columns = self.snapshot.rows.columns
+        matches = []
+        for col in range(len(self.columns)):
+            codes = self.matching_codes(col, lambda value: needle in value)
+            if codes:
+                matches.append((columns[col].codes, codes))
+        if not matches:
+            return
+        for index in range(len(self.snapshot)):
+            for column_codes, codes in matches:
+                if column_codes[index] in codes:
+                    yield index
+                    break
@@ -0,0 +1,84 @@
+import time
+from collections import OrderedDict
+
+from quota import QuotaPacer
+
+
+class PrefetchBudget:
+    """Бюджет упреждающих запросов к API для каждого пользователя
+
+    У каждого пользователя своя маркерная корзина: предзагрузка, на которую
+    маркера нет, просто пропускается, поэтому активное листание не съедает
+    общую квоту чтения.
+    """
+
+    def __init__(self, requests_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self._pacers = {}
+
+    def allow(self, user_id):
+        """Взять маркер пользователя без ожидания; False, если бюджет исчерпан"""
+        if self.requests_per_minute <= 0:
+            return False
+        pacer = self._pacers.get(user_id)
+        if pacer is None:
+            pacer = self._pacers[user_id] = QuotaPacer(self.requests_per_minute)
+        return pacer.try_acquire()
+
+
+class RenderedPages:
+    """Готовые страницы (текст и клавиатура) по ключу, последние max_entries штук
+
+    Ключ включает версию снимка, поэтому после записи или перезагрузки
+    страницы старой версии просто перестают запрашиваться и вытесняются.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+
+    def get(self, key):
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+        return page
+
+    def put(self, key, page):
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._pages
+
+
+class PrefetchedRows:
+    """Строки, загруженные заранее, до того как пользователь их открыл (живут ttl секунд)"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._rows = {}
+
+    def put(self, row_number, values):
+        self._rows[row_number] = (list(values), time.monotonic())
+
+    def get(self, row_number):
+        """Значения строки или None, если ее нет или она устарела"""
+        entry = self._rows.get(row_number)
+        if entry is None:
+            return None
+        values, fetched_at = entry
+        if time.monotonic() - fetched_at > self.ttl:
+            del self._rows[row_number]
+            return None
+        return values
+
+    def __contains__(self, row_number):
+        return self.get(row_number) is not None
+
+    def discard(self, row_number):
+        self._rows.pop(row_number, None)
+
+    def clear(self):
+        self._rows.clear()
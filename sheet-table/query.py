@@ -0,0 +1,381 @@
+"""Язык запросов для /find
+
+Синтаксис:
+    значение               - подстрока в любой ячейке строки
+    Столбец:значение       - подстрока в указанном столбце
+    Столбец=значение       - точное совпадение (без учета регистра)
+    Столбец!=значение      - значение не равно
+    Цена>100, Цена<=5,5    - сравнения чисел и дат (>, >=, <, <=)
+    Дата>2026-01-01        - даты: ГГГГ-ММ-ДД, ДД.ММ.ГГГГ, ДД/ММ/ГГГГ
+    Цена:100..500          - диапазон включительно
+    A AND B, A OR B        - логические операции (также И / ИЛИ, пробел = AND)
+    NOT A, -A, !A          - отрицание (также НЕ)
+    (...)                  - группировка
+    "..."                  - значение или название столбца с пробелами
+
+Запрос без операторов ищется целиком как подстрока, как и раньше.
+"""
+import re
+
+from columnar import KIND_DATE, KIND_NUMBER, KIND_TEXT, parse_as, parse_number
+from search_index import normalize_value
+
+
+class QueryError(ValueError):
+    """Ошибка разбора запроса"""
+
+
+_TOKEN_RE = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<lparen>\()
+  | (?P<rparen>\))
+  | (?P<op>>=|<=|!=|=|>|<|:)
+  | (?P<string>"(?:[^"\\]|\\.)*"?)
+  | (?P<neg>[-!](?=[^\s\d=]))
+  | (?P<word>[^\s()<>=!:"]+(?:!(?!=)[^\s()<>=!:"]*)*)
+''', re.VERBOSE)
+
+_RANGE_RE = re.compile(r'^(.+?)\.\.(.+)$')
+
+_AND_WORDS = {'AND', 'И', '&&'}
+_OR_WORDS = {'OR', 'ИЛИ', '||'}
+_NOT_WORDS = {'NOT', 'НЕ'}
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN_RE.match(text, position)
+        if not match:
+            raise QueryError(f"Непонятный символ в запросе: {text[position]}")
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+
+        if kind == 'space':
+            continue
+        if kind == 'string':
+            if len(value) < 2 or not value.endswith('"'):
+                raise QueryError("Не закрыта кавычка в запросе")
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        elif kind == 'neg' and tokens and tokens[-1][0] == 'op':
+            # После оператора минус относится к значению, а не к отрицанию
+            kind = 'word'
+            match = _TOKEN_RE.match(text, position)
+            if match and match.lastgroup == 'word':
+                value += match.group('word')
+                position = match.end()
+        elif kind == 'word':
+            # Ключевые слова распознаются только в верхнем регистре,
+            # чтобы "и" / "или" в обычном тексте оставались словами
+            if value in _AND_WORDS:
+                kind = 'and'
+            elif value in _OR_WORDS:
+                kind = 'or'
+            elif value in _NOT_WORDS:
+                kind = 'neg'
+
+        tokens.append((kind, value))
+    return tokens
+
+
+# === УЗЛЫ ЗАПРОСА ===
+#
+# Каждый узел умеет:
+#   estimate(index)       - оценка числа подходящих записей (для выбора порядка)
+#   evaluate(index)       - множество подходящих записей через индексы
+#   matches(index, i)     - проверка одной записи (когда кандидатов уже мало)
+
+class Contains:
+    def __init__(self, column, text):
+        self.column = column
+        self.text = normalize_value(text)
+
+    def estimate(self, index):
+        if self.column is None:
+            return index.size
+        return index.column(self.column).row_count
+
+    def evaluate(self, index):
+        if self.column is not None:
+            return index.column(self.column).containing(self.text)
+        found = set()
+        for column in index.columns:
+            found |= column.containing(self.text)
+        return found
+
+    def matches(self, index, row):
+        if self.column is not None:
+            return self.text in index.cell(row, self.column)
+        return any(self.text in cell for cell in index.row_cells(row))
+
+
+class Equals:
+    def __init__(self, column, text):
+        self.column = column
+        self.text = normalize_value(text)
+
+    def estimate(self, index):
+        if self.column is None:
+            return sum(len(column.exact(self.text)) for column in index.columns)
+        return len(index.column(self.column).exact(self.text))
+
+    def evaluate(self, index):
+        if self.column is not None:
+            return set(index.column(self.column).exact(self.text))
+        found = set()
+        for column in index.columns:
+            found.update(column.exact(self.text))
+        return found
+
+    def matches(self, index, row):
+        if self.column is not None:
+            return index.cell(row, self.column) == self.text
+        return self.text in index.row_cells(row)
+
+
+def _within(value, low, high, include_low, include_high):
+    """Попадает ли значение в диапазон (None - граница отсутствует)"""
+    if low is not None and (value < low or (value == low and not include_low)):
+        return False
+    if high is not None and (value > high or (value == high and not include_high)):
+        return False
+    return True
+
+
+class Compare:
+    """Сравнение значения столбца с границей (или диапазон "от..до")
+
+    Для числовых столбцов и столбцов с датами используется отсортированный
+    индекс из columnar.py: число подходящих записей и сами записи находятся
+    бинарным поиском. Для текстовых столбцов значения сравниваются как числа
+    перебором различных значений.
+    """
+
+    def __init__(self, column, op, operand, high_operand=None):
+        self.column = column
+        self.op = op
+        self.operand = operand
+        self.high_operand = high_operand  # Только для диапазона "от..до"
+        self._ranges = {}
+        self._text_check = None
+
+    def _range(self, kind):
+        """Границы (low, high, include_low, include_high) в значениях типа kind"""
+        if kind not in self._ranges:
+            self._ranges[kind] = self._convert_range(kind)
+        return self._ranges[kind]
+
+    def _convert_range(self, kind):
+        def convert(text):
+            value = parse_as(kind, text) if kind in (KIND_NUMBER, KIND_DATE) else parse_number(text)
+            if value is None:
+                expected = "нужна дата" if kind == KIND_DATE else "нужно число"
+                raise QueryError(f"Для сравнения {expected}: {text}")
+            return value
+
+        if self.op == '..':
+            return convert(self.operand), convert(self.high_operand), True, True
+        value = convert(self.operand)
+        if self.op in ('>', '>='):
+            return value, None, self.op == '>=', True
+        return None, value, True, self.op == '<='
+
+    def _text_test(self):
+        if self._text_check is None:
+            self._text_check = self._build_text_test()
+        return self._text_check
+
+    def _build_text_test(self):
+        bounds = self._range(KIND_TEXT)
+
+        def test(value):
+            number = parse_number(value)
+            return number is not None and _within(number, *bounds)
+        return test
+
+    def estimate(self, index):
+        typed = index.typed.column(self.column)
+        if typed.is_typed:
+            return typed.count_range(*self._range(typed.kind))
+        return index.column(self.column).row_count
+
+    def evaluate(self, index):
+        typed = index.typed.column(self.column)
+        if typed.is_typed:
+            return set(typed.rows_in_range(*self._range(typed.kind)))
+        return index.column(self.column).matching(self._text_test())
+
+    def matches(self, index, row):
+        typed = index.typed.column(self.column)
+        if not typed.is_typed:
+            return self._text_test()(index.cell(row, self.column))
+        value = typed.values[row] if row < len(typed.values) else None
+        return value is not None and _within(value, *self._range(typed.kind))
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def estimate(self, index):
+        return max(index.size - self.child.estimate(index), 0)
+
+    def evaluate(self, index):
+        return index.all_rows() - self.child.evaluate(index)
+
+    def matches(self, index, row):
+        return not self.child.matches(index, row)
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+    def estimate(self, index):
+        return min(child.estimate(index) for child in self.children)
+
+    def evaluate(self, index):
+        # Сначала самое селективное условие, остальные - пересечением или
+        # поштучной проверкой кандидатов, если их уже меньше, чем дает индекс
+        ordered = sorted(self.children, key=lambda child: child.estimate(index))
+        result = None
+        for child in ordered:
+            if result is None:
+                result = child.evaluate(index)
+            elif len(result) <= child.estimate(index):
+                result = {row for row in result if child.matches(index, row)}
+            else:
+                result &= child.evaluate(index)
+            if not result:
+                break
+        return result
+
+    def matches(self, index, row):
+        return all(child.matches(index, row) for child in self.children)
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+    def estimate(self, index):
+        return min(sum(child.estimate(index) for child in self.children), index.size)
+
+    def evaluate(self, index):
+        result = set()
+        for child in self.children:
+            result |= child.evaluate(index)
+        return result
+
+    def matches(self, index, row):
+        return any(child.matches(index, row) for child in self.children)
+
+
+# === РАЗБОР ===
+
+class _Parser:
+    def __init__(self, tokens, columns):
+        self.tokens = tokens
+        self.position = 0
+        self.columns = {normalize_value(name): i for i, name in enumerate(columns) if name}
+
+    def peek(self, offset=0):
+        position = self.position + offset
+        return self.tokens[position] if position < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek()[0] is not None:
+            raise QueryError(f"Лишний элемент в запросе: {self.peek()[1]}")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek()[0] == 'or':
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek()[0] in ('and', 'neg', 'lparen', 'word', 'string'):
+            if self.peek()[0] == 'and':
+                self.take()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not(self):
+        if self.peek()[0] == 'neg':
+            self.take()
+            return Not(self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind, value = self.take()
+        if kind == 'lparen':
+            node = self.parse_or()
+            if self.take()[0] != 'rparen':
+                raise QueryError("Не закрыта скобка в запросе")
+            return node
+        if kind not in ('word', 'string'):
+            raise QueryError("Ожидалось значение для поиска")
+
+        if self.peek()[0] != 'op':
+            return Contains(None, value)
+
+        op = self.take()[1]
+        value_kind, operand = self.take()
+        if value_kind not in ('word', 'string'):
+            raise QueryError(f"Не указано значение после '{value}{op}'")
+
+        column = self.columns.get(normalize_value(value))
+        if column is None:
+            if op == ':':
+                # Например, время "10:30" - ищем как обычную подстроку
+                return Contains(None, f"{value}{op}{operand}")
+            raise QueryError(f"Неизвестный столбец: {value}")
+
+        if op == ':':
+            bounds = _RANGE_RE.match(operand)
+            if bounds:
+                return Compare(column, '..', bounds.group(1), bounds.group(2))
+            return Contains(column, operand)
+        if op == '=':
+            return Equals(column, operand)
+        if op == '!=':
+            return Not(Equals(column, operand))
+        return Compare(column, op, operand)
+
+
+def parse_query(text, columns):
+    """Разобрать запрос в дерево условий
+
+    Запрос без операторов, скобок и ключевых слов возвращается как поиск
+    подстроки целиком - так же, как работал поиск раньше.
+    """
+    text = text.strip()
+    if not text:
+        raise QueryError("Пустой запрос")
+
+    tokens = _tokenize(text)
+    if all(kind == 'word' for kind, _ in tokens):
+        return Contains(None, text)
+
+    return _Parser(tokens, columns).parse()
+
+
+def is_plain_query(node):
+    """Запрос - простой поиск подстроки по всей строке (без столбцов и операторов)"""
+    return isinstance(node, Contains) and node.column is None
+
+
+def execute_query(node, index):
+    """Выполнить запрос над индексом, вернуть отсортированные номера записей"""
+    return sorted(node.evaluate(index))
@@ -0,0 +1,40 @@
+from collections import OrderedDict
+
+
+class QueryResultCache:
+    """LRU-кэш результатов поиска: (версия снимка, запрос) -> номера записей
+
+    Для простых запросов (подстрока без операторов) результат более длинного
+    запроса - подмножество результата любого его префикса, поэтому при наборе
+    текста следующий запрос фильтрует уже найденные записи, а не весь лист.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, version, text):
+        key = (version, text)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def longest_prefix(self, version, text):
+        """Результат самого длинного закэшированного простого запроса-префикса"""
+        for length in range(len(text) - 1, 0, -1):
+            entry = self._entries.get((version, text[:length]))
+            if entry is not None and entry[1]:
+                self._entries.move_to_end((version, text[:length]))
+                return entry[0]
+        return None
+
+    def put(self, version, text, indexes, plain):
+        self._entries[(version, text)] = (indexes, plain)
+        self._entries.move_to_end((version, text))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
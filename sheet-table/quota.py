@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+
+class QuotaPacer:
+    """Ограничитель темпа запросов к Google Sheets API (маркерная корзина)
+
+    Квота Sheets API считается запросами в минуту. Корзина вмещает burst
+    маркеров и пополняется со скоростью requests_per_minute / 60 в секунду;
+    acquire() ждет, пока маркер появится, вместо того чтобы получить 429.
+    """
+
+    def __init__(self, requests_per_minute=60, burst=None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1, requests_per_minute // 6)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Взять маркер без ожидания; False, если квота на исходе"""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        """Дождаться маркера и взять его"""
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep((1 - self._tokens) / self.rate)
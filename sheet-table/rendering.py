@@ -0,0 +1,105 @@
+"""Экранирование и сборка сообщений для Telegram"""
+
+# Лимит длины одного сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Обратный слэш тоже экранируется, иначе он экранирует следующий символ
+MARKDOWN_V2_SPECIAL_CHARS = '\\_*[]()~`>#+-=|{}.!'
+
+# Таблицы трансляции строятся один раз при импорте, экранирование - один проход str.translate
+_MARKDOWN_V2_TABLE = str.maketrans({char: f'\\{char}' for char in MARKDOWN_V2_SPECIAL_CHARS})
+_HTML_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+
+def escape_markdown(text):
+    """Экранировать специальные символы MarkdownV2 за один проход"""
+    if not text:
+        return text
+    return str(text).translate(_MARKDOWN_V2_TABLE)
+
+
+def escape_html(text):
+    """Экранировать &, < и > для parse_mode=HTML за один проход"""
+    if not text:
+        return text
+    return str(text).translate(_HTML_TABLE)
+
+
+def _safe_cut(text, limit):
+    """Найти позицию разреза, не разрывающую HTML-сущность или escape-последовательность"""
+    cut = limit
+
+    # Не разрываем сущность вида &amp; / &lt; / &gt;
+    amp = text.rfind('&', max(0, cut - 5), cut)
+    if amp != -1 and text.find(';', amp, cut) == -1:
+        cut = amp
+
+    # Не оставляем одиночный обратный слэш в конце куска (пара \\ - экранированный слэш)
+    slashes = 0
+    while slashes < cut and text[cut - 1 - slashes] == '\\':
+        slashes += 1
+    if slashes % 2:
+        cut -= 1
+
+    return cut if cut > 0 else limit
+
+
+class MessageBuilder:
+    """Сборщик сообщения из строк с разбиением по лимиту Telegram
+
+    Строки накапливаются в списках и склеиваются один раз через join,
+    поэтому сборка линейна по объему текста.
+    """
+
+    def __init__(self, limit=TELEGRAM_MESSAGE_LIMIT, separator="\n"):
+        self.limit = limit
+        self.separator = separator
+        self._chunks = []
+        self._current = []
+        self._current_length = 0
+
+    def add(self, line):
+        """Добавить строку в сообщение"""
+        line = str(line)
+
+        # Строка длиннее лимита режется на части
+        while len(line) > self.limit:
+            cut = _safe_cut(line, self.limit)
+            self._flush()
+            self._chunks.append(line[:cut])
+            line = line[cut:]
+
+        extra = len(line) + (len(self.separator) if self._current else 0)
+        if self._current and self._current_length + extra > self.limit:
+            self._flush()
+            extra = len(line)
+
+        self._current.append(line)
+        self._current_length += extra
+        return self
+
+    def extend(self, lines):
+        """Добавить несколько строк"""
+        for line in lines:
+            self.add(line)
+        return self
+
+    def _flush(self):
+        if self._current:
+            self._chunks.append(self.separator.join(self._current))
+            self._current = []
+            self._current_length = 0
+
+    def build(self):
+        """Получить список сообщений, каждое не длиннее лимита"""
+        chunks = list(self._chunks)
+        if self._current:
+            chunks.append(self.separator.join(self._current))
+        return chunks or [""]
+
+
+def split_message(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """Разбить готовый текст на сообщения по границам строк"""
+    if len(text) <= limit:
+        return [text]
+    return MessageBuilder(limit).extend(text.split("\n")).build()
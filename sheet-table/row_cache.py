@@ -0,0 +1,73 @@
+import itertools
+import time
+
+
+def _trimmed(values):
+    """Значения строки без пустых ячеек в конце (для сравнения строк разной ширины)"""
+    values = list(values)
+    while values and not values[-1]:
+        values.pop()
+    return values
+
+
+class CachedRow:
+    """Строка, записанная через бота, с версией записи"""
+
+    __slots__ = ('values', 'stamp', 'written_at')
+
+    def __init__(self, values, stamp):
+        self.values = values
+        self.stamp = stamp
+        self.written_at = time.monotonic()
+
+
+class RowVersionCache:
+    """Кэш записанных строк для чтения своих записей (read-your-writes)
+
+    После успешной записи строка сохраняется здесь с новой версией (штампом),
+    и просмотр строки обслуживается локально, без запроса к API. Запись
+    устаревает через ttl секунд или при синхронизации, если в загруженном
+    снимке строка выглядит иначе (значит, ее изменили извне).
+    """
+
+    _stamps = itertools.count(1)
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._rows = {}
+
+    def put(self, row_number, values):
+        """Запомнить записанную строку; возвращает ее новую версию"""
+        stamp = next(self._stamps)
+        self._rows[row_number] = CachedRow(list(values), stamp)
+        return stamp
+
+    def get(self, row_number):
+        """Строка из кэша или None, если ее нет или она устарела"""
+        cached = self._rows.get(row_number)
+        if cached is None:
+            return None
+        if time.monotonic() - cached.written_at > self.ttl:
+            del self._rows[row_number]
+            return None
+        return cached
+
+    def discard(self, row_number):
+        self._rows.pop(row_number, None)
+
+    def clear(self):
+        self._rows.clear()
+
+    def reconcile(self, snapshot):
+        """Сверить кэш со свежезагруженным снимком; вернуть число строк, измененных извне
+
+        Совпавшие строки остаются в кэше, расходящиеся удаляются: снимок новее записи.
+        """
+        changed = 0
+        for row_number, cached in list(self._rows.items()):
+            index = snapshot.index_of(row_number)
+            current = snapshot.rows[index] if 0 <= index < len(snapshot) else []
+            if _trimmed(current) != _trimmed(cached.values):
+                del self._rows[row_number]
+                changed += 1
+        return changed
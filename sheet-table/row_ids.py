@@ -0,0 +1,190 @@
+import random
+import secrets
+from array import array
+
+
+class RowIdMap:
+    """Стабильные идентификаторы строк листа
+
+    Каждая строка данных получает идентификатор, который не меняется, когда
+    выше вставляют или удаляют строки. Порядок строк хранится в неявном
+    декартовом дереве (treap) с размерами поддеревьев и ссылками на
+    родителя: позиция строки по идентификатору, идентификатор по позиции,
+    вставка и удаление - за O(log n). Узлы хранятся в массивах, узел 0 -
+    пустой; идентификатор строки - номер ее узла.
+
+    epoch различает идентификаторы разных запусков бота: кнопки, созданные
+    до перезапуска, не разрешаются в чужие строки.
+    """
+
+    EPOCH_LENGTH = 4
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(self.EPOCH_LENGTH // 2)
+        self._left = array('I', [0])
+        self._right = array('I', [0])
+        self._parent = array('I', [0])
+        self._size = array('I', [0])
+        self._priority = array('I', [0])
+        self._alive = bytearray(1)
+        self._root = 0
+        self._order = None  # Кэш ids() до следующего изменения
+        self._random = random.Random()
+
+    def __len__(self):
+        return self._size[self._root]
+
+    def _new_nodes(self, count):
+        start = len(self._left)
+        for array_ in (self._left, self._right, self._parent):
+            array_.extend([0] * count)
+        self._size.extend([1] * count)
+        self._priority.extend(self._random.getrandbits(32) for _ in range(count))
+        self._alive.extend(b'\x01' * count)
+        return range(start, start + count)
+
+    def _update(self, node):
+        left, right = self._left[node], self._right[node]
+        self._size[node] = 1 + self._size[left] + self._size[right]
+        if left:
+            self._parent[left] = node
+        if right:
+            self._parent[right] = node
+
+    def _split(self, node, count):
+        """Разрезать поддерево: (первые count строк, остальные)"""
+        if not node:
+            return 0, 0
+        left = self._left[node]
+        if self._size[left] >= count:
+            first, rest = self._split(left, count)
+            self._left[node] = rest
+            self._update(node)
+            return first, node
+        first, rest = self._split(self._right[node], count - self._size[left] - 1)
+        self._right[node] = first
+        self._update(node)
+        return node, rest
+
+    def _merge(self, first, second):
+        """Склеить поддеревья: сначала строки first, затем second"""
+        if not first or not second:
+            return first or second
+        if self._priority[first] > self._priority[second]:
+            self._right[first] = self._merge(self._right[first], second)
+            self._update(first)
+            return first
+        self._left[second] = self._merge(first, self._left[second])
+        self._update(second)
+        return second
+
+    def _build(self, nodes):
+        """Дерево из узлов в заданном порядке за O(len(nodes)) (стек правой ветви)"""
+        stack = []
+        for node in nodes:
+            last = 0
+            while stack and self._priority[stack[-1]] < self._priority[node]:
+                last = stack.pop()
+                self._update(last)
+            self._left[node] = last
+            if stack:
+                self._right[stack[-1]] = node
+            stack.append(node)
+        while stack:
+            root = stack.pop()
+            self._update(root)
+        return root if nodes else 0
+
+    def _set_root(self, root):
+        self._root = root
+        self._parent[root] = 0
+        self._order = None
+
+    def _collect(self, node):
+        """Идентификаторы поддерева по порядку строк"""
+        ids = array('I')
+        stack = []
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = self._left[node]
+            node = stack.pop()
+            ids.append(node)
+            node = self._right[node]
+        return ids
+
+    def insert(self, position, count=1):
+        """Вставить count новых строк перед позицией position; вернуть их идентификаторы"""
+        position = min(max(0, position), len(self))
+        nodes = self._new_nodes(count)
+        first, rest = self._split(self._root, position)
+        self._set_root(self._merge(self._merge(first, self._build(nodes)), rest))
+        return list(nodes)
+
+    def extend(self, count):
+        """Добавить count строк в конец"""
+        return self.insert(len(self), count)
+
+    def delete(self, position, count=1):
+        """Удалить count строк с позиции position; вернуть их идентификаторы"""
+        first, rest = self._split(self._root, position)
+        removed, rest = self._split(rest, count)
+        ids = self._collect(removed)
+        for node in ids:
+            self._alive[node] = 0
+        self._set_root(self._merge(first, rest))
+        return list(ids)
+
+    def resize(self, length):
+        """Подогнать число строк под загруженный лист (строки добавляются и убираются в конце)"""
+        if length > len(self):
+            self.extend(length - len(self))
+        elif length < len(self):
+            self.delete(length, len(self) - length)
+
+    def position(self, row_id):
+        """Текущая позиция строки (с нуля) или None, если строка удалена или неизвестна"""
+        if not 0 < row_id < len(self._alive) or not self._alive[row_id]:
+            return None
+        position = self._size[self._left[row_id]]
+        node = row_id
+        parent = self._parent[node]
+        while parent:
+            if self._right[parent] == node:
+                position += self._size[self._left[parent]] + 1
+            node, parent = parent, self._parent[parent]
+        return position
+
+    def id_at(self, position):
+        """Идентификатор строки на позиции position (с нуля)"""
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        node = self._root
+        while True:
+            left_size = self._size[self._left[node]]
+            if position < left_size:
+                node = self._left[node]
+            elif position == left_size:
+                return node
+            else:
+                position -= left_size + 1
+                node = self._right[node]
+
+    def ids(self):
+        """Идентификаторы всех строк по порядку (массив; кэшируется до изменения)"""
+        if self._order is None:
+            self._order = self._collect(self._root)
+        return self._order
+
+    def encode(self, row_id):
+        """Идентификатор для callback-данных кнопок"""
+        return f"{self.epoch}{row_id:x}"
+
+    def decode(self, token):
+        """Идентификатор из callback-данных или None, если он из другого запуска"""
+        if len(token) <= self.EPOCH_LENGTH or not token.startswith(self.epoch):
+            return None
+        try:
+            return int(token[self.EPOCH_LENGTH:], 16)
+        except ValueError:
+            return None
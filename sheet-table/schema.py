@@ -0,0 +1,44 @@
+import hashlib
+import time
+
+
+def header_hash(header):
+    """Короткий хэш строки заголовков (порядок и названия столбцов)"""
+    digest = hashlib.blake2b(digest_size=8)
+    for name in header:
+        digest.update(str(name).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+class SchemaTracker:
+    """Отслеживание изменений строки заголовков листа
+
+    Каждая проверка сравнивает хэш заголовков с последним известным; при
+    изменении версия схемы увеличивается. Кэши, зависящие от расположения
+    столбцов, сверяют свою версию со schema.version и перестраиваются.
+    """
+
+    def __init__(self):
+        self.columns = []
+        self.hash = None
+        self.version = 0
+        self.checked_at = None
+
+    def age(self):
+        """Секунды с последней проверки заголовков (бесконечность, если проверок не было)"""
+        if self.checked_at is None:
+            return float('inf')
+        return time.monotonic() - self.checked_at
+
+    def observe(self, header):
+        """Учесть актуальные заголовки; True, если схема изменилась"""
+        self.checked_at = time.monotonic()
+        new_hash = header_hash(header)
+        if new_hash == self.hash:
+            return False
+
+        self.columns = list(header)
+        self.hash = new_hash
+        self.version += 1
+        return True
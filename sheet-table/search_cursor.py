@@ -0,0 +1,91 @@
+import time
+
+
+class SearchCursor:
+    """Ленивый курсор по результатам поиска
+
+    Результаты берутся из итератора по мере надобности: для показа страницы N
+    достаточно найти N * per_page совпадений, остальное ищется только при
+    переходе дальше. Уже найденные строки хранятся в буфере, поэтому
+    возврат на предыдущие страницы не повторяет поиск.
+    """
+
+    def __init__(self, search_value, results, per_page=10, total=None, snapshot=None):
+        self.search_value = search_value
+        self.per_page = per_page
+        self.snapshot = snapshot  # Снимок, по которому выполнен поиск (номера строк - его)
+        self._results = iter(results)
+        self._buffer = []
+        self._total = total  # Известно заранее (например, для поиска по индексу)
+        self.exhausted = False
+
+    def _fetch_until(self, count):
+        """Дочитать из итератора, пока в буфере не станет count строк"""
+        while not self.exhausted and len(self._buffer) < count:
+            try:
+                self._buffer.append(next(self._results))
+            except StopIteration:
+                self.exhausted = True
+                self._total = len(self._buffer)
+
+    @property
+    def total_known(self):
+        return self._total is not None
+
+    @property
+    def found_count(self):
+        """Точное число результатов, если известно, иначе - сколько найдено на данный момент"""
+        return self._total if self._total is not None else len(self._buffer)
+
+    def page(self, page):
+        """Строки страницы page (с 1) и число страниц (точное или "известно не меньше")"""
+        page = max(1, page)
+        start = (page - 1) * self.per_page
+        # Берем на одну строку больше, чтобы знать, есть ли следующая страница
+        self._fetch_until(start + self.per_page + 1)
+
+        rows = self._buffer[start:start + self.per_page]
+        return rows, self.total_pages()
+
+    def total_pages(self):
+        """Число страниц по уже известным результатам"""
+        return max(1, (self.found_count + self.per_page - 1) // self.per_page)
+
+
+class SearchSessions:
+    """Последний курсор поиска каждого пользователя
+
+    Курсор держит снимок, по которому выполнен поиск, поэтому сессии, к
+    которым не обращались дольше max_idle секунд, освобождаются (как
+    закрепленные версии в SnapshotPins).
+    """
+
+    def __init__(self, max_idle):
+        self.max_idle = max_idle
+        self._sessions = {}
+
+    def put(self, user_id, cursor):
+        self.collect()
+        self._sessions[user_id] = (cursor, time.monotonic())
+
+    def get(self, user_id):
+        """Курсор пользователя или None, если поиска не было или он устарел"""
+        entry = self._sessions.get(user_id)
+        if entry is None:
+            return None
+        cursor, used_at = entry
+        if time.monotonic() - used_at > self.max_idle:
+            del self._sessions[user_id]
+            return None
+        self._sessions[user_id] = (cursor, time.monotonic())
+        return cursor
+
+    def collect(self):
+        """Освободить сессии, к которым не обращались дольше max_idle секунд"""
+        now = time.monotonic()
+        for user_id, (_, used_at) in list(self._sessions.items()):
+            if now - used_at > self.max_idle:
+                del self._sessions[user_id]
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,153 @@
+from columnar import ColumnarStore
+from normalize import NormalizedShadow, normalize_text
+
+
+class ColumnIndex:
+    """Индекс одного столбца: нормализованное значение -> номера записей в снимке"""
+
+    __slots__ = ('postings', 'row_count')
+
+    def __init__(self):
+        self.postings = {}
+        self.row_count = 0  # Сколько записей имеют непустое значение в столбце
+
+    def add(self, value, index):
+        key = normalize_value(value)
+        if not key:
+            return
+        bucket = self.postings.get(key)
+        if bucket is None:
+            self.postings[key] = [index]
+        else:
+            bucket.append(index)
+        self.row_count += 1
+
+    def add_rows(self, key, indexes):
+        """Добавить сразу все записи с одинаковым значением (key уже нормализован)"""
+        if not key or not indexes:
+            return
+        bucket = self.postings.get(key)
+        if bucket is None:
+            self.postings[key] = list(indexes)
+        else:
+            bucket.extend(indexes)
+        self.row_count += len(indexes)
+
+    def moved(self, moves):
+        """Копия индекса, где записи перенесены на новые значения: [(запись, было, стало)]
+
+        Ключи уже нормализованы. Списки записей не изменяются на месте, а
+        заменяются копиями, так что исходный индекс не меняется.
+        """
+        index = ColumnIndex()
+        index.postings = dict(self.postings)
+        index.row_count = self.row_count
+        for row, old_key, new_key in moves:
+            if old_key:
+                bucket = [i for i in index.postings.get(old_key, ()) if i != row]
+                if bucket:
+                    index.postings[old_key] = bucket
+                else:
+                    index.postings.pop(old_key, None)
+                index.row_count -= 1
+            if new_key:
+                index.postings[new_key] = index.postings.get(new_key, []) + [row]
+                index.row_count += 1
+        return index
+
+    def exact(self, value):
+        """Записи, у которых значение в столбце совпадает полностью"""
+        return self.postings.get(normalize_value(value), ())
+
+    def containing(self, text):
+        """Записи, у которых значение содержит подстроку (перебор различных значений)"""
+        needle = normalize_value(text)
+        found = set()
+        for key, bucket in self.postings.items():
+            if needle in key:
+                found.update(bucket)
+        return found
+
+    def matching(self, predicate):
+        """Записи, для значений которых predicate(нормализованное значение) истинно"""
+        found = set()
+        for key, bucket in self.postings.items():
+            if predicate(key):
+                found.update(bucket)
+        return found
+
+
+def normalize_value(value):
+    """Нормализация значения для сравнения в индексе (см. normalize.normalize_text)"""
+    return normalize_text(value)
+
+
+class SheetIndex:
+    """Поколоночные индексы поверх снимка листа
+
+    Строится один раз на версию снимка (см. SheetSnapshot.derived) и
+    используется планировщиком запросов из query.py.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.size = len(snapshot)
+        self.columns = [ColumnIndex() for _ in range(snapshot.width)]
+
+        # Значения в снимке закодированы словарем, а их нормализованные формы
+        # уже посчитаны в тени: добавляем сразу все записи каждого значения
+        self.shadow = NormalizedShadow.for_snapshot(snapshot)
+        for col, column_index in enumerate(self.columns):
+            encoded = snapshot.rows.column(col)
+            for key, indexes in zip(self.shadow.columns[col], encoded.rows_by_code()):
+                column_index.add_rows(key, indexes)
+
+    @classmethod
+    def for_snapshot(cls, snapshot):
+        """Индекс для снимка (кэшируется в самом снимке)"""
+        return snapshot.derived('search_index', cls)
+
+    def updated(self, snapshot, changes):
+        """Индекс для новой версии снимка с замененными строками {индекс: значения}
+
+        Столбцы, в которых значения записанных строк не изменились,
+        разделяются с этим индексом; в остальных переносятся только
+        записанные строки (см. ColumnIndex.moved).
+        """
+        index = SheetIndex.__new__(SheetIndex)
+        index.snapshot = snapshot
+        index.size = len(snapshot)
+        index.shadow = NormalizedShadow.for_snapshot(snapshot)
+        index.columns = []
+        for col in range(snapshot.width):
+            column_index = self.columns[col] if col < len(self.columns) else ColumnIndex()
+            moves = []
+            for row in sorted(changes):
+                old_key = self.shadow.cell(row, col) if row < self.size else ''
+                new_key = index.shadow.cell(row, col)
+                if old_key != new_key:
+                    moves.append((row, old_key, new_key))
+            index.columns.append(column_index.moved(moves) if moves else column_index)
+        return index
+
+    @property
+    def typed(self):
+        """Типизированное поколоночное хранилище того же снимка"""
+        return ColumnarStore.for_snapshot(self.snapshot)
+
+    def all_rows(self):
+        """Записи, из которых вычитается отрицание (NOT): пустые строки листа не в счет"""
+        return set(self.snapshot.non_empty_indexes())
+
+    def column(self, col):
+        """Индекс столбца (col - с нуля); пустой индекс для несуществующего столбца"""
+        if 0 <= col < len(self.columns):
+            return self.columns[col]
+        return ColumnIndex()
+
+    def cell(self, index, col):
+        return self.shadow.cell(index, col)
+
+    def row_cells(self, index):
+        """Нормализованные значения всех ячеек записи"""
+        return self.shadow.row(index)
@@ -0,0 +1,225 @@
+import itertools
+import time
+
+from compact import CompactTable, memory_report
+from normalize import NormalizedShadow
+
+
+class RowRecord:
+    """Строка результата: номер строки в таблице и значения
+
+    Компактная замена словаря {'row_number', 'data'}: обращение по ключу
+    (record['data']) поддерживается для совместимости с остальным кодом.
+    """
+
+    __slots__ = ('row_number', 'data', 'distance')
+
+    def __init__(self, row_number, data, distance=None):
+        self.row_number = row_number
+        self.data = data
+        self.distance = distance
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if isinstance(key, str) else default
+
+
+class SheetSnapshot:
+    """Снимок значений листа, полученный одним запросом get_all_values()
+
+    Снимок не изменяется после создания. Производные структуры (индексы поиска
+    и т.п.) кэшируются внутри снимка через derived() и живут ровно столько же,
+    сколько сам снимок, поэтому замена снимка автоматически их сбрасывает.
+    """
+
+    _version_counter = itertools.count(1)
+
+    def __init__(self, values, schema_version=0, row_ids=None):
+        self.version = next(self._version_counter)
+        self.schema_version = schema_version  # Версия схемы заголовков, с которой загружен снимок
+        self.row_ids = row_ids  # Стабильные идентификаторы строк по индексу (см. RowIdMap)
+        self.header = list(values[0]) if values else []
+        # Данные без строки заголовков, в компактном поколоночном виде
+        self.rows = CompactTable(values[1:], len(self.header))
+        self.memory = memory_report(values[1:], self.rows)
+        self.loaded_at = time.monotonic()
+        self._derived = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def width(self):
+        """Число столбцов (по заголовкам и самой длинной строке)"""
+        return self.rows.width
+
+    def age(self):
+        """Возраст снимка в секундах"""
+        return time.monotonic() - self.loaded_at
+
+    @staticmethod
+    def row_number(index):
+        """Номер строки в таблице по индексу в снимке"""
+        return index + 2  # Первая строка - заголовки
+
+    @staticmethod
+    def index_of(row_number):
+        """Индекс в снимке по номеру строки в таблице"""
+        return row_number - 2
+
+    def cell(self, index, col):
+        """Значение ячейки (col - с нуля), пустая строка за пределами данных"""
+        return self.rows.cell(index, col)
+
+    def row_info(self, index):
+        """Строка в формате RowRecord (ключи 'row_number', 'data'), как в остальном сервисе"""
+        return RowRecord(self.row_number(index), self.rows[index])
+
+    def non_empty_indexes(self):
+        """Индексы записей, где есть хотя бы одна непустая ячейка (кэшируется)"""
+        return self.derived('non_empty', _non_empty_indexes)
+
+    def row_id(self, index):
+        """Стабильный идентификатор записи или None, если идентификаторы не назначены"""
+        if self.row_ids is None or not 0 <= index < len(self.row_ids):
+            return None
+        return self.row_ids[index]
+
+    def with_rows(self, changes, row_ids=None):
+        """Новая версия снимка с замененными строками {индекс: значения}
+
+        Используется для записи через кэш (write-through): неизмененные столбцы
+        разделяются с исходным снимком, время загрузки остается прежним, чтобы
+        снимок все равно перезагружался по CACHE_TTL. Нормализованная тень
+        переносится сразу; индексы, которые умеют обновляться (updated),
+        переносит вызывающий код, остальные производные структуры новая версия
+        строит заново. row_ids - идентификаторы, если строк стало больше.
+        """
+        return self._derive_version(self.rows.with_rows(changes), row_ids)
+
+    def spliced(self, index, delete_count, rows, new_ids=()):
+        """Новая версия снимка со вставленными или удаленными строками
+
+        delete_count записей с индекса index заменяются строками rows с
+        идентификаторами new_ids. Как и в with_rows, неизменная часть данных
+        копируется массивами, а не перечитывается из таблицы.
+        """
+        row_ids = None
+        if self.row_ids is not None:
+            row_ids = self.row_ids[:index]
+            row_ids.extend(new_ids)
+            row_ids.extend(self.row_ids[index + delete_count:])
+        return self._derive_version(self.rows.spliced(index, delete_count, rows), row_ids)
+
+    def _derive_version(self, rows, row_ids=None):
+        snapshot = SheetSnapshot.__new__(SheetSnapshot)
+        snapshot.version = next(self._version_counter)
+        snapshot.schema_version = self.schema_version
+        snapshot.row_ids = row_ids if row_ids is not None else self.row_ids
+        snapshot.header = self.header
+        snapshot.rows = rows
+        snapshot.memory = self.memory
+        snapshot.loaded_at = self.loaded_at
+        snapshot._derived = {}
+        # Тень зависит только от словарей столбцов и переносится всегда:
+        # нормализуются лишь значения, добавленные записью
+        shadow = self._derived.get('normalized')
+        if shadow is not None:
+            snapshot._derived['normalized'] = shadow.updated(snapshot)
+        return snapshot
+
+    def peek_derived(self, key):
+        """Уже построенная производная структура или None (без построения)"""
+        return self._derived.get(key)
+
+    def derived(self, key, factory):
+        """Получить производную структуру, построив ее при первом обращении"""
+        value = self._derived.get(key)
+        if value is None:
+            value = factory(self)
+            self._derived[key] = value
+        return value
+
+
+class _Pin:
+    __slots__ = ('snapshot', 'refs', 'used_at')
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.refs = 0
+        self.used_at = time.monotonic()
+
+
+class SnapshotPins:
+    """Версии снимка, закрепленные за сессиями листания
+
+    Сессия закрепляет версию, действовавшую при ее начале, и листает ее, даже
+    если снимок сервиса уже заменен новой версией: номера страниц не
+    сдвигаются от чужих вставок и записей. Версии разделяют неизмененные
+    столбцы (копирование при записи), поэтому закрепленная старая версия
+    стоит только измененных столбцов. Версия хранится, пока на нее есть
+    ссылки; сессии, брошенные дольше max_idle секунд, освобождаются.
+    """
+
+    def __init__(self, max_idle):
+        self.max_idle = max_idle
+        self._pins = {}
+
+    def pin(self, snapshot):
+        """Закрепить снимок за новой сессией; вернуть его версию"""
+        self.collect()
+        entry = self._pins.get(snapshot.version)
+        if entry is None:
+            entry = self._pins[snapshot.version] = _Pin(snapshot)
+        entry.refs += 1
+        entry.used_at = time.monotonic()
+        return snapshot.version
+
+    def get(self, version):
+        """Закрепленный снимок версии version или None, если он уже освобожден"""
+        entry = self._pins.get(version)
+        if entry is None:
+            return None
+        entry.used_at = time.monotonic()
+        return entry.snapshot
+
+    def release(self, version):
+        """Сессия больше не использует версию; без ссылок версия освобождается"""
+        entry = self._pins.get(version)
+        if entry is None:
+            return
+        entry.refs -= 1
+        if entry.refs <= 0:
+            del self._pins[version]
+
+    def collect(self):
+        """Освободить версии, к которым не обращались дольше max_idle секунд"""
+        now = time.monotonic()
+        for version, entry in list(self._pins.items()):
+            if now - entry.used_at > self.max_idle:
+                del self._pins[version]
+
+    def __len__(self):
+        return len(self._pins)
+
+
+def _non_empty_indexes(snapshot):
+    flags = bytearray(len(snapshot))
+    for column in snapshot.rows.columns:
+        # Проверяем различные значения, а не каждую ячейку
+        filled = {code for code, value in enumerate(column.distinct()) if value.strip()}
+        for index, code in enumerate(column.codes):
+            if code in filled:
+                flags[index] = 1
+    return [index for index, flag in enumerate(flags) if flag]
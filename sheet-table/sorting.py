@@ -0,0 +1,130 @@
+import itertools
+from array import array
+from bisect import bisect_left, insort
+
+from columnar import KIND_TEXT, infer_kind, parse_as
+from normalize import normalize_text
+
+
+class SortedView:
+    """Порядок записей снимка по значению одного столбца
+
+    order - перестановка индексов записей с непустым значением в столбце,
+    упорядоченная по (ключ значения, индекс); blanks - непустые записи с
+    пустой ячейкой в этом столбце, они идут в конце при любом направлении.
+    Тип столбца (число, дата, текст) определяется при построении; значения,
+    не разобранные как число или дата, идут после разобранных, по алфавиту.
+
+    Строится один раз на версию снимка: различные значения столбца
+    сортируются один раз, записи раскладываются по кодам. Страница в любом
+    направлении - срез перестановки, как и без сортировки.
+    """
+
+    def __init__(self, snapshot, col):
+        self.snapshot = snapshot
+        self.col = col
+        self.order = array('I')
+        self.blanks = []
+        if col >= snapshot.width:
+            self.kind = KIND_TEXT
+            self.blanks = list(snapshot.non_empty_indexes())
+            return
+
+        column = snapshot.rows.column(col)
+        distinct = column.distinct()
+        self.kind, _ = infer_kind(distinct[1:])
+        keys = [self.sort_key(value) for value in distinct]
+
+        buckets = column.rows_by_code()
+        ranked = sorted((key, code) for code, key in enumerate(keys) if key is not None)
+        for _, group in itertools.groupby(ranked, key=lambda item: item[0]):
+            codes = [code for _, code in group]
+            if len(codes) == 1:
+                self.order.extend(buckets[codes[0]])
+            else:
+                # Разные написания с одинаковым ключом ("1" и "1,0") - по порядку записей
+                self.order.extend(sorted(itertools.chain.from_iterable(buckets[code] for code in codes)))
+
+        self.blanks = [index for index in snapshot.non_empty_indexes() if keys[column.codes[index]] is None]
+
+    @classmethod
+    def for_snapshot(cls, snapshot, col):
+        """Порядок по столбцу col (с нуля) для снимка (кэшируется в самом снимке)"""
+        return snapshot.derived(('sorted', col), lambda snapshot: cls(snapshot, col))
+
+    def __len__(self):
+        return len(self.order) + len(self.blanks)
+
+    def sort_key(self, value):
+        """Ключ сортировки значения; None для пустого"""
+        text = normalize_text(value)
+        if not text:
+            return None
+        if self.kind != KIND_TEXT:
+            parsed = parse_as(self.kind, value)
+            if parsed is not None:
+                return 0, parsed
+        return 1, text
+
+    def page(self, start, end, descending=False):
+        """Индексы записей на позициях [start, end) в порядке сортировки"""
+        count = len(self.order)
+        indexes = []
+        for position in range(max(0, start), min(end, len(self))):
+            if position >= count:
+                indexes.append(self.blanks[position - count])
+            elif descending:
+                indexes.append(self.order[count - 1 - position])
+            else:
+                indexes.append(self.order[position])
+        return indexes
+
+    def _locate(self, snapshot, index, key):
+        """Позиция записи index с ключом key в order (по значениям снимка snapshot)"""
+        target = (key, index)
+        low, high = 0, len(self.order)
+        while low < high:
+            middle = (low + high) // 2
+            other = self.order[middle]
+            if (self.sort_key(snapshot.cell(other, self.col)), other) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def updated(self, snapshot, changes):
+        """Порядок для новой версии снимка с замененными строками {индекс: значения}
+
+        Измененные записи удаляются по старым значениям и вставляются по новым
+        бинарным поиском, остальная перестановка копируется массивом; старая
+        версия снимка сохраняет свой порядок.
+        """
+        view = SortedView.__new__(SortedView)
+        view.snapshot = snapshot
+        view.col = self.col
+        view.kind = self.kind
+        view.order = array('I', self.order)
+        view.blanks = list(self.blanks)
+
+        old_length = len(self.snapshot)
+        for index in sorted(changes):
+            if index >= old_length:
+                continue
+            old_key = view.sort_key(self.snapshot.cell(index, self.col))
+            if old_key is not None:
+                position = view._locate(self.snapshot, index, old_key)
+                if position < len(view.order) and view.order[position] == index:
+                    del view.order[position]
+            else:
+                position = bisect_left(view.blanks, index)
+                if position < len(view.blanks) and view.blanks[position] == index:
+                    del view.blanks[position]
+
+        for index, values in sorted(changes.items()):
+            value = values[self.col] if self.col < len(values) else ''
+            key = view.sort_key(value)
+            if key is not None:
+                view.order.insert(view._locate(snapshot, index, key), index)
+            elif any(str(cell).strip() for cell in values):
+                insort(view.blanks, index)
+        return view
@@ -0,0 +1,90 @@
+import heapq
+from bisect import bisect_left
+from collections import Counter
+
+from fuzzy import MAX_TERM_LENGTH, DeletionIndex, default_max_distance
+from normalize import NormalizedShadow, normalize_text
+
+
+class ColumnSuggestions:
+    """Различные значения столбца, отсортированные по нормализованной форме, с частотами
+
+    Значения с одинаковой нормализованной формой ("Москва", "москва ")
+    объединяются: предлагается самое частое написание, частота - общая.
+    Подсказки по началу ввода - бинарный поиск диапазона ключей и выбор
+    самых частых; если ввод не продолжает ни одно значение, ищутся значения
+    с опечатками (словарь удалений строится при первом таком запросе).
+    """
+
+    def __init__(self, snapshot, col):
+        column = snapshot.rows.column(col) if col < snapshot.width else None
+        grouped = {}
+        if column is not None:
+            normalized = NormalizedShadow.for_snapshot(snapshot).columns[col]
+            distinct = column.distinct()
+            for code, count in Counter(column.codes).items():
+                key = normalized[code]
+                if not key:
+                    continue
+                spellings = grouped.get(key)
+                if spellings is None:
+                    spellings = grouped[key] = []
+                spellings.append((count, distinct[code]))
+
+        self.keys = sorted(grouped)
+        self.values = []
+        self.counts = []
+        for key in self.keys:
+            spellings = grouped[key]
+            self.values.append(max(spellings)[1])
+            self.counts.append(sum(count for count, _ in spellings))
+        self._position = {key: i for i, key in enumerate(self.keys)}
+        self._deletions = None
+
+    @classmethod
+    def for_snapshot(cls, snapshot, col):
+        """Подсказки для столбца col (с нуля) снимка (кэшируются в самом снимке)"""
+        return snapshot.derived(('suggestions', col), lambda snapshot: cls(snapshot, col))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def most_common(self, limit, min_count=1):
+        """Самые частые значения столбца (встречающиеся не меньше min_count раз)"""
+        top = heapq.nlargest(limit, range(len(self.keys)), key=self.counts.__getitem__)
+        return [self.values[i] for i in top if self.counts[i] >= min_count]
+
+    def suggest(self, text, limit):
+        """До limit существующих значений для ввода text: продолжения, затем близкие по написанию"""
+        prefix = normalize_text(text)
+        if not prefix:
+            return self.most_common(limit)
+
+        start = bisect_left(self.keys, prefix)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(prefix):
+            end += 1
+        found = heapq.nlargest(limit, range(start, end), key=self.counts.__getitem__)
+
+        if len(found) < limit:
+            max_distance = default_max_distance(prefix)
+            if max_distance:
+                close = sorted(
+                    (distance, -self.counts[self._position[term]], self._position[term])
+                    for distance, term in self.deletions().search(prefix, max_distance)
+                )
+                found.extend(i for _, _, i in close if i not in found)
+        return [self.values[i] for i in found[:limit]]
+
+    def deletions(self):
+        if self._deletions is None:
+            self._deletions = DeletionIndex()
+            for key in self.keys:
+                if len(key) <= MAX_TERM_LENGTH:
+                    self._deletions.add(key)
+        return self._deletions
+
+    def canonical(self, text):
+        """Существующее написание значения text (после нормализации) или None"""
+        position = self._position.get(normalize_text(text))
+        return self.values[position] if position is not None else None
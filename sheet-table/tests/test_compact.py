@@ -0,0 +1,145 @@
+import random
+
+from compact import CompactTable, EncodedColumn, StringHeap
+
+VALUES = ['', 'a', 'b', 'Москва', ' ', '10'] + [f'v{i}' for i in range(400)]
+
+
+def as_lists(table):
+    return [list(row) for row in table]
+
+
+def padded(rows, width):
+    return [list(row) + [''] * (width - len(row)) for row in rows]
+
+
+def random_row(rng, width):
+    return [rng.choice(VALUES) for _ in range(rng.randint(0, width))]
+
+
+def check_columns(table):
+    for column in table.columns:
+        assert len(column) == len(table)
+        distinct = column.distinct()
+        assert distinct[0] == '' and len(set(distinct)) == len(distinct)
+        assert max(column.codes, default=0) < len(distinct)
+
+
+def test_encoded_column_round_trip():
+    values = ['x', '', 'y', 'x', 'x']
+    column = EncodedColumn(values)
+    assert column.values() == values
+    assert column.distinct() == ['', 'x', 'y']
+    assert column.rows_by_code() == [[1], [0, 3, 4], [2]]
+
+
+def test_code_width_grows_with_dictionary():
+    column = EncodedColumn(['x'])
+    assert column.codes.itemsize == 1
+    wide = column.patched({0: 'new', 1: 'other'}, 2)
+    wide = wide.patched({i: f'value {i}' for i in range(300)}, 300)
+    assert wide.codes.itemsize == 2
+    assert wide.values() == [f'value {i}' for i in range(300)]
+    assert column.values() == ['x']
+
+
+def test_new_values_are_appended_to_the_shared_dictionary():
+    table = CompactTable([['a'], ['b']])
+    first = table.with_rows({0: ['c']})
+    assert first.columns[0].dictionary is table.columns[0].dictionary
+    assert table.columns[0].distinct() == ['', 'a', 'b']
+    assert first.columns[0].distinct() == ['', 'a', 'b', 'c']
+
+    # Ветка от старой версии не видит и не портит значения новой
+    branch = table.with_rows({1: ['d']})
+    assert branch.columns[0].dictionary is not table.columns[0].dictionary
+    assert branch.columns[0].distinct() == ['', 'a', 'b', 'd']
+    assert as_lists(first) == [['c'], ['b']]
+    assert as_lists(branch) == [['a'], ['d']]
+
+
+def test_heap_compaction_keeps_codes():
+    heap = StringHeap(['', 'a'])
+    codes = [heap.append(f'value {i}') for i in range(StringHeap.MIN_TAIL + 1)]
+    assert heap.needs_compaction()
+    compacted = heap.compacted()
+    assert not compacted.needs_compaction()
+    assert list(compacted) == list(heap)
+    assert [compacted.code_of(f'value {i}') for i in range(len(codes))] == codes
+
+
+def test_with_rows_shares_untouched_columns():
+    table = CompactTable([['a', 'b'], ['c', 'd']])
+    replaced = table.with_rows({1: ['c', 'x']})
+    assert replaced.columns[0] is table.columns[0]
+    assert replaced.columns[1] is not table.columns[1]
+    assert as_lists(replaced) == [['a', 'b'], ['c', 'x']]
+
+    # Одинаковое значение - тоже без копирования
+    assert table.with_rows({0: ['a', 'b']}).columns[1] is table.columns[1]
+
+
+def test_with_rows_append_keeps_dictionaries():
+    table = CompactTable([['a', 'b'], ['c', 'd']])
+    grown = table.with_rows({3: ['a']})
+    assert len(grown) == 4
+    assert as_lists(grown) == [['a', 'b'], ['c', 'd'], ['', ''], ['a', '']]
+    assert grown.columns[0].dictionary is table.columns[0].dictionary
+    assert grown.columns[1].dictionary is table.columns[1].dictionary
+    assert len(table) == 2 and as_lists(table) == [['a', 'b'], ['c', 'd']]
+
+
+def test_with_rows_matches_rebuild():
+    rng = random.Random(38)
+    for _ in range(200):
+        width = rng.randint(0, 4)
+        rows = [random_row(rng, width) for _ in range(rng.randint(0, 20))]
+        table = CompactTable(rows, width)
+        model = padded(rows, table.width)
+        for _ in range(5):
+            changes = {
+                rng.randint(0, len(model) + 3): random_row(rng, 6)
+                for _ in range(rng.randint(0, 4))
+            }
+            patched = table.with_rows(changes)
+
+            expected = [list(row) for row in model]
+            expected.extend([] for _ in range(max([len(model)] + [i + 1 for i in changes]) - len(model)))
+            for index, values in changes.items():
+                expected[index] = list(values)
+            expected = padded(expected, patched.width)
+
+            assert as_lists(patched) == expected
+            assert as_lists(patched) == as_lists(CompactTable(expected, patched.width))
+            assert as_lists(table) == model  # Старая версия не изменилась
+            check_columns(patched)
+            table, model = patched, expected
+
+
+def test_spliced_matches_list_model():
+    rng = random.Random(46)
+    for _ in range(200):
+        width = rng.randint(1, 4)
+        rows = [random_row(rng, width) for _ in range(rng.randint(0, 20))]
+        table = CompactTable(rows, width)
+        model = padded(rows, table.width)
+        for _ in range(5):
+            index = rng.randint(0, len(model))
+            delete_count = rng.randint(0, len(model) - index)
+            new_rows = [random_row(rng, 6) for _ in range(rng.randint(0, 3))]
+            spliced = table.spliced(index, delete_count, new_rows)
+
+            expected = model[:index] + [list(row) for row in new_rows] + model[index + delete_count:]
+            expected = padded(expected, spliced.width)
+            assert as_lists(spliced) == expected
+            assert as_lists(table) == model
+            check_columns(spliced)
+            table, model = spliced, expected
+
+
+def test_row_view_behaves_like_a_list():
+    table = CompactTable([['a', 'b', 'c']])
+    row = table[0]
+    assert row == ['a', 'b', 'c']
+    assert row[-1] == 'c' and row[1:] == ['b', 'c']
+    assert table.cell(0, 5) == ''
@@ -0,0 +1,51 @@
+import random
+
+from duplicates import DuplicateIndex
+from snapshot import SheetSnapshot
+
+HEADER = ['Имя', 'Город', 'Телефон']
+VALUES = ['', 'Анна', 'анна ', 'Москва', 'МОСКВА', '123']
+PROBES = [['Анна'], ['анна', 'москва'], ['', '', '123'], ['Москва', 'Анна', 'Анна']]
+
+
+def random_row(rng):
+    return [rng.choice(VALUES) for _ in range(rng.randint(0, 3))]
+
+
+def normalized_buckets(index):
+    return {key: sorted(rows) for key, rows in index.buckets.items()}
+
+
+def test_find_ignores_case_spaces_and_trailing_blanks():
+    snapshot = SheetSnapshot([HEADER, ['Анна', 'Москва', ''], ['Борис', 'Омск', '1'], ['', '', '']])
+    index = DuplicateIndex.for_snapshot(snapshot)
+    assert index.find([' анна', 'МОСКВА']) == [0]
+    assert index.find(['Анна', 'Москва', '1']) == []
+    assert index.find(['', '', '']) == []
+
+
+def test_key_columns():
+    snapshot = SheetSnapshot([HEADER, ['Анна', 'Москва', '1'], ['Борис', 'Омск', '1']])
+    index = DuplicateIndex(snapshot, key_columns=[2])
+    assert index.find(['Вера', 'Казань', '1']) == [0, 1]
+    assert index.find(['Анна', 'Москва', '2']) == []
+
+
+def test_updated_matches_rebuild():
+    rng = random.Random(48)
+    for key_columns in (None, [0, 2]):
+        snapshot = SheetSnapshot([HEADER] + [random_row(rng) for _ in range(30)])
+        index = DuplicateIndex(snapshot, key_columns)
+        for _ in range(100):
+            changes = {rng.randrange(len(snapshot) + 1): random_row(rng) for _ in range(rng.randint(1, 3))}
+            patched = snapshot.with_rows(changes)
+            updated = index.updated(patched, changes)
+            rebuilt = DuplicateIndex(patched, key_columns)
+
+            assert normalized_buckets(updated) == normalized_buckets(rebuilt)
+            for values in PROBES:
+                assert sorted(updated.find(values)) == rebuilt.find(values)
+            # Старая версия снимка сохраняет свой индекс
+            assert normalized_buckets(index) == normalized_buckets(DuplicateIndex(snapshot, key_columns))
+            snapshot, index = patched, updated
+
@@ -0,0 +1,106 @@
+import pytest
+
+from formula import FormulaError, UnsupportedFormula, column_letters, column_number, evaluate_formula, parse_formula
+from snapshot import SheetSnapshot
+
+TARGET = (2, 4)  # D2 - ячейка, куда пишется формула
+
+
+@pytest.fixture
+def snapshot():
+    return SheetSnapshot([
+        ['Name', 'Qty', 'Price', 'Total'],
+        ['a', '2', '10,5', ''],
+        ['b', '3', '4', ''],
+        ['c', '', 'x', ''],
+    ])
+
+
+@pytest.mark.parametrize('formula, expected', [
+    ('=B2*C2', '21'),
+    ('=2^10', '1024'),
+    ('=10%', '0.1'),
+    ('=1/0', '#DIV/0!'),
+    ('=C4+1', '#VALUE!'),
+    ('=B2&"-"&A2', '2-a'),
+    ('=2>1', 'TRUE'),
+    ('="1"=1', 'FALSE'),
+    ('=TRUE', 'TRUE'),
+    ('=ROUND(2.345; 2)', '2.35'),
+    ('=LEN("абв")', '3'),
+    ('=UPPER(A2)', 'A'),
+])
+def test_operators_and_scalar_functions(snapshot, formula, expected):
+    assert evaluate_formula(formula, snapshot, TARGET) == expected
+
+
+@pytest.mark.parametrize('formula, expected', [
+    ('=SUM(B2:B4)', '5'),
+    ('=SUM(B:B)', '5'),
+    ('=AVERAGE(B2:B3)', '2.5'),
+    ('=COUNT(B2:C4)', '4'),
+    ('=COUNTA(A1:A4)', '4'),
+    ('=COUNTIF(A2:A4,"b")', '1'),
+    ('=SUMIF(B2:B4,">2")', '3'),
+    ('=VLOOKUP("b",A2:C4,3,FALSE)', '4'),
+    ('=VLOOKUP("z",A2:C4,3,FALSE)', '#N/A'),
+])
+def test_range_functions(snapshot, formula, expected):
+    assert evaluate_formula(formula, snapshot, TARGET) == expected
+
+
+@pytest.mark.parametrize('formula', [
+    '=ROUND(1.5,30)',
+    '=ROUND(1e308*10,2)',
+    '=ROUND(1,1e308*10)',
+    '=1e308*10',
+    '=10^400',
+    '=SUM(1e308,1e308)',
+    '=AVERAGE(1e308,1e308)',
+])
+def test_overflow_and_excess_precision_are_num_errors(snapshot, formula):
+    assert evaluate_formula(formula, snapshot, TARGET) == '#NUM!'
+
+
+def test_num_error_is_caught_by_iferror(snapshot):
+    assert evaluate_formula('=IFERROR(1e308*10,"big")', snapshot, TARGET) == 'big'
+
+
+@pytest.mark.parametrize('formula', ['=A0', '=A0+1', '=SUM(A0:A2)'])
+def test_row_zero_is_ref_error(snapshot, formula):
+    assert evaluate_formula(formula, snapshot, TARGET) == '#REF!'
+
+
+def test_lazy_branches(snapshot):
+    assert evaluate_formula('=IF(B2>1,"big",1/0)', snapshot, TARGET) == 'big'
+    assert evaluate_formula('=IFERROR(1/0,"err")', snapshot, TARGET) == 'err'
+
+
+@pytest.mark.parametrize('formula', ['=D2', '=SUM(D:D)', '=SUM(A1:F9)'])
+def test_reference_to_target_cell_is_circular(snapshot, formula):
+    with pytest.raises(FormulaError, match='Циклическая ссылка'):
+        evaluate_formula(formula, snapshot, TARGET)
+
+
+@pytest.mark.parametrize('formula', ['=SUM(', '=1+', '=', '=ROUND()'])
+def test_syntax_errors(formula):
+    with pytest.raises(FormulaError):
+        parse_formula(formula)
+
+
+@pytest.mark.parametrize('formula', ['=Sheet2!A1', '=TODAY()'])
+def test_unsupported_constructs(snapshot, formula):
+    with pytest.raises(UnsupportedFormula):
+        evaluate_formula(formula, snapshot, TARGET)
+
+
+def test_empty_and_header_cells(snapshot):
+    assert evaluate_formula('=A1', snapshot, TARGET) == 'Name'
+    assert evaluate_formula('=B4', snapshot, TARGET) == ''
+    assert evaluate_formula('=A99', snapshot, TARGET) == ''
+
+
+def test_column_letters_round_trip():
+    for number in (1, 26, 27, 52, 702, 703, 16384):
+        assert column_number(column_letters(number)) == number
+    assert column_letters(28) == 'AB'
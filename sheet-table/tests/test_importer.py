@@ -0,0 +1,27 @@
+from importer import iter_csv_rows
+
+
+def write(tmp_path, data):
+    path = tmp_path / 'rows.csv'
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_utf8_sample_cut_inside_a_character(tmp_path):
+    # Заголовок подобран так, что граница образца (64 КБ) приходится на середину буквы "И"
+    header = 'Имя,Город' + ' ' * 65516 + '\r\n'
+    assert len(header.encode('utf-8')) == 65535
+    path = write(tmp_path, (header + 'Иван,Москва\r\n' * 3).encode('utf-8'))
+
+    rows = list(iter_csv_rows(path))
+    assert rows[1:] == [['Иван', 'Москва']] * 3
+
+
+def test_utf8_with_bom_and_semicolons(tmp_path):
+    path = write(tmp_path, 'Имя;Город\r\nИван;Москва\r\n'.encode('utf-8-sig'))
+    assert list(iter_csv_rows(path)) == [['Имя', 'Город'], ['Иван', 'Москва']]
+
+
+def test_cp1251_fallback(tmp_path):
+    path = write(tmp_path, 'Имя,Город\r\nИван,Москва\r\n'.encode('cp1251'))
+    assert list(iter_csv_rows(path)) == [['Имя', 'Город'], ['Иван', 'Москва']]
@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from columnar import ColumnarStore
+from fuzzy import FuzzyIndex
+from normalize import NormalizedShadow, normalize_text
+from search_index import SheetIndex
+from snapshot import SheetSnapshot
+
+HEADER = ['Имя', 'Город', 'Цена', 'Дата']
+NAMES = ['', 'Ёлка', 'елка ', 'Анна', 'анна мария', 'Москва', 'Берёза']
+PRICES = ['', '1', '1,0', '2.5', '10', 'много', '-3']
+DATES = ['', '2026-01-05', '05.01.2026', '31.12.2025', 'вчера']
+
+
+def random_row(rng, width=4):
+    row = [rng.choice(NAMES), rng.choice(NAMES), rng.choice(PRICES), rng.choice(DATES)]
+    return row[:rng.randint(0, width)]
+
+
+def build_all(snapshot):
+    """Построить (и закэшировать в снимке) все переносимые структуры"""
+    NormalizedShadow.for_snapshot(snapshot)
+    SheetIndex.for_snapshot(snapshot)
+    ColumnarStore.for_snapshot(snapshot)
+    FuzzyIndex.for_snapshot(snapshot)
+
+
+def postings(index):
+    return [
+        ({key: sorted(rows) for key, rows in column.postings.items()}, column.row_count)
+        for column in index.columns
+    ]
+
+
+def typed(store):
+    return [
+        (column.kind, column.values, column.sorted_keys, column.sorted_rows)
+        for column in store.columns
+    ]
+
+
+def check_shadow(snapshot):
+    shadow = snapshot.peek_derived('normalized')
+    assert shadow is not None and shadow.snapshot is snapshot
+    for index in range(len(snapshot)):
+        assert shadow.row(index) == [normalize_text(value) for value in snapshot.rows[index]]
+
+
+def write(snapshot, changes):
+    """Новая версия снимка с переносом индексов, как при записи через кэш"""
+    patched = snapshot.with_rows(changes)
+    for key in ('search_index', 'columnar', 'fuzzy_index'):
+        index = snapshot.peek_derived(key)
+        patched.derived(key, lambda _: index.updated(patched, changes))
+    return patched
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_updated_indexes_match_rebuild(seed):
+    rng = random.Random(seed)
+    snapshot = SheetSnapshot([HEADER[:3]] + [random_row(rng, 3) for _ in range(30)])
+    build_all(snapshot)
+    for _ in range(60):
+        changes = {rng.randrange(len(snapshot) + 2): random_row(rng) for _ in range(rng.randint(1, 3))}
+        changes = {min(index, len(snapshot) + position): values
+                   for position, (index, values) in enumerate(sorted(changes.items()))}
+        previous = snapshot
+        previous_postings = postings(previous.peek_derived('search_index'))
+        snapshot = write(snapshot, changes)
+
+        check_shadow(snapshot)
+        assert postings(snapshot.peek_derived('search_index')) == postings(SheetIndex(snapshot))
+        assert typed(snapshot.peek_derived('columnar')) == typed(ColumnarStore(snapshot))
+
+        fuzzy, rebuilt = snapshot.peek_derived('fuzzy_index'), FuzzyIndex(snapshot)
+        assert fuzzy.term_rows == rebuilt.term_rows
+        for probe in ('елка', 'ана', 'москва', 'береза'):
+            assert fuzzy.search(probe) == rebuilt.search(probe)
+
+        # Прежняя версия снимка сохраняет свои индексы
+        check_shadow(previous)
+        assert postings(previous.peek_derived('search_index')) == previous_postings
+
+
+def test_type_change_rebuilds_the_column():
+    snapshot = SheetSnapshot([['Код'], ['1'], ['2'], ['3']])
+    build_all(snapshot)
+    assert ColumnarStore.for_snapshot(snapshot).column(0).is_typed
+
+    snapshot = write(snapshot, {0: ['a'], 1: ['b']})
+    assert not snapshot.peek_derived('columnar').column(0).is_typed
+    assert typed(snapshot.peek_derived('columnar')) == typed(ColumnarStore(snapshot))
+
+
+def test_shadow_is_carried_through_splices():
+    rng = random.Random(7)
+    snapshot = SheetSnapshot([HEADER] + [random_row(rng) for _ in range(20)])
+    NormalizedShadow.for_snapshot(snapshot)
+    for _ in range(50):
+        index = rng.randint(0, len(snapshot))
+        delete_count = rng.randint(0, min(3, len(snapshot) - index))
+        snapshot = snapshot.spliced(index, delete_count, [random_row(rng, 5) for _ in range(rng.randint(0, 2))])
+        check_shadow(snapshot)
+
+
+def test_branching_versions_keep_their_shadow():
+    snapshot = SheetSnapshot([['A'], ['x']])
+    NormalizedShadow.for_snapshot(snapshot)
+    first = snapshot.with_rows({0: ['Ёж']})
+    second = snapshot.with_rows({0: ['Уж']})
+    check_shadow(first)
+    check_shadow(second)
+    check_shadow(snapshot)
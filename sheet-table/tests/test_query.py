@@ -0,0 +1,117 @@
+import pytest
+
+from query import And, Compare, Contains, Equals, Not, Or, QueryError, execute_query, is_plain_query, parse_query
+from search_index import SheetIndex
+from snapshot import SheetSnapshot
+
+HEADER = ['Имя', 'Город', 'Цена', 'Дата', 'Статус заказа']
+ROWS = [
+    ['Анна', 'Москва', '100', '2026-01-05', 'новый'],
+    ['', '', '', '', ''],
+    ['Борис', 'Омск', '1 500,5', '15.02.2026', 'оплачен'],
+    ['Вера', 'москва ', '99,9', '01.01.2026', ''],
+    ['Глеб', 'Казань', '2500', '2026-03-01 10:30', 'новый'],
+]
+
+
+@pytest.fixture
+def snapshot():
+    return SheetSnapshot([HEADER] + ROWS)
+
+
+def run(snapshot, text):
+    return execute_query(parse_query(text, snapshot.header), SheetIndex.for_snapshot(snapshot))
+
+
+def test_plain_text_is_one_substring():
+    node = parse_query('  москва  ', HEADER)
+    assert is_plain_query(node)
+    assert node.text == 'москва'
+    assert is_plain_query(parse_query('анна борис', HEADER))
+    assert not is_plain_query(parse_query('Город:москва', HEADER))
+
+
+def test_parse_tree():
+    node = parse_query('(Имя:ан OR Город=Омск) -Цена>100', HEADER)
+    assert isinstance(node, And)
+    either, negated = node.children
+    assert isinstance(either, Or)
+    assert [type(child) for child in either.children] == [Contains, Equals]
+    assert isinstance(negated, Not) and isinstance(negated.child, Compare)
+
+    quoted = parse_query('"Статус заказа"=новый', HEADER)
+    assert isinstance(quoted, Equals) and quoted.column == 4
+
+
+@pytest.mark.parametrize('text, message', [
+    ('', 'Пустой запрос'),
+    ('Нет=1', 'Неизвестный столбец'),
+    ('(Город=Омск', 'Не закрыта скобка'),
+    ('Город=', 'Не указано значение'),
+])
+def test_parse_errors(text, message):
+    with pytest.raises(QueryError, match=message):
+        parse_query(text, HEADER)
+
+
+def test_unknown_column_with_colon_is_plain_text(snapshot):
+    # Время "10:30" - не столбец, а подстрока
+    assert run(snapshot, '10:30') == [4]
+
+
+def test_contains_and_equals_ignore_case_and_spaces(snapshot):
+    assert run(snapshot, 'москва') == [0, 3]
+    assert run(snapshot, 'Город:моск') == [0, 3]
+    assert run(snapshot, 'Город=МОСКВА') == [0, 3]
+    assert run(snapshot, 'Город=моск') == []
+
+
+def test_number_comparisons_and_ranges(snapshot):
+    assert run(snapshot, 'Цена>100') == [2, 4]
+    assert run(snapshot, 'Цена>=100') == [0, 2, 4]
+    assert run(snapshot, 'Цена<100') == [3]
+    assert run(snapshot, 'Цена<=99,9') == [3]
+    assert run(snapshot, 'Цена:100..1500,5') == [0, 2]
+    assert run(snapshot, 'Цена:1000..1') == []
+
+
+def test_date_comparisons_accept_every_format(snapshot):
+    assert run(snapshot, 'Дата>2026-01-05') == [2, 4]
+    assert run(snapshot, 'Дата>=05.01.2026') == [0, 2, 4]
+    assert run(snapshot, 'Дата<01/02/2026') == [0, 3]
+    assert run(snapshot, 'Дата:2026-01-01..2026-01-31') == [0, 3]
+
+
+def test_comparison_needs_a_value_of_the_column_type(snapshot):
+    with pytest.raises(QueryError, match='нужно число'):
+        run(snapshot, 'Цена>много')
+    with pytest.raises(QueryError, match='нужна дата'):
+        run(snapshot, 'Дата>вчера')
+
+
+def test_text_column_compares_parsed_numbers():
+    snapshot = SheetSnapshot([['Код'], ['10'], ['abc'], ['5'], ['x1'], ['7']])
+    assert run(snapshot, 'Код>6') == [0, 4]
+
+
+def test_not_skips_blank_rows(snapshot):
+    assert run(snapshot, '-москва') == [2, 4]
+    assert run(snapshot, 'NOT Город=москва') == [2, 4]
+    assert run(snapshot, 'Город!=Омск') == [0, 3, 4]
+    assert run(snapshot, 'НЕ "Статус заказа":новый') == [2, 3]
+
+
+def test_boolean_combinations(snapshot):
+    assert run(snapshot, 'анна OR омск') == [0, 2]
+    assert run(snapshot, '"Статус заказа":новый AND Цена>1000') == [4]
+    assert run(snapshot, '"Статус заказа":новый Цена>1000') == [4]
+    assert run(snapshot, '(анна ИЛИ борис) -омск') == [0]
+    assert run(snapshot, 'Город=москва И Цена>1000') == []
+
+
+def test_matches_agrees_with_evaluate(snapshot):
+    index = SheetIndex.for_snapshot(snapshot)
+    for text in ['Цена>100', '-москва', 'Дата<2026-02-01', 'Город:ом OR "Статус заказа"=новый']:
+        node = parse_query(text, snapshot.header)
+        expected = execute_query(node, index)
+        assert [row for row in snapshot.non_empty_indexes() if node.matches(index, row)] == expected
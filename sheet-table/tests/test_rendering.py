@@ -0,0 +1,34 @@
+from rendering import TELEGRAM_MESSAGE_LIMIT, MessageBuilder, escape_markdown
+from utils import format_row_data, format_search_results
+
+
+def test_long_row_is_split_into_messages():
+    columns = [f'Поле {i}' for i in range(40)]
+    row = {'row_number': 7, 'data': ['х' * 300] * 40}
+    chunks = format_row_data(row, columns)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= TELEGRAM_MESSAGE_LIMIT for chunk in chunks)
+    assert chunks[0].startswith('📋 **Строка 7:**')
+    assert sum(chunk.count('**Поле') for chunk in chunks) == 40
+
+
+def test_short_results_fit_one_message():
+    rows = [{'row_number': 2, 'data': ['a', 'b']}]
+    assert len(format_search_results(rows, 'a')) == 1
+    assert format_search_results([], 'a') == ["🔍 По запросу '**a**' ничего не найдено."]
+
+
+def test_backslash_is_escaped():
+    assert escape_markdown('C:\\temp_1') == 'C:\\\\temp\\_1'
+    assert escape_markdown('\\*') == '\\\\\\*'
+
+
+def test_split_keeps_escaped_backslash_pairs():
+    text = escape_markdown('a' * 9 + '\\' + 'b' * 5)
+    chunks = MessageBuilder(limit=10).add(text).build()
+    assert ''.join(chunks) == text
+    assert all(not chunk.endswith('\\') or chunk.endswith('\\\\') for chunk in chunks)
+    assert chunks[0] == 'a' * 9
+
+    text = 'a' * 8 + escape_markdown('\\') + 'b' * 5
+    assert MessageBuilder(limit=10).add(text).build()[0] == 'a' * 8 + '\\\\'
@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from row_ids import RowIdMap
+
+
+def check_against_model(row_ids, model):
+    assert len(row_ids) == len(model)
+    assert list(row_ids.ids()) == model
+    for position, row_id in enumerate(model):
+        assert row_ids.id_at(position) == row_id
+        assert row_ids.position(row_id) == position
+
+
+def test_extend_assigns_distinct_ids():
+    row_ids = RowIdMap()
+    ids = row_ids.extend(5)
+    assert len(set(ids)) == 5
+    check_against_model(row_ids, ids)
+
+
+def test_ids_survive_insert_and_delete_above():
+    row_ids = RowIdMap()
+    ids = row_ids.extend(4)
+    tracked = ids[2]
+
+    row_ids.insert(0, 3)
+    assert row_ids.position(tracked) == 5
+    row_ids.delete(1, 2)
+    assert row_ids.position(tracked) == 3
+    assert row_ids.id_at(3) == tracked
+
+
+def test_deleted_id_is_not_resolved():
+    row_ids = RowIdMap()
+    ids = row_ids.extend(3)
+    assert row_ids.delete(1) == [ids[1]]
+    assert row_ids.position(ids[1]) is None
+    assert row_ids.position(0) is None
+    assert row_ids.position(10 ** 6) is None
+
+
+def test_id_at_out_of_range():
+    row_ids = RowIdMap()
+    row_ids.extend(2)
+    with pytest.raises(IndexError):
+        row_ids.id_at(2)
+    with pytest.raises(IndexError):
+        row_ids.id_at(-1)
+
+
+def test_resize_adds_and_removes_at_end():
+    row_ids = RowIdMap()
+    ids = row_ids.extend(3)
+    row_ids.resize(5)
+    assert list(row_ids.ids()[:3]) == ids
+    row_ids.resize(2)
+    check_against_model(row_ids, ids[:2])
+
+
+def test_encode_decode_round_trip():
+    row_ids = RowIdMap()
+    row_id = row_ids.extend(300)[-1]
+    assert row_ids.decode(row_ids.encode(row_id)) == row_id
+    # Кнопки прошлого запуска (другая эпоха) не разрешаются
+    restarted = RowIdMap()
+    restarted.epoch = 'ffff' if row_ids.epoch != 'ffff' else '0000'
+    assert restarted.decode(row_ids.encode(row_id)) is None
+    assert row_ids.decode('zz') is None
+
+
+def test_random_operations_match_list_model():
+    rng = random.Random(2026)
+    row_ids = RowIdMap()
+    model = []
+    for _ in range(500):
+        operation = rng.random()
+        if operation < 0.45 or not model:
+            position = rng.randint(0, len(model))
+            model[position:position] = row_ids.insert(position, rng.randint(1, 4))
+        elif operation < 0.85:
+            position = rng.randrange(len(model))
+            count = rng.randint(1, min(4, len(model) - position))
+            assert row_ids.delete(position, count) == model[position:position + count]
+            del model[position:position + count]
+        else:
+            length = rng.randint(0, len(model) + 5)
+            row_ids.resize(length)
+            if length > len(model):
+                model.extend(row_ids.ids()[len(model):])
+            else:
+                del model[length:]
+        check_against_model(row_ids, model)
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from snapshot import SheetSnapshot
+from sorting import SortedView
+
+HEADER = ['Название', 'Цена', 'Дата']
+NAMES = ['', 'яблоко', 'Груша', 'груша ', 'арбуз', 'Banana']
+PRICES = ['', '1', '1,0', '2.5', '10', '-3', '1 000']
+DATES = ['', '2026-01-05', '05.01.2026', '31.12.2025', '2026-02-01 10:00']
+
+
+def random_row(rng):
+    return [rng.choice(NAMES), rng.choice(PRICES), rng.choice(DATES)]
+
+
+def page_values(view, snapshot, descending=False):
+    return [snapshot.cell(index, view.col) for index in view.page(0, len(view), descending)]
+
+
+def test_numbers_sort_by_value_with_blanks_last():
+    snapshot = SheetSnapshot([HEADER, ['a', '10'], ['b', ''], ['c', '2,5'], ['', ''], ['d', '-3']])
+    view = SortedView.for_snapshot(snapshot, 1)
+    assert view.page(0, 10) == [4, 2, 0, 1]
+    # Пустые ячейки в конце и при обратном порядке; пустая строка листа не показывается
+    assert view.page(0, 10, descending=True) == [0, 2, 4, 1]
+    assert len(view) == 4
+
+
+def test_dates_sort_across_formats():
+    snapshot = SheetSnapshot([HEADER, ['', '', '05.02.2026'], ['', '', '2026-01-31'], ['', '', '31.12.2025']])
+    assert SortedView.for_snapshot(snapshot, 2).page(0, 3) == [2, 1, 0]
+
+
+def test_text_sorts_case_insensitive():
+    snapshot = SheetSnapshot([HEADER, ['яблоко'], ['Груша'], ['арбуз']])
+    view = SortedView.for_snapshot(snapshot, 0)
+    assert page_values(view, snapshot) == ['арбуз', 'Груша', 'яблоко']
+
+
+def test_column_beyond_width():
+    snapshot = SheetSnapshot([['A'], ['x'], [''], ['y']])
+    assert SortedView(snapshot, 3).page(0, 10) == [0, 2]
+
+
+@pytest.mark.parametrize('col', [0, 1, 2])
+def test_updated_matches_rebuild(col):
+    rng = random.Random(50 + col)
+    snapshot = SheetSnapshot([HEADER] + [random_row(rng) for _ in range(40)])
+    view = SortedView.for_snapshot(snapshot, col)
+    for _ in range(100):
+        changes = {rng.randrange(len(snapshot) + 2): random_row(rng) for _ in range(rng.randint(1, 3))}
+        # Запись за концом листа добавляет строки по порядку, как append
+        changes = {min(index, len(snapshot) + position): values
+                   for position, (index, values) in enumerate(sorted(changes.items()))}
+        patched = snapshot.with_rows(changes)
+        updated = view.updated(patched, changes)
+        rebuilt = SortedView(patched, col)
+
+        assert updated.kind == rebuilt.kind
+        assert list(updated.order) == list(rebuilt.order)
+        assert updated.blanks == rebuilt.blanks
+        # Старая версия снимка сохраняет свой порядок
+        assert list(view.order) == list(SortedView(snapshot, col).order)
+        snapshot, view = patched, updated
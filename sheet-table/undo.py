@@ -0,0 +1,108 @@
+import itertools
+import time
+from collections import deque
+
+
+class EditRecord:
+    """Одна измененная ячейка: стабильный идентификатор строки, столбец, старое и новое значения"""
+
+    __slots__ = ('row_id', 'column', 'old', 'new')
+
+    def __init__(self, row_id, column, old, new):
+        self.row_id = row_id
+        self.column = column
+        self.old = old
+        self.new = new
+
+
+class EditOperation:
+    """Изменение, сделанное пользователем за одно действие (поле, формула, массовое изменение)"""
+
+    __slots__ = ('seq', 'user_id', 'records', 'schema_version', 'created_at')
+
+    def __init__(self, seq, user_id, records, schema_version):
+        self.seq = seq
+        self.user_id = user_id
+        self.records = tuple(records)
+        self.schema_version = schema_version
+        self.created_at = time.time()
+
+    def cells(self):
+        return {(record.row_id, record.column) for record in self.records}
+
+
+class UndoHistory:
+    """Кольцевые буферы последних изменений: общий и по пользователю
+
+    Общий буфер хранит total последних операций всех пользователей и нужен,
+    чтобы не затереть отменой чужое более позднее изменение той же ячейки.
+    Буфер пользователя - его последние per_user операций для /undo. Строки
+    указываются стабильными идентификаторами, поэтому отмена находит ячейку
+    и после вставки или удаления строк выше.
+    """
+
+    _seq = itertools.count(1)
+
+    def __init__(self, per_user=20, total=200):
+        self.per_user = per_user
+        self._all = deque(maxlen=total)
+        self._by_user = {}
+
+    def record(self, user_id, records, schema_version):
+        """Запомнить операцию; записи без изменения значения не сохраняются"""
+        records = [record for record in records if record.old != record.new]
+        if not records:
+            return None
+        operation = EditOperation(next(self._seq), user_id, records, schema_version)
+        self._all.append(operation)
+        user_history = self._by_user.get(user_id)
+        if user_history is None:
+            user_history = self._by_user[user_id] = deque(maxlen=self.per_user)
+        user_history.append(operation)
+        return operation
+
+    def last(self, user_id, count=1):
+        """Последние count операций пользователя, от новой к старой"""
+        user_history = self._by_user.get(user_id, ())
+        return list(itertools.islice(reversed(user_history), count))
+
+    def touched_after(self, operation, excluded=()):
+        """Ячейки, измененные после operation другими операциями (кроме excluded)"""
+        excluded = {op.seq for op in excluded}
+        cells = set()
+        for later in reversed(self._all):
+            if later.seq <= operation.seq:
+                break
+            if later.seq not in excluded:
+                cells |= later.cells()
+        return cells
+
+    def remove(self, operations):
+        """Убрать отмененные операции из истории"""
+        seqs = {operation.seq for operation in operations}
+        for history in [self._all, *self._by_user.values()]:
+            kept = [operation for operation in history if operation.seq not in seqs]
+            if len(kept) != len(history):
+                history.clear()
+                history.extend(kept)
+
+    def plan_undo(self, operations):
+        """Что записать для отмены operations (от новой к старой)
+
+        Возвращает ({(идентификатор строки, столбец): старое значение}, число
+        пропущенных ячеек): ячейка пропускается, если после операции ее
+        изменила другая, не отменяемая операция. Если одна ячейка менялась
+        несколькими отменяемыми операциями, восстанавливается значение до самой
+        ранней из них.
+        """
+        restore = {}
+        skipped = 0
+        for operation in operations:
+            conflicts = self.touched_after(operation, excluded=operations)
+            for record in operation.records:
+                cell = (record.row_id, record.column)
+                if cell in conflicts:
+                    skipped += 1
+                    continue
+                restore[cell] = record.old
+        return restore, skipped
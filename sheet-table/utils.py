@@ -1,45 +1,56 @@
+from rendering import MessageBuilder, escape_markdown
+
+
 def format_row_data(row_data, columns):
-    """Форматировать данные строки для вывода"""
+    """Форматировать данные строки для вывода: список сообщений не длиннее лимита Telegram"""
     if not row_data or not columns:
-        return "❌ Нет данных для отображения"
+        return ["❌ Нет данных для отображения"]
     
-    formatted_lines = []
     data = row_data['data']
     row_number = row_data['row_number']
     
-    formatted_lines.append(f"📋 **Строка {row_number}:**\n")
+    builder = MessageBuilder()
+    builder.add(f"📋 **Строка {row_number}:**\n")
     
-    for i, (column_name, value) in enumerate(zip(columns, data)):
+    for column_name, value in zip(columns, data):
         if column_name:  # Только если есть название столбца
             display_value = escape_markdown(str(value)) if value else "—"
-            safe_column = escape_markdown(str(column_name))
-            formatted_lines.append(f"**{safe_column}:** {display_value}")
+            builder.add(f"**{escape_markdown(str(column_name))}:** {display_value}")
     
-    return "\n".join(formatted_lines)
+    return builder.build()
 
 
-def format_search_results(found_rows, search_value):
-    """Форматировать результаты поиска"""
+def format_search_results(found_rows, search_value, page=1, per_page=10, total_rows=None, total_known=True):
+    """Форматировать страницу результатов поиска
+    
+    found_rows - строки текущей страницы; без total_rows считается, что это все результаты.
+    Возвращает список сообщений не длиннее лимита Telegram.
+    """
+    if total_rows is None:
+        total_rows = len(found_rows)
+    
     if not found_rows:
-        return f"🔍 По запросу '**{search_value}**' ничего не найдено."
+        return [f"🔍 По запросу '**{search_value}**' ничего не найдено."]
+    
+    found_text = f"{total_rows}" if total_known else f"не менее {total_rows}"
+    page_text = f" (страница {page})" if total_rows > per_page else ""
     
-    result_lines = [f"🔍 Найдено {len(found_rows)} строк по запросу '**{search_value}**':\n"]
+    builder = MessageBuilder()
+    builder.add(f"🔍 Найдено {found_text} строк по запросу '**{search_value}**'{page_text}:\n")
     
-    for i, row_info in enumerate(found_rows[:10]):  # Показываем максимум 10 результатов
+    offset = (page - 1) * per_page
+    for i, row_info in enumerate(found_rows[:per_page], start=offset + 1):
         row_number = row_info['row_number']
         # Берем первые 3 значения для превью
         preview_data = ' | '.join([str(val) for val in row_info['data'][:3] if val])
         if len(preview_data) > 60:
             preview_data = preview_data[:57] + "..."
         
-        result_lines.append(f"{i+1}. **[{row_number}]** {preview_data}")
-    
-    if len(found_rows) > 10:
-        result_lines.append(f"\n... и еще {len(found_rows) - 10} строк")
+        builder.add(f"{i}. **[{row_number}]** {preview_data}")
     
-    result_lines.append("\n📌 Выберите строку для просмотра:")
+    builder.add("\n📌 Выберите строку для просмотра:")
     
-    return "\n".join(result_lines)
+    return builder.build()
 
 
 def format_columns_list(columns):
@@ -64,16 +75,3 @@ def truncate_text(text, max_length=100):
     if len(text) <= max_length:
         return text
     return text[:max_length-3] + "..."
-
-
-def escape_markdown(text):
-    """Экранировать специальные символы для Markdown"""
-    if not text:
-        return text
-    
-    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    
-    for char in special_chars:
-        text = text.replace(char, f'\\{char}')
-    
-    return text
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+# Результат записи: сразу в таблицу или в журнал до восстановления API
+WRITTEN = 'written'
+QUEUED = 'queued'
+
+# Сколько записей журнала отправлять одним запросом при воспроизведении
+REPLAY_BATCH = 500
+
+
+class JournalEntry:
+    """Отложенная запись: ячейка (kind='cell') или новая строка (kind='append')"""
+
+    __slots__ = ('id', 'kind', 'row_number', 'column_number', 'value')
+
+    def __init__(self, id, kind, row_number, column_number, payload):
+        self.id = id
+        self.kind = kind
+        self.row_number = row_number
+        self.column_number = column_number
+        self.value = json.loads(payload)
+
+
+class WriteJournal:
+    """Журнал записей, которые не удалось отправить в таблицу (SQLite в режиме WAL)
+
+    Запись ячейки хранится под ключом R<строка>C<столбец>: повторная запись
+    той же ячейки заменяет предыдущую и получает новый id, поэтому в журнале
+    только последнее значение каждой ячейки, а порядок id - порядок записей.
+    Новые строки получают уникальный ключ и воспроизводятся в порядке
+    добавления. Запись удаляется из журнала только после подтверждения API.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS pending_writes ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' kind TEXT NOT NULL,'
+            ' target TEXT NOT NULL UNIQUE,'
+            ' row_number INTEGER,'
+            ' column_number INTEGER,'
+            ' payload TEXT NOT NULL,'
+            ' queued_at REAL NOT NULL,'
+            ' failed TEXT)'
+        )
+
+    def add_cells(self, updates):
+        """Поставить в очередь ячейки (номер строки, номер столбца, значение) одной транзакцией"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO pending_writes'
+                    ' (kind, target, row_number, column_number, payload, queued_at)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)',
+                    [
+                        ('cell', f"R{row}C{col}", row, col, json.dumps(value, ensure_ascii=False), now)
+                        for row, col, value in updates
+                    ]
+                )
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def add_append(self, values):
+        """Поставить в очередь новую строку для добавления в конец таблицы"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO pending_writes (kind, target, payload, queued_at) VALUES (?, ?, ?, ?)',
+                ('append', f"append:{uuid.uuid4().hex}", json.dumps(list(values), ensure_ascii=False), time.time())
+            )
+
+    def pending(self, kind=None, limit=None):
+        """Ожидающие записи по порядку постановки в очередь"""
+        query = 'SELECT id, kind, row_number, column_number, payload FROM pending_writes WHERE failed IS NULL'
+        params = []
+        if kind is not None:
+            query += ' AND kind = ?'
+            params.append(kind)
+        query += ' ORDER BY id'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [JournalEntry(*row) for row in rows]
+
+    def has_pending(self):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT 1 FROM pending_writes WHERE failed IS NULL LIMIT 1'
+            ).fetchone() is not None
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM pending_writes WHERE failed IS NULL'
+            ).fetchone()[0]
+
+    def remove(self, ids):
+        """Удалить подтвержденные записи (замененные после чтения имеют новый id и остаются)"""
+        with self._lock:
+            self._conn.executemany('DELETE FROM pending_writes WHERE id = ?', [(i,) for i in ids])
+
+    def mark_failed(self, ids, reason):
+        """Исключить записи, отклоненные API окончательно (остаются в файле для разбора)"""
+        with self._lock:
+            self._conn.executemany(
+                'UPDATE pending_writes SET failed = ? WHERE id = ?',
+                [(str(reason), i) for i in ids]
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JournalReplayer:
+    """Фоновая задача, отправляющая журнал в таблицу, когда API снова доступен
+
+    Пока журнал не пуст, каждые interval секунд делается попытка отправить
+    очередную порцию (в пределах общей квоты записи); после неудачи пауза
+    удваивается до max_delay.
+    """
+
+    def __init__(self, sheets_service, interval=15.0, max_delay=300.0):
+        self.sheets_service = sheets_service
+        self.interval = interval
+        self.max_delay = max_delay
+        self._task = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        journal = self.sheets_service.journal
+        delay = self.interval
+        while True:
+            if not journal.has_pending():
+                await asyncio.sleep(self.interval)
+                continue
+
+            await self.sheets_service.write_pacer.acquire()
+            try:
+                sent = await asyncio.to_thread(self.sheets_service.replay_journal)
+            except Exception as e:
+                delay = min(self.max_delay, delay * 2)
+                self.logger.warning(f"Журнал записей: таблица недоступна ({e}), повтор через {delay:.0f} с")
+                await asyncio.sleep(delay)
+                continue
+
+            delay = self.interval
+            if sent < REPLAY_BATCH:
+                await asyncio.sleep(self.interval)